@@ -0,0 +1,89 @@
+"""
+Сравнение булевого поиска по индексу со множествами имен файлов и по индексу на битовых картах.
+
+Запуск: python -m benchmarks.bitmap [количество документов ...]
+"""
+import random
+import sys
+import time
+
+from task3.bitmap_index import BitmapIndex
+from task3.query import And, Or, Term, create_engine
+
+
+def generate_index(docs_count: int, terms_count: int = 1_000, seed: int = 0) -> dict[str, dict[str, set | int]]:
+    """
+    Сгенерировать индекс, в котором документная частота термина убывает по закону Ципфа
+
+    :param docs_count: количество документов
+    :param terms_count: количество терминов
+    :param seed: зерно генератора случайных чисел
+    :return: индекс термин -> {"documents", "count"}
+    """
+    rnd = random.Random(seed)
+    docs = [f"{i}.txt" for i in range(docs_count)]
+    index = {}
+    for rank in range(1, terms_count + 1):
+        documents = set(rnd.sample(docs, max(1, int(docs_count * 0.3 / rank))))
+        index[f"термин{rank}"] = {"documents": documents, "count": len(documents)}
+
+    return index
+
+
+def generate_queries(terms_count: int, queries_count: int = 200, seed: int = 1) -> list[Or]:
+    rnd = random.Random(seed)
+    queries = []
+    for _ in range(queries_count):
+        groups = []
+        for _ in range(rnd.randint(1, 2)):
+            terms = [Term(f"термин{rnd.randint(1, terms_count // 10)}") for _ in range(rnd.randint(1, 3))]
+            groups.append(And(tuple(terms[:-1] or terms), tuple(terms[-1:] if len(terms) > 1 else ())))
+        queries.append(Or(tuple(groups)))
+
+    return queries
+
+
+def evaluate_sets(query: Or, index: dict[str, dict[str, set | int]], all_docs: set[str]) -> set[str]:
+    """
+    Выполнить запрос операциями над множествами строк, как исходная реализация поиска
+    """
+    result = set()
+    for group in query.groups:
+        documents = set(all_docs)
+        for term in group.positive:
+            documents &= index[term.lemme]["documents"] if term.lemme in index else set()
+        for term in group.negative:
+            documents -= index[term.lemme]["documents"] if term.lemme in index else set()
+        result |= documents
+
+    return result
+
+
+def measure(function, queries: list[Or]) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        function(query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    print(f"{'документов':>12} {'множества, мс':>14} {'списки, мс':>11} {'битовые карты, мс':>18} {'построение карт, с':>19}")
+    for docs_count in sizes:
+        index = generate_index(docs_count)
+        queries = generate_queries(len(index))
+        all_docs = {doc for value in index.values() for doc in value["documents"]}
+
+        start = time.perf_counter()
+        bitmap_index = BitmapIndex.from_index(index)
+        build_time = time.perf_counter() - start
+
+        list_engine = create_engine(index)
+        bitmap_engine = create_engine(bitmap_index)
+        for query in queries[:10]:
+            assert bitmap_engine.documents(bitmap_engine.evaluate(query)) == evaluate_sets(query, index, all_docs)
+
+        sets_time = measure(lambda query: evaluate_sets(query, index, all_docs), queries)
+        lists_time = measure(lambda query: list_engine.documents(list_engine.evaluate(query)), queries)
+        bitmap_time = measure(lambda query: bitmap_engine.documents(bitmap_engine.evaluate(query)), queries)
+        print(f"{docs_count:>12} {sets_time:>14.3f} {lists_time:>11.3f} {bitmap_time:>18.3f} {build_time:>19.2f}")
@@ -0,0 +1,119 @@
+"""
+Детерминированный генератор синтетического корпуса на русском языке.
+
+Слова собираются из слогов и окончаний существительных, прилагательных и глаголов, поэтому pymorphy2
+разбирает их как словоформы, а частоты основ убывают по закону Ципфа. Корпус записывается в том же виде,
+что и у task1: архив `posts.zip` с файлами `<id>.txt` и `index.txt` с URL постов.
+
+Запуск: python -m benchmarks.corpus <количество документов> <директория> [зерно]
+"""
+import bisect
+import itertools
+import json
+import os
+import random
+import sys
+import zipfile
+
+CONSONANTS = "бвгдзклмнпрстфхчшж"
+VOWELS = "аеиоуяю"
+ENDINGS = (
+    ("", "а", "ы", "у", "ой", "ом", "е", "ами", "ах", "ов"),
+    ("ый", "ая", "ое", "ые", "ого", "ой", "ую", "ыми"),
+    ("ать", "ает", "ают", "ал", "ала", "али", "ет", "ут"),
+)
+STOP_WORDS = ("и", "в", "на", "не", "что", "с", "по", "к", "а", "но", "за", "из", "о", "же")
+PUNCTUATION = (".", ",", "!", "?", ";")
+
+CORPUS_FILE = "corpus.json"
+
+
+class CorpusGenerator:
+    def __init__(self, vocabulary_size: int = 20_000, seed: int = 0):
+        """
+        :param vocabulary_size: количество основ
+        :param seed: зерно генератора случайных чисел
+        """
+        self.seed = seed
+        rnd = random.Random(seed)
+        stems = set()
+        while len(stems) < vocabulary_size:
+            syllables = "".join(rnd.choice(CONSONANTS) + rnd.choice(VOWELS) for _ in range(rnd.randint(1, 3)))
+            stems.add(syllables + rnd.choice(CONSONANTS))
+        self.stems = sorted(stems)
+        rnd.shuffle(self.stems)
+        self.parts = [rnd.randrange(len(ENDINGS)) for _ in self.stems]
+        # накопленные веса 1 / rank для выбора основ бинарным поиском
+        self.cumulative = list(itertools.accumulate(1 / rank for rank in range(1, vocabulary_size + 1)))
+
+    def word(self, rnd: random.Random, stop_words: bool = True) -> str:
+        if stop_words and rnd.random() < 0.2:
+            return rnd.choice(STOP_WORDS)
+        stem = bisect.bisect(self.cumulative, rnd.random() * self.cumulative[-1])
+        return self.stems[stem] + rnd.choice(ENDINGS[self.parts[stem]])
+
+    def text(self, rnd: random.Random, length: int) -> str:
+        sentences = []
+        while length > 0:
+            words = [self.word(rnd) for _ in range(min(length, rnd.randint(5, 15)))]
+            length -= len(words)
+            words[0] = words[0].capitalize()
+            if rnd.random() < 0.1:
+                words.insert(rnd.randrange(len(words)), str(rnd.randint(1, 2023)))
+            sentences.append(" ".join(words) + rnd.choice(PUNCTUATION))
+        return " ".join(sentences)
+
+    def query(self, rnd: random.Random, words: int) -> str:
+        return " ".join(self.word(rnd, stop_words=False) for _ in range(words))
+
+    def documents(self, docs_count: int, min_length: int = 50, max_length: int = 300):
+        """
+        Сгенерировать документы
+
+        :param docs_count: количество документов
+        :param min_length: минимальное количество слов в документе
+        :param max_length: максимальное количество слов в документе
+        :return: итератор пар идентификатор поста, текст
+        """
+        rnd = random.Random(self.seed + 1)
+        for post_id in range(1, docs_count + 1):
+            yield post_id, self.text(rnd, rnd.randint(min_length, max_length))
+
+
+def generate_corpus(docs_count: int, dir_path: str, seed: int = 0, vocabulary_size: int = 20_000) -> str:
+    """
+    Записать корпус в директорию, если там еще нет корпуса с такими же параметрами
+
+    :param docs_count: количество документов
+    :param dir_path: директория для `posts.zip` и `index.txt`
+    :param seed: зерно генератора случайных чисел
+    :param vocabulary_size: количество основ
+    :return: путь до корпуса без расширения, как POSTS_DIR_PATH
+    """
+    params = {"docs": docs_count, "seed": seed, "vocabulary_size": vocabulary_size}
+    posts_path = os.path.join(dir_path, "posts")
+    corpus_path = os.path.join(dir_path, CORPUS_FILE)
+    if os.path.isfile(corpus_path) and os.path.isfile(f"{posts_path}.zip"):
+        with open(corpus_path, "r", encoding="utf8") as f:
+            if json.load(f) == params:
+                return posts_path
+
+    os.makedirs(dir_path, exist_ok=True)
+    # параметры записываются последними, чтобы недописанный корпус не считался готовым
+    if os.path.isfile(corpus_path):
+        os.remove(corpus_path)
+    generator = CorpusGenerator(vocabulary_size, seed)
+    with zipfile.ZipFile(f"{posts_path}.zip", "w", zipfile.ZIP_DEFLATED) as archive, \
+            open(os.path.join(dir_path, "index.txt"), "w", encoding="utf8") as index:
+        for post_id, text in generator.documents(docs_count):
+            archive.writestr(f"{post_id}.txt", text)
+            index.write(f"{post_id}.txt\thttps://vk.com/wall-1_{post_id}\n")
+    with open(corpus_path, "w", encoding="utf8") as f:
+        json.dump(params, f)
+
+    return posts_path
+
+
+if __name__ == "__main__":
+    path = generate_corpus(int(sys.argv[1]), sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+    print(f"Корпус записан в {path}.zip")
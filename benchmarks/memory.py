@@ -0,0 +1,108 @@
+"""
+Память индексов в текущем и компактном представлении.
+
+Для индекса task3 сравнивается `task3.search.load_index` (словарь и множество имен файлов на термин)
+с `CompactIndex`, для векторов task5 - `generate_vectors` (`defaultdict` на документ) с `CompactVectors`.
+Память - прирост выделенной памяти по tracemalloc, пока структура жива, в пересчете на одну запись
+(документ термина или вес вектора).
+
+Запуск по собранным артефактам: python -m benchmarks.memory
+На синтетическом корпусе: python -m benchmarks.memory [количество документов ...]
+"""
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+from collections import defaultdict
+from typing import Callable
+
+from benchmarks.bitmap import generate_index
+from common.vocabulary import init_vocabulary, load_lemmes
+from task3.compact_index import CompactIndex
+from task3.search import load_index
+from task3.task3 import write_index
+from task4.store import tf_idfs_location
+from task5.compact_vectors import CompactVectors, load_compact_vectors
+from task5.task5 import generate_vectors
+
+
+def retained_bytes(build: Callable[[], object]) -> tuple[object, int]:
+    """
+    Построить структуру и измерить занятую ей память
+
+    :param build: функция построения
+    :return: структура и количество байт, выделенных при построении и не освобожденных после него
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        gc.collect()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def report_row(name: str, layout: str, postings: int, size: int):
+    print(f"{name:>16} {layout:>12} {postings:>12} {size / 2 ** 20:>10.2f} {size / max(postings, 1):>14.1f}")
+
+
+def report_index(name: str, index_path: str):
+    index, index_size = retained_bytes(lambda: load_index(index_path))
+    postings = sum(value["count"] for value in index.values())
+    del index
+    compact, compact_size = retained_bytes(lambda: CompactIndex.from_json(index_path))
+    assert len(compact.postings) == postings
+    report_row(name, "dict/set", postings, index_size)
+    report_row(name, "compact", postings, compact_size)
+
+
+def report_vectors(name: str, build_vectors: Callable[[], dict], build_compact: Callable[[], CompactVectors]):
+    vectors, vectors_size = retained_bytes(build_vectors)
+    postings = sum(len(vector) for vector in vectors.values())
+    del vectors
+    compact, compact_size = retained_bytes(build_compact)
+    assert len(compact.weights) == postings
+    report_row(name, "defaultdict", postings, vectors_size)
+    report_row(name, "compact", postings, compact_size)
+
+
+def synthetic_vectors(index: dict[str, dict[str, set | int]]) -> dict[str, dict[int, float]]:
+    """
+    Построить векторы документов по синтетическому индексу, вес термина - обратная документная частота
+    """
+    vectors = {}
+    for term_id, value in enumerate(index.values()):
+        for doc in value["documents"]:
+            vectors.setdefault(doc, defaultdict(float))[term_id] = 1 / value["count"]
+
+    return vectors
+
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in sys.argv[1:]]
+    print(f"{'структура':>16} {'хранение':>12} {'записей':>12} {'МБ':>10} {'байт/запись':>14}")
+    if not sizes:
+        assert os.getenv("INDEX_PATH"), "Укажите путь до JSON индекса в переменную окружения INDEX_PATH"
+        assert os.getenv("LEMMES_PATH"), "Укажите путь до файла лемм в переменную окружения LEMMES_PATH"
+        report_index("index", os.getenv("INDEX_PATH"))
+        vocabulary = init_vocabulary(load_lemmes(os.getenv("LEMMES_PATH")))
+        report_vectors(
+            "vectors",
+            lambda: generate_vectors(tf_idfs_location(), vocabulary),
+            lambda: load_compact_vectors(tf_idfs_location(), vocabulary),
+        )
+
+    for docs_count in sizes:
+        index = generate_index(docs_count)
+        with tempfile.TemporaryDirectory() as directory:
+            index_path = os.path.join(directory, "index.txt")
+            write_index(index_path, index)
+            report_index(f"index {docs_count}", index_path)
+        report_vectors(
+            f"vectors {docs_count}",
+            lambda: synthetic_vectors(index),
+            lambda: CompactVectors.from_vectors(synthetic_vectors(index)),
+        )
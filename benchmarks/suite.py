@@ -0,0 +1,250 @@
+"""
+Воспроизводимый замер всего конвейера на синтетическом корпусе.
+
+Для каждого размера корпуса генерируется (или переиспользуется) корпус `benchmarks.corpus`, затем замеряются
+токенизация task2, построение инвертированного индекса task3, построение TF-IDF task4, сборка снимка,
+булев поиск `task3.search.search` и ранжированный поиск `task5.server.search`. Для каждого этапа записывается
+время, для поиска - задержки p50/p99, для всех этапов - пиковый RSS процесса и его дочерних процессов.
+Ранжирование BM25 по квантованным вкладам сравнивается с косинусным по размеру индекса и задержкам.
+Кэши лемматизатора на диске и кэши результатов отключаются, чтобы замеры не зависели от предыдущих запусков.
+
+Запуск: python -m benchmarks.suite [--docs 1000 10000 ...] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Callable
+
+from benchmarks.corpus import CorpusGenerator, generate_corpus
+
+
+def peak_rss() -> dict[str, float]:
+    """
+    Пиковый RSS текущего процесса и завершившихся дочерних процессов в мегабайтах
+    """
+    return {
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "children_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def timed(function: Callable[[], object]) -> dict[str, float]:
+    start = time.perf_counter()
+    function()
+    return {"wall_time": time.perf_counter() - start, **peak_rss()}
+
+
+def summarize(times: list[float], wall_time: float) -> dict[str, float]:
+    """
+    :param times: задержки запросов в миллисекундах
+    :param wall_time: общее время в секундах
+    :return: общее время, p50, p99 и среднее в миллисекундах, пиковый RSS
+    """
+    return {
+        "wall_time": wall_time,
+        "queries": len(times),
+        "p50_ms": percentile(times, 0.5),
+        "p99_ms": percentile(times, 0.99),
+        "mean_ms": sum(times) / len(times),
+        **peak_rss(),
+    }
+
+
+def latencies(function: Callable[[str], object], queries: list[str]) -> dict[str, float]:
+    """
+    Выполнить запросы по одному и посчитать задержки
+
+    :param function: функция, выполняющая запрос
+    :param queries: запросы
+    :return: сводка задержек
+    """
+    times = []
+    start = time.perf_counter()
+    for query in queries:
+        query_start = time.perf_counter()
+        function(query)
+        times.append((time.perf_counter() - query_start) * 1000)
+    return summarize(times, time.perf_counter() - start)
+
+
+def generate_queries(generator: CorpusGenerator, queries_count: int, seed: int = 2) -> tuple[list[str], list[str]]:
+    """
+    Сгенерировать запросы ранжированного и булевого поиска с тем же распределением слов, что и корпус
+
+    :return: запросы ранжированного поиска и булевы запросы
+    """
+    rnd = random.Random(seed)
+    queries = [generator.query(rnd, rnd.randint(1, 3)) for _ in range(queries_count)]
+    boolean_queries = []
+    for query in queries:
+        words = query.split()
+        if len(words) > 1 and rnd.random() < 0.3:
+            words[-1] = f"-{words[-1]}"
+        if rnd.random() < 0.3:
+            words.append(f"| {generator.query(rnd, 1)}")
+        boolean_queries.append(" ".join(words))
+    return queries, boolean_queries
+
+
+def run(docs_count: int, corpus_dir: str, queries_count: int = 500, seed: int = 0) -> dict:
+    """
+    Замерить конвейер на корпусе заданного размера
+
+    :param docs_count: количество документов
+    :param corpus_dir: директория для корпусов, корпус каждого размера лежит в своей поддиректории
+    :param queries_count: количество запросов
+    :param seed: зерно генератора корпуса
+    :return: результаты замеров по этапам
+    """
+    # кэши на диске и кэши результатов не используются, переменные читаются при импорте модулей
+    os.environ.pop("LEMMA_CACHE_PATH", None)
+    os.environ.pop("SEGMENTS_PATH", None)
+    os.environ["QUERY_CACHE_SIZE"] = "0"
+    os.environ["SEARCH_BATCH_WINDOW_MS"] = "0"
+
+    from common.documents import open_documents
+    from common.lemmatizer import Lemmatizer, preprocess_text
+    from common.parallel import ShardPool, get_workers_count
+    from task2.task2 import init_morph, tokenize
+    from task3.task3 import get_inverted_index, load_urls
+    from task4.task4 import build_tf_idf
+    from task5.bm25 import build_bm25
+    from task5.snapshot import read_tf_idfs, write_snapshot
+
+    results = {}
+    dir_path = os.path.join(corpus_dir, str(docs_count))
+    start = time.perf_counter()
+    posts_path = generate_corpus(docs_count, dir_path, seed)
+    results["corpus"] = {"wall_time": time.perf_counter() - start, **peak_rss()}
+
+    morph = init_morph()
+    documents = open_documents(posts_path)
+    workers = get_workers_count()
+
+    def tokenize_corpus():
+        lemmatizer = Lemmatizer(morph)
+        tokens_dict = defaultdict(set)
+        for _, text in documents:
+            tokenize(preprocess_text(text), lemmatizer, tokens_dict)
+
+    results["task2_tokenize"] = timed(tokenize_corpus)
+
+    index = {}
+    results["task3_inverted_index"] = timed(
+        lambda: index.update(get_inverted_index(documents, Lemmatizer(morph), workers=workers))
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_path:
+        tf_idfs_path = os.path.join(tmp_path, "tf_idf")
+        os.mkdir(tf_idfs_path)
+
+        def build():
+            with ShardPool(Lemmatizer(morph), workers) as pool:
+                build_tf_idf(documents, tf_idfs_path, pool)
+
+        results["task4_tf_idf"] = timed(build)
+
+        snapshot_path = os.environ["SNAPSHOT_PATH"] = os.path.join(tmp_path, "snapshot.bin")
+        urls = load_urls(os.path.join(dir_path, "index.txt"))
+        results["snapshot"] = timed(lambda: write_snapshot(snapshot_path, *read_tf_idfs(tf_idfs_path), urls))
+        results["snapshot"]["size_bytes"] = os.path.getsize(snapshot_path)
+
+        bm25_path = os.environ["BM25_PATH"] = os.path.join(tmp_path, "bm25.bin")
+        results["bm25"] = timed(lambda: build_bm25(tf_idfs_path, bm25_path, bits=int(os.getenv("BM25_BITS") or 8)))
+        results["bm25"]["size_bytes"] = os.path.getsize(bm25_path)
+
+        queries, boolean_queries = generate_queries(CorpusGenerator(seed=seed), queries_count)
+
+        from task3 import search as boolean_search
+        results["task3_search"] = latencies(lambda query: boolean_search.search(query, index), boolean_queries)
+
+        from task5 import server
+
+        async def serve():
+            times = []
+            start = time.perf_counter()
+            for query in queries:
+                query_start = time.perf_counter()
+                await server.search(query=query, limit=10, offset=0, model="cosine")
+                times.append((time.perf_counter() - query_start) * 1000)
+            results["server_search"] = summarize(times, time.perf_counter() - start)
+
+            times = []
+            start = time.perf_counter()
+            for query in queries:
+                query_start = time.perf_counter()
+                await server.search(query=query, limit=10, offset=0, model="bm25")
+                times.append((time.perf_counter() - query_start) * 1000)
+            results["server_search_bm25"] = summarize(times, time.perf_counter() - start)
+
+            # одновременные запросы ранжируются пачками
+            start = time.perf_counter()
+            await asyncio.gather(*(server.search(query=query, limit=10, offset=0, model="cosine") for query in queries))
+            elapsed = time.perf_counter() - start
+            results["server_search_concurrent"] = {
+                "wall_time": elapsed, "queries": len(queries), "qps": len(queries) / elapsed, **peak_rss()
+            }
+            await server.batcher.stop()
+
+        asyncio.run(serve())
+
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замер конвейера на синтетическом корпусе")
+    parser.add_argument(
+        "--docs", type=int, nargs="+", default=[1_000], help="размеры корпуса, например 1000 10000 100000 1000000"
+    )
+    parser.add_argument("--queries", type=int, default=500, help="количество запросов")
+    parser.add_argument("--seed", type=int, default=0, help="зерно генератора корпуса")
+    parser.add_argument(
+        "--corpus-dir", default=os.path.join(tempfile.gettempdir(), "infosearch_bench"), help="директория для корпусов"
+    )
+    parser.add_argument("--output", help="путь до JSON файла с результатами, по умолчанию - стандартный вывод")
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "workers": int(os.getenv("BUILD_WORKERS") or 1),
+        "seed": args.seed,
+        # замеры каждого размера - в отдельном процессе, чтобы пиковый RSS не переходил между размерами
+        "results": {},
+    }
+    for docs_count in args.docs:
+        output = subprocess.run(
+            [sys.executable, "-c", f"import json; from benchmarks.suite import run; "
+                                   f"print(json.dumps(run({docs_count}, {args.corpus_dir!r}, {args.queries}, {args.seed})))"],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        report["results"][str(docs_count)] = json.loads(output.strip().splitlines()[-1])
+        print(f"{docs_count}: готово", file=sys.stderr)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
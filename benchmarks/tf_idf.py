@@ -0,0 +1,43 @@
+"""
+Замер времени построения TF-IDF в зависимости от размера корпуса.
+
+Запуск: python -m benchmarks.tf_idf
+"""
+import random
+import time
+
+from common.stats import CorpusStats
+from task4.task4 import get_tf_idf
+
+ALPHABET = "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+
+
+def generate_texts(docs_count: int, vocabulary_size: int = 20_000, doc_length: int = 300, seed: int = 0) -> dict[str, str]:
+    """
+    Сгенерировать корпус случайных текстов с распределением слов, близким к закону Ципфа
+
+    :param docs_count: количество документов
+    :param vocabulary_size: размер словаря
+    :param doc_length: количество слов в документе
+    :param seed: зерно генератора случайных чисел
+    :return: словарь документ -> текст
+    """
+    rnd = random.Random(seed)
+    words = ["".join(rnd.choices(ALPHABET, k=rnd.randint(3, 10))) for _ in range(vocabulary_size)]
+    weights = [1 / rank for rank in range(1, vocabulary_size + 1)]
+    return {f"{i}.txt": " ".join(rnd.choices(words, weights, k=doc_length)) for i in range(docs_count)}
+
+
+def build_tf_idf(texts: dict[str, str]) -> float:
+    start = time.perf_counter()
+    stats = CorpusStats.from_texts(texts)
+    for text in texts.values():
+        get_tf_idf(text, stats)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    print(f"{'документов':>12} {'время, с':>10} {'мкс/документ':>14}")
+    for docs_count in (1_000, 2_000, 4_000, 8_000, 16_000):
+        elapsed = build_tf_idf(generate_texts(docs_count))
+        print(f"{docs_count:>12} {elapsed:>10.3f} {elapsed / docs_count * 1e6:>14.1f}")
@@ -0,0 +1,127 @@
+"""
+Кэш результатов запросов.
+
+Записи вытесняются по LRU, по истечении времени жизни и при превышении ограничения памяти.
+Кэш привязан к версии индекса: при смене версии все записи сбрасываются.
+"""
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+
+def estimate_size(value: object) -> int:
+    """
+    Оценить занимаемую объектом память вместе с вложенными контейнерами
+
+    :param value: объект
+    :return: размер в байтах
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item) for item in value)
+    return size
+
+
+class QueryCache:
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None, max_bytes: int | None = None):
+        """
+        :param maxsize: максимальное количество записей
+        :param ttl: время жизни записи в секундах, None - без ограничения
+        :param max_bytes: ограничение оценки занимаемой памяти, None - без ограничения
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[Hashable, tuple[float, int, object]] = OrderedDict()
+        self.size = 0
+        self.version: Hashable = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def set_version(self, version: Hashable):
+        """
+        Указать текущую версию индекса, при смене версии кэш очищается
+        """
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
+
+    def get(self, key: Hashable, default=None):
+        entry = self.entries.get(key)
+        if entry is not None and self.ttl is not None and entry[0] < time.monotonic():
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return default
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, key: Hashable, value: object):
+        if key in self.entries:
+            self._remove(key)
+        size = estimate_size(key) + estimate_size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else 0.0
+        self.entries[key] = (expires, size, value)
+        self.size += size
+        while len(self.entries) > self.maxsize or self.max_bytes is not None and self.size > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def counters(self) -> dict[str, int | float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hit_rate": self.hit_rate,
+        }
+
+    def stats(self) -> str:
+        return (
+            f"Кэш запросов: {len(self.entries)} записей, {self.size} байт, "
+            f"попаданий {self.hits}, промахов {self.misses} ({self.hit_rate:.1%}), вытеснено {self.evictions}"
+        )
+
+
+def init_query_cache() -> QueryCache:
+    """
+    Создать кэш результатов с параметрами из переменных окружения
+    QUERY_CACHE_SIZE, QUERY_CACHE_TTL и QUERY_CACHE_MAX_BYTES
+
+    :return: объект `QueryCache`
+    """
+    ttl = os.getenv("QUERY_CACHE_TTL")
+    max_bytes = os.getenv("QUERY_CACHE_MAX_BYTES")
+    return QueryCache(
+        maxsize=int(os.getenv("QUERY_CACHE_SIZE") or 1024),
+        ttl=float(ttl) if ttl else 300,
+        max_bytes=int(max_bytes) if max_bytes else 64 * 1024 * 1024,
+    )
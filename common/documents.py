@@ -0,0 +1,99 @@
+"""
+Источники документов корпуса.
+
+Документы читаются по одному прямо из архива или из директории, без распаковки на диск.
+Источник хранит только путь, поэтому его можно передавать в процессы пула.
+"""
+import os
+import time
+import zipfile
+from abc import ABC, abstractmethod
+from typing import Iterator
+
+from common.metrics import metrics
+
+
+class DocumentSource(ABC):
+    """
+    Базовый источник документов: итерация по парам (имя файла, текст) в порядке имен
+    """
+
+    @abstractmethod
+    def names(self) -> list[str]:
+        """
+        Получить имена документов в порядке имен
+        """
+
+    @abstractmethod
+    def read(self, name: str) -> str:
+        """
+        Прочитать текст документа по имени
+        """
+
+    def iter_documents(self, names: list[str] | None = None) -> Iterator[tuple[str, str]]:
+        """
+        Лениво прочитать документы
+
+        :param names: имена документов, по умолчанию - все
+        :return: итератор пар имя файла, текст
+        """
+        # время чтения суммируется по всем документам и записывается одним наблюдением этапа
+        elapsed = 0.0
+        try:
+            for name in self.names() if names is None else names:
+                start = time.perf_counter()
+                text = self.read(name)
+                elapsed += time.perf_counter() - start
+                yield name, text
+        finally:
+            metrics.observe("stage_seconds", elapsed, stage="read")
+
+    def __iter__(self) -> Iterator[tuple[str, str]]:
+        return self.iter_documents()
+
+
+class ZipDocuments(DocumentSource):
+    def __init__(self, zip_path: str):
+        self.zip_path = zip_path
+        self._zip: zipfile.ZipFile | None = None
+
+    @property
+    def zip(self) -> zipfile.ZipFile:
+        # архив открывается лениво, чтобы после передачи в другой процесс у него был свой дескриптор
+        if self._zip is None:
+            self._zip = zipfile.ZipFile(self.zip_path, "r")
+        return self._zip
+
+    def names(self) -> list[str]:
+        return sorted(name for name in self.zip.namelist() if name.endswith(".txt"))
+
+    def read(self, name: str) -> str:
+        return self.zip.read(name).decode("utf8")
+
+    def __getstate__(self) -> dict:
+        return {"zip_path": self.zip_path, "_zip": None}
+
+
+class DirectoryDocuments(DocumentSource):
+    def __init__(self, dir_path: str):
+        self.dir_path = dir_path
+
+    def names(self) -> list[str]:
+        return sorted(name for name in os.listdir(self.dir_path) if name.endswith(".txt"))
+
+    def read(self, name: str) -> str:
+        with open(os.path.join(self.dir_path, name), "r", encoding="utf8") as f:
+            return f.read()
+
+
+def open_documents(dir_path: str) -> DocumentSource:
+    """
+    Открыть корпус: архив `<dir_path>.zip`, если он есть, иначе директорию
+
+    :param dir_path: путь до директории или архива без расширения
+    :return: источник документов
+    """
+    if os.path.isfile(f"{dir_path}.zip"):
+        return ZipDocuments(f"{dir_path}.zip")
+    assert os.path.isdir(dir_path), f"Не найден ни архив {dir_path}.zip, ни директория {dir_path}"
+    return DirectoryDocuments(dir_path)
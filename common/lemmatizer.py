@@ -0,0 +1,150 @@
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from pymorphy2 import MorphAnalyzer
+from pymorphy2.analyzer import Parse
+
+BAD_GRAMMEMES = (
+    "PREP",  # предлог
+    "CONJ",  # союз
+    "NUMB",  # число
+    "NUMR",  # числительное
+    "LATN",  # не кириллица
+    "PNCT",  # пунктуация
+    "ROMN",  # римское число
+    "UNKN",  # неизвестное слово
+)
+
+
+CYRILLIC_PATTERN = re.compile(r"[^А-Яа-я ]")
+
+
+def preprocess_text(text: str) -> str:
+    """
+    Очистить текст от некириллических символов
+
+    :param text: текст для очистки.
+    :return: очищенный текст.
+    """
+    return re.sub(CYRILLIC_PATTERN, " ", text)
+
+
+class Lemma(NamedTuple):
+    word: str  # словоформа в том виде, в котором ее вернул анализатор (с восстановленной ё)
+    normal_form: str
+    keep: bool  # False для служебных частей речи и неизвестных слов
+
+
+class Lemmatizer:
+    """
+    Общий слой лемматизации с кэшем словоформа -> (лемма, оставлять ли слово).
+
+    В памяти хранится ограниченный LRU-кэш, на диске - файл, переживающий перезапуски
+    и общий для скриптов сборки и сервера.
+    """
+
+    def __init__(self, morph: MorphAnalyzer | None = None, cache_path: str | None = None, maxsize: int = 200_000):
+        """
+        :param morph: объект анализатора, по умолчанию создается новый
+        :param cache_path: путь до файла кэша на диске, `None` - не сохранять кэш
+        :param maxsize: максимальное количество словоформ в памяти
+        """
+        self.morph = morph or MorphAnalyzer()
+        self.cache_path = cache_path
+        self.maxsize = maxsize
+        self.cache: OrderedDict[str, Lemma] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.morph_seconds = 0.0
+        if cache_path and os.path.isfile(cache_path):
+            self.load(cache_path)
+
+    def parse(self, word: str) -> Lemma:
+        """
+        Получить лемму словоформы
+
+        :param word: словоформа
+        :return: объект `Lemma` с леммой и признаком того, что слово не относится к служебным частям речи
+        """
+        word = word.lower()
+        if (cached := self.cache.get(word)) is not None:
+            self.hits += 1
+            self.cache.move_to_end(word)
+            return cached
+
+        self.misses += 1
+        start = time.perf_counter()
+        token: Parse = self.morph.parse(word)[0]
+        self.morph_seconds += time.perf_counter() - start
+        result = Lemma(
+            token.word, token.normal_form, not any(bad_grammeme in token.tag for bad_grammeme in BAD_GRAMMEMES)
+        )
+        self._put(word, result)
+        return result
+
+    def lemmatize(self, text: str) -> list[str]:
+        """
+        Вернуть леммы значимых слов текста в порядке следования
+
+        :param text: текст
+        :return: список лемм
+        """
+        lemmes = []
+        for word in text.split():
+            lemma = self.parse(word)
+            if lemma.keep:
+                lemmes.append(lemma.normal_form)
+
+        return lemmes
+
+    def _put(self, word: str, result: Lemma):
+        self.cache[word] = result
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> str:
+        return f"Кэш лемм: {len(self.cache)} словоформ, попаданий {self.hits}, промахов {self.misses} ({self.hit_rate:.1%})"
+
+    def load(self, cache_path: str):
+        """
+        Загрузить кэш с диска
+
+        :param cache_path: путь до файла кэша
+        """
+        with open(cache_path, "r", encoding="utf8") as f:
+            for line in f:
+                key, word, lemme, keep = line.rstrip("\n").split("\t")
+                self._put(key, Lemma(word, lemme, keep == "1"))
+
+    def save(self, cache_path: str | None = None):
+        """
+        Сохранить кэш на диск. Файл перезаписывается атомарно.
+
+        :param cache_path: путь до файла кэша, по умолчанию - путь, переданный при создании
+        """
+        cache_path = cache_path or self.cache_path
+        if not cache_path:
+            return
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            f.writelines(
+                f"{key}\t{lemma.word}\t{lemma.normal_form}\t{int(lemma.keep)}\n" for key, lemma in self.cache.items()
+            )
+        os.replace(tmp_path, cache_path)
+
+
+def init_lemmatizer(morph: MorphAnalyzer | None = None) -> Lemmatizer:
+    """
+    Инициализировать лемматизатор с кэшем из переменной окружения LEMMA_CACHE_PATH
+    :param morph: объект анализатора, по умолчанию создается новый
+    :return: объект `Lemmatizer`
+    """
+    return Lemmatizer(morph, cache_path=os.getenv("LEMMA_CACHE_PATH"))
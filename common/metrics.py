@@ -0,0 +1,240 @@
+"""
+Легковесные метрики конвейера и сервера: счетчики, гистограммы и таймеры этапов.
+
+Метрики хранятся в памяти процесса и отдаются в текстовом формате Prometheus. Значения, которые уже
+считают другие объекты (например, попадания в кэши), не дублируются на горячем пути, а снимаются
+функциями-сборщиками в момент выдачи. Скрипты сборки с опцией `--profile` печатают разбивку времени
+по этапам, `--profile=<файл>` дополнительно сохраняет профиль cProfile.
+"""
+import cProfile
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from common.lemmatizer import Lemmatizer
+
+PREFIX = "infosearch_"
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+def format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels] + ([extra] if extra else [])
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics:
+    def __init__(self):
+        self.counters: dict[str, dict[Labels, float]] = {}
+        self.histograms: dict[str, dict[Labels, Histogram]] = {}
+        self.descriptions: dict[str, str] = {}
+        self.collectors: list[tuple[Callable[[], dict[str, float]], str]] = []
+        # счетчики увеличиваются из потоков пула и из цикла событий сервера
+        self.lock = threading.Lock()
+
+    def describe(self, name: str, description: str):
+        self.descriptions[name] = description
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        """
+        Увеличить счетчик
+
+        :param name: имя метрики без префикса и суффикса `_total`
+        :param value: приращение
+        :param labels: метки
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            values = self.counters.setdefault(name, {})
+            values[key] = values.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str):
+        """
+        Добавить наблюдение в гистограмму
+
+        :param name: имя метрики без префикса
+        :param value: значение, для времени - в секундах
+        :param labels: метки
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            histograms = self.histograms.setdefault(name, {})
+            if (histogram := histograms.get(key)) is None:
+                histogram = histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def merge(self, other: "Metrics"):
+        """
+        Добавить счетчики и гистограммы другого реестра, например из процесса пула
+        """
+        for name, values in other.counters.items():
+            for labels, value in values.items():
+                self.inc(name, value, **dict(labels))
+        with self.lock:
+            for name, histograms in other.histograms.items():
+                for labels, histogram in histograms.items():
+                    target = self.histograms.setdefault(name, {}).setdefault(labels, Histogram(histogram.buckets))
+                    target.counts = [a + b for a, b in zip(target.counts, histogram.counts)]
+                    target.sum += histogram.sum
+                    target.count += histogram.count
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def __getstate__(self) -> dict:
+        # сборщики ссылаются на объекты процесса и не передаются между процессами, блокировка создается заново
+        state = {**self.__dict__, "collectors": []}
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Замерить время этапа, результат попадает в гистограмму `stage_seconds` с меткой `stage`
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - start, stage=name)
+
+    def collect(self, collector: Callable[[], dict[str, float]], metric_type: str = "gauge"):
+        """
+        Зарегистрировать сборщик значений, вызываемый при выдаче метрик
+
+        :param collector: функция, возвращающая имя метрики без префикса -> значение
+        :param metric_type: `gauge` для текущих значений или `counter` для накопленных, имена счетчиков
+            выдаются с суффиксом `_total`
+        """
+        assert metric_type in ("gauge", "counter"), "Тип метрики сборщика должен быть gauge или counter"
+        self.collectors.append((collector, metric_type))
+
+    def render(self) -> str:
+        """
+        Выдать метрики в текстовом формате Prometheus
+        """
+        with self.lock:
+            lines = self._render_registry()
+
+        for collector, metric_type in self.collectors:
+            suffix = "_total" if metric_type == "counter" else ""
+            for name, value in collector().items():
+                lines.append(f"# TYPE {PREFIX}{name}{suffix} {metric_type}")
+                lines.append(f"{PREFIX}{name}{suffix} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def _render_registry(self) -> list[str]:
+        lines = []
+        for name, values in self.counters.items():
+            if name in self.descriptions:
+                lines.append(f"# HELP {PREFIX}{name}_total {self.descriptions[name]}")
+            lines.append(f"# TYPE {PREFIX}{name}_total counter")
+            lines.extend(f"{PREFIX}{name}_total{format_labels(labels)} {value}" for labels, value in values.items())
+
+        for name, histograms in self.histograms.items():
+            if name in self.descriptions:
+                lines.append(f"# HELP {PREFIX}{name} {self.descriptions[name]}")
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for labels, histogram in histograms.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    bucket_labels = format_labels(labels, f'le="{bound}"')
+                    lines.append(f"{PREFIX}{name}_bucket{bucket_labels} {cumulative}")
+                bucket_labels = format_labels(labels, 'le="+Inf"')
+                lines.append(f"{PREFIX}{name}_bucket{bucket_labels} {histogram.count}")
+                lines.append(f"{PREFIX}{name}_sum{format_labels(labels)} {histogram.sum}")
+                lines.append(f"{PREFIX}{name}_count{format_labels(labels)} {histogram.count}")
+
+        return lines
+
+    def report(self) -> str:
+        """
+        Разбивка времени по этапам и значения счетчиков для вывода в консоль
+        """
+        stages = self.histograms.get("stage_seconds", {})
+        total = sum(histogram.sum for histogram in stages.values()) or 1
+        lines = [f"{'этап':<24} {'вызовов':>10} {'время, с':>10} {'доля':>7}"]
+        for labels, histogram in sorted(stages.items(), key=lambda item: -item[1].sum):
+            lines.append(
+                f"{dict(labels)['stage']:<24} {histogram.count:>10} {histogram.sum:>10.3f} {histogram.sum / total:>7.1%}"
+            )
+        for name, values in self.counters.items():
+            for labels, value in values.items():
+                lines.append(f"{name}{format_labels(labels)}: {value:g}")
+        for collector, _ in self.collectors:
+            lines.extend(f"{name}: {value:g}" for name, value in collector().items())
+
+        return "\n".join(lines)
+
+
+metrics = Metrics()
+
+
+def lemmatizer_collector(lemmatizer: Lemmatizer) -> Callable[[], dict[str, float]]:
+    """
+    Сборщик счетчиков лемматизатора: разобранные слова, попадания в кэш и время pymorphy2.
+    Регистрируется с типом `counter`.
+    """
+    return lambda: {
+        "lemmatizer_words": lemmatizer.hits + lemmatizer.misses,
+        "lemmatizer_cache_hits": lemmatizer.hits,
+        "lemmatizer_cache_misses": lemmatizer.misses,
+        "lemmatizer_morph_seconds": lemmatizer.morph_seconds,
+    }
+
+
+@contextmanager
+def profiling(argv: list[str] | None = None) -> Iterator[None]:
+    """
+    Профилирование скрипта сборки по опции командной строки `--profile[=<файл cProfile>]`:
+    по окончании печатается разбивка по этапам, при указании файла сохраняется профиль cProfile
+
+    :param argv: аргументы командной строки, по умолчанию `sys.argv[1:]`
+    """
+    options = [arg for arg in (sys.argv[1:] if argv is None else argv) if arg.split("=")[0] == "--profile"]
+    if not options:
+        yield
+        return
+
+    path = options[-1].partition("=")[2]
+    profiler = cProfile.Profile() if path else None
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(path)
+        print(f"Время работы: {time.perf_counter() - start:.3f} с")
+        print(metrics.report())
+        if profiler is not None:
+            print(f"Профиль cProfile сохранен в {path}")
@@ -0,0 +1,125 @@
+"""
+Параллельная обработка документов пулом процессов.
+
+Документы делятся на последовательные шарды, каждый процесс пула создает собственный лемматизатор,
+результаты шардов возвращаются в исходном порядке, поэтому слияние детерминировано
+и совпадает с последовательной обработкой.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, TypeVar
+
+from common.lemmatizer import Lemmatizer, init_lemmatizer
+from common.metrics import Metrics, metrics
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+worker_lemmatizer: Lemmatizer | None = None
+
+
+def get_workers_count() -> int:
+    """
+    Количество процессов сборки из переменной окружения BUILD_WORKERS, по умолчанию - 1 (без пула)
+    """
+    return max(1, int(os.getenv("BUILD_WORKERS") or 1))
+
+
+def split(items: list[T], shards_count: int) -> list[list[T]]:
+    """
+    Разбить список на последовательные шарды примерно одинакового размера
+
+    :param items: список элементов
+    :param shards_count: количество шардов
+    :return: список непустых шардов
+    """
+    size, rest = divmod(len(items), shards_count)
+    shards = []
+    start = 0
+    for i in range(shards_count):
+        end = start + size + (i < rest)
+        if start < end:
+            shards.append(items[start:end])
+        start = end
+
+    return shards
+
+
+def _init_worker():
+    global worker_lemmatizer
+    # кэш на диске только читается, сохраняет его основной процесс
+    worker_lemmatizer = init_lemmatizer()
+    worker_lemmatizer.cache_path = None
+
+
+def _run_in_worker(function: Callable[[list[T], Lemmatizer], R], shard: list[T]) -> tuple[R, Metrics]:
+    # метрики шарда возвращаются вместе с результатом и добавляются к метрикам основного процесса
+    metrics.reset()
+    hits, misses, morph_seconds = worker_lemmatizer.hits, worker_lemmatizer.misses, worker_lemmatizer.morph_seconds
+    result = function(shard, worker_lemmatizer)
+    metrics.inc("worker_lemmatizer_words", worker_lemmatizer.hits + worker_lemmatizer.misses - hits - misses)
+    metrics.inc("worker_lemmatizer_cache_misses", worker_lemmatizer.misses - misses)
+    metrics.inc("worker_lemmatizer_morph_seconds", worker_lemmatizer.morph_seconds - morph_seconds)
+    return result, metrics
+
+
+class ShardPool:
+    """
+    Пул процессов, переживающий несколько проходов по корпусу, чтобы кэши лемматизаторов процессов
+    не собирались заново на каждом проходе. При `workers == 1` функции выполняются в текущем процессе.
+    """
+
+    def __init__(self, lemmatizer: Lemmatizer, workers: int = 1):
+        """
+        :param lemmatizer: лемматизатор основного процесса, используется при `workers == 1`
+        :param workers: количество процессов
+        """
+        self.lemmatizer = lemmatizer
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) if workers > 1 else None
+
+    def map(self, function: Callable[[list[T], Lemmatizer], R], items: list[T]) -> list[R]:
+        """
+        Применить функцию к шардам элементов
+
+        :param function: функция верхнего уровня модуля, принимающая шард и лемматизатор
+        :param items: элементы, например имена файлов
+        :return: результаты по шардам в исходном порядке
+        """
+        if self.executor is None:
+            return [function(items, self.lemmatizer)]
+
+        # шардов больше, чем процессов, чтобы сгладить разницу в длине документов
+        shards = split(items, self.workers * 4)
+        results = []
+        for result, shard_metrics in self.executor.map(partial(_run_in_worker, function), shards):
+            metrics.merge(shard_metrics)
+            results.append(result)
+        return results
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def __enter__(self) -> "ShardPool":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def map_shards(
+        function: Callable[[list[T], Lemmatizer], R], items: list[T], lemmatizer: Lemmatizer, workers: int = 1
+) -> list[R]:
+    """
+    Применить функцию к шардам элементов в отдельном пуле
+
+    :param function: функция верхнего уровня модуля, принимающая шард и лемматизатор
+    :param items: элементы, например имена файлов
+    :param lemmatizer: лемматизатор основного процесса, используется при `workers == 1`
+    :param workers: количество процессов
+    :return: результаты по шардам в исходном порядке
+    """
+    with ShardPool(lemmatizer, workers) as pool:
+        return pool.map(function, items)
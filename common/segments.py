@@ -0,0 +1,403 @@
+"""
+Инкрементальный индекс из сегментов поверх снимка.
+
+Снимок `task5.snapshot` остается основным индексом, а новые документы записываются в новый небольшой
+неизменяемый сегмент (частоты лемм и длины документов), поэтому добавление N документов стоит O(N),
+а не O(корпус). Документы снимка в сегменты не попадают. Сегменты сливаются в фоне по size-tiered политике:
+как только в одном ярусе размеров набирается `merge_factor` сегментов, они сливаются в один сегмент
+следующего яруса. Список сегментов и номер поколения хранятся в `manifest.json`, файл заменяется атомарно,
+поэтому читатели в других процессах видят либо старый, либо новый набор.
+
+IDF считается по глобальной статистике: документные частоты снимка плюс статистики сегментов. Каждый сегмент
+ранжируется своим `RankingEngine` по CSR матрице TF, а IDF входит в вектор запроса в квадрате, поэтому
+скалярные произведения всегда считаются по текущей статистике. Нормы документов сегментов пересчитываются
+одним умножением матрицы на вектор, когда набор сегментов меняется при записи или загрузке сегмента.
+Результаты сегментов сливаются так же, как результаты шардов. Веса документов снимка зафиксированы при его сборке.
+
+Запуск индексации новых документов корпуса: python -m common.segments
+"""
+import json
+import math
+import os
+import threading
+import uuid
+from collections import Counter, defaultdict
+from heapq import merge
+from itertools import islice
+from typing import Iterable
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from common.documents import open_documents
+from common.lemmatizer import Lemmatizer, init_lemmatizer, preprocess_text
+from common.stats import CorpusStats
+from task5.ranking import RankingEngine
+from task5.snapshot import Snapshot, load_snapshot
+
+MANIFEST_FILE = "manifest.json"
+
+
+class Segment:
+    """
+    Неизменяемый сегмент: прямой индекс документ -> частоты лемм и построенная по нему CSR матрица TF
+    """
+
+    def __init__(self, file: str, docs: dict[str, dict]):
+        """
+        :param file: имя файла сегмента
+        :param docs: документ -> {"url", "length", "terms": {лемма: количество}}
+        """
+        self.file = file
+        self.docs = docs
+        self.names = list(docs)
+        self.stats = CorpusStats()
+        for doc, data in docs.items():
+            self.stats.df.update(data["terms"].keys())
+            self.stats.lengths[doc] = data["length"]
+        self.terms = sorted(self.stats.df)
+        self.ids = {lemme: term_id for term_id, lemme in enumerate(self.terms)}
+
+        rows, cols, tfs = [], [], []
+        for col, data in enumerate(docs.values()):
+            rows.extend(self.ids[lemme] for lemme in data["terms"])
+            cols.extend([col] * len(data["terms"]))
+            tfs.extend(count / data["length"] for count in data["terms"].values())
+        self.tf = csr_matrix(
+            (np.array(tfs, dtype=np.float64), (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64))),
+            shape=(len(self.terms), len(self.names)),
+        )
+        self.squares = csr_matrix(self.tf.multiply(self.tf)).T.tocsr()
+        self.engine: RankingEngine | None = None
+
+    def build_engine(self, idf: np.ndarray):
+        """
+        Посчитать нормы TF-IDF векторов документов по текущей глобальной статистике
+
+        :param idf: IDF терминов сегмента в порядке `terms`
+        """
+        self.engine = RankingEngine(self.names, self.tf, np.sqrt(self.squares @ idf ** 2))
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    @classmethod
+    def from_lemmes(cls, file: str, documents: Iterable[tuple[str, list[str], str]]) -> "Segment":
+        """
+        Построить сегмент по лемматизированным документам
+
+        :param file: имя файла сегмента
+        :param documents: кортежи имя документа, леммы, URL
+        :return: объект `Segment`
+        """
+        return cls(file, {
+            doc: {"url": url, "length": len(lemmes), "terms": dict(Counter(lemmes))}
+            for doc, lemmes, url in documents
+        })
+
+    @classmethod
+    def load(cls, dir_path: str, file: str) -> "Segment":
+        with open(os.path.join(dir_path, file), "r", encoding="utf8") as f:
+            return cls(file, json.load(f))
+
+    def save(self, dir_path: str):
+        path = os.path.join(dir_path, self.file)
+        with open(f"{path}.tmp", "w", encoding="utf8") as f:
+            json.dump(self.docs, f, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+
+
+class SegmentIndex:
+    def __init__(
+            self, dir_path: str, base: Snapshot | None = None, merge_factor: int = 4, min_segment_size: int = 100,
+            background: bool = True,
+    ):
+        """
+        :param dir_path: директория сегментов
+        :param base: снимок, поверх которого пишутся сегменты
+        :param merge_factor: количество сегментов одного яруса, при котором они сливаются
+        :param min_segment_size: размер сегментов нижнего яруса в документах
+        :param background: сливать сегменты в фоновом потоке
+        """
+        self.dir_path = dir_path
+        self.merge_factor = merge_factor
+        self.min_segment_size = min_segment_size
+        self.background = background
+
+        self.base = base
+        self.base_df: dict[str, int] = {}
+        if base is not None:
+            # снимок хранит IDF = log10(N / df), документные частоты восстанавливаются точно
+            base_df = np.maximum(np.rint(len(base.docs) / np.power(10, base.idf)), 1).astype(np.int64)
+            self.base_df = dict(zip(base.terms, base_df.tolist()))
+
+        self.lock = threading.RLock()
+        self.merge_thread: threading.Thread | None = None
+        self.generation = 0
+        self.segments: list[Segment] = []
+        self.doc_segments: dict[str, Segment] = {}
+        self.stats = CorpusStats()
+
+        if not os.path.isdir(dir_path):
+            os.makedirs(dir_path)
+        self.refresh()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.dir_path, MANIFEST_FILE)
+
+    def refresh(self) -> bool:
+        """
+        Перечитать список сегментов, если его изменил другой процесс. Загружаются только новые сегменты.
+
+        :return: True, если набор сегментов изменился
+        """
+        with self.lock:
+            if not os.path.isfile(self.manifest_path):
+                return False
+            with open(self.manifest_path, "r", encoding="utf8") as f:
+                manifest = json.load(f)
+            if manifest["generation"] == self.generation:
+                return False
+
+            loaded = {segment.file: segment for segment in self.segments}
+            segments = [loaded.get(file) or Segment.load(self.dir_path, file) for file in manifest["segments"]]
+            self._replace(self.segments, segments)
+            self.generation = manifest["generation"]
+            return True
+
+    def _replace(self, old: list[Segment], new: list[Segment]):
+        """
+        Заменить набор сегментов, поправив глобальную статистику только на разницу между наборами,
+        и пересчитать нормы документов всех сегментов по новой статистике
+        """
+        old_files = {segment.file for segment in old}
+        new_files = {segment.file for segment in new}
+        removed = [segment for segment in old if segment.file not in new_files]
+        added = [segment for segment in new if segment.file not in old_files]
+        for segment in removed:
+            self.stats.subtract(segment.stats)
+            for doc in segment.docs:
+                self.doc_segments.pop(doc, None)
+        for segment in added:
+            self.stats.merge(segment.stats)
+            self.doc_segments.update(dict.fromkeys(segment.docs, segment))
+        if removed or added:
+            for segment in new:
+                segment.build_engine(np.array([self.idf(lemme) for lemme in segment.terms], dtype=np.float64))
+        self.segments = new
+
+    def _write_manifest(self):
+        self.generation += 1
+        with open(f"{self.manifest_path}.tmp", "w", encoding="utf8") as f:
+            json.dump({"generation": self.generation, "segments": [segment.file for segment in self.segments]}, f)
+        os.replace(f"{self.manifest_path}.tmp", self.manifest_path)
+
+    def _next_file(self) -> str:
+        # имя уникально и для сегментов, которые одновременно пишут несколько процессов
+        return f"segment_{self.generation + 1:06d}_{uuid.uuid4().hex[:8]}.json"
+
+    def idf(self, lemme: str) -> float:
+        """
+        Получить IDF леммы по глобальной статистике снимка и сегментов
+
+        :param lemme: лемма
+        :return: log10(N / df) или 0, если лемма не встречается
+        """
+        df = self.base_df.get(lemme, 0) + self.stats.df.get(lemme, 0)
+        return math.log10(((len(self.base.docs) if self.base is not None else 0) + self.stats.n) / df) if df else 0
+
+    def __len__(self) -> int:
+        return self.stats.n
+
+    def __contains__(self, doc: str) -> bool:
+        return doc in self.doc_segments or (self.base is not None and doc in self.base.urls)
+
+    def url(self, doc: str) -> str:
+        return self.doc_segments[doc].docs[doc]["url"]
+
+    def add_documents(self, documents: Iterable[tuple[str, str, str]], lemmatizer: Lemmatizer) -> int:
+        """
+        Записать новые документы в новый сегмент. Документы снимка и уже проиндексированные документы пропускаются.
+
+        :param documents: кортежи имя документа, текст, URL
+        :param lemmatizer: объект лемматизатора
+        :return: количество добавленных документов
+        """
+        documents = [
+            (doc, lemmatizer.lemmatize(preprocess_text(text)), url)
+            for doc, text, url in documents if doc not in self
+        ]
+        if not documents:
+            return 0
+
+        with self.lock:
+            self.refresh()
+            segment = Segment.from_lemmes(self._next_file(), documents)
+            segment.save(self.dir_path)
+            self._replace(self.segments, self.segments + [segment])
+            self._write_manifest()
+
+        self.maybe_merge()
+        return len(segment)
+
+    def tier(self, segment: Segment) -> int:
+        """
+        Ярус сегмента: 0 для сегментов меньше `min_segment_size`, дальше - логарифм размера по основанию `merge_factor`
+        """
+        if len(segment) < self.min_segment_size:
+            return 0
+        return int(math.log(len(segment) / self.min_segment_size, self.merge_factor)) + 1
+
+    def find_merge(self) -> list[Segment] | None:
+        """
+        Найти сегменты для слияния: `merge_factor` самых старых сегментов одного яруса
+        """
+        tiers = defaultdict(list)
+        for segment in self.segments:
+            tiers[self.tier(segment)].append(segment)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= self.merge_factor:
+                return tiers[tier][:self.merge_factor]
+        return None
+
+    def merge(self) -> int:
+        """
+        Сливать сегменты, пока по политике есть что сливать
+
+        :return: количество выполненных слияний
+        """
+        merges = 0
+        while True:
+            with self.lock:
+                self.refresh()
+                candidates = self.find_merge()
+                if candidates is None:
+                    return merges
+                file = self._next_file()
+
+            # слияние идет без блокировки: сегменты неизменяемы, поиск продолжает работать со старым набором
+            docs = {}
+            for segment in candidates:
+                docs.update(segment.docs)
+            merged = Segment(file, docs)
+            merged.save(self.dir_path)
+
+            with self.lock:
+                self.refresh()
+                if any(segment not in self.segments for segment in candidates):
+                    # сегменты уже слил другой процесс
+                    os.remove(os.path.join(self.dir_path, file))
+                    continue
+                position = self.segments.index(candidates[0])
+                segments = [segment for segment in self.segments if segment not in candidates]
+                segments.insert(position, merged)
+                self._replace(self.segments, segments)
+                self._write_manifest()
+            for segment in candidates:
+                os.remove(os.path.join(self.dir_path, segment.file))
+            merges += 1
+
+    def maybe_merge(self):
+        """
+        Запустить слияние сегментов, в фоне - если слияние еще не идет
+        """
+        if not self.background:
+            self.merge()
+            return
+        with self.lock:
+            if self.merge_thread is not None and self.merge_thread.is_alive():
+                return
+            self.merge_thread = threading.Thread(target=self.merge, daemon=True)
+            self.merge_thread.start()
+
+    def close(self):
+        """
+        Дождаться окончания фонового слияния
+        """
+        if self.merge_thread is not None:
+            self.merge_thread.join()
+
+    def query_weights(self, lemmes: list[str]) -> dict[str, float]:
+        """
+        Получить вектор TF-IDF запроса по глобальной статистике
+
+        :param lemmes: леммы запроса
+        :return: лемма -> вес
+        """
+        with self.lock:
+            return {lemme: count / len(lemmes) * self.idf(lemme) for lemme, count in Counter(lemmes).items()}
+
+    def search(self, weights: dict[str, float], k: int) -> list[tuple[str, float]]:
+        """
+        Найти k самых похожих на запрос документов во всех сегментах
+
+        :param weights: вектор TF-IDF запроса из `query_weights`
+        :param k: количество документов
+        :return: пары документ, сходство по убыванию сходства
+        """
+        with self.lock:
+            engines = [(segment.ids, segment.engine) for segment in self.segments]
+            idfs = {lemme: self.idf(lemme) for lemme in weights}
+        results = []
+        for ids, engine in engines:
+            # матрица сегмента хранит TF, второй множитель IDF переносится в запрос
+            query = {ids[lemme]: weight * idfs[lemme] for lemme, weight in weights.items() if lemme in ids}
+            results.append(rescale(engine.top_k(query, k), query, weights))
+        # слияние устойчиво: при равном сходстве раньше идут документы более старых сегментов
+        return list(islice(merge(*results, key=lambda result: -result[1]), k))
+
+
+def rescale(results: list[tuple[str, float]], query: dict, weights: dict[str, float]) -> list[tuple[str, float]]:
+    """
+    Перевести сходства, посчитанные движком, в косинусные сходства с полным вектором запроса.
+
+    Движок делит скалярное произведение на норму переданного ему вектора, а в нем есть только термины
+    его словаря и, для сегментов, лишний множитель IDF, поэтому сходства разных движков сравнимы
+    только после умножения на отношение норм.
+
+    :param results: пары документ, сходство с `query`
+    :param query: вектор, переданный движку, его скалярные произведения с документами равны произведениям `weights`
+    :param weights: полный вектор TF-IDF запроса
+    :return: пары документ, сходство с полным запросом
+    """
+    weights_norm = math.sqrt(sum(weight ** 2 for weight in weights.values()))
+    factor = math.sqrt(sum(weight ** 2 for weight in query.values())) / weights_norm if weights_norm else 0
+    return [(doc, similarity * factor) for doc, similarity in results]
+
+
+def init_segment_index(segments_path: str | None = None, base: Snapshot | None = None) -> SegmentIndex | None:
+    """
+    Открыть индекс сегментов по пути из переменной окружения SEGMENTS_PATH поверх снимка
+
+    :param segments_path: путь до директории сегментов
+    :param base: снимок, по умолчанию открывается снимок SNAPSHOT_PATH, если он задан
+    :return: объект `SegmentIndex` или None, если путь не задан
+    """
+    segments_path = segments_path or os.getenv("SEGMENTS_PATH")
+    if not segments_path:
+        return None
+    if base is None and os.getenv("SNAPSHOT_PATH"):
+        base = load_snapshot()
+    return SegmentIndex(segments_path, base)
+
+
+def load_urls(index_path: str) -> dict[str, str]:
+    with open(index_path, "r", encoding="utf8") as f:
+        return dict(line.split() for line in f if line.strip())
+
+
+if __name__ == "__main__":
+    assert os.getenv("SEGMENTS_PATH"), "Укажите путь для директории сегментов в переменную окружения SEGMENTS_PATH"
+    assert os.getenv("POSTS_DIR_PATH"), "Укажите путь для папки и архива в переменную окружения POSTS_DIR_PATH"
+    # если задан SNAPSHOT_PATH, в сегменты попадают только документы, которых нет в снимке
+    segment_index = init_segment_index()
+    lemmatizer = init_lemmatizer()
+    urls = load_urls("index.txt")
+    added = segment_index.add_documents(
+        ((name, text, urls.get(name, "")) for name, text in open_documents(os.getenv("POSTS_DIR_PATH"))),
+        lemmatizer,
+    )
+    segment_index.close()
+    lemmatizer.save()
+    print(f"Добавлено документов: {added}, сегментов: {len(segment_index.segments)}, документов в сегментах: {len(segment_index)}")
@@ -0,0 +1,78 @@
+import math
+from collections import Counter
+from typing import Iterable
+
+
+class CorpusStats:
+    """
+    Статистика корпуса, собираемая за один проход: документные частоты терминов, длины документов и их количество.
+    """
+
+    def __init__(self):
+        self.df: Counter[str] = Counter()
+        self.lengths: dict[str, int] = {}
+
+    @property
+    def n(self) -> int:
+        return len(self.lengths)
+
+    def add(self, doc: str, tokens: Iterable[str]):
+        """
+        Учесть документ в статистике
+
+        :param doc: идентификатор документа
+        :param tokens: термины документа
+        """
+        tokens = list(tokens)
+        self.lengths[doc] = len(tokens)
+        self.df.update(set(tokens))
+
+    def merge(self, other: "CorpusStats") -> "CorpusStats":
+        """
+        Добавить статистику другой части корпуса
+
+        :param other: статистика непересекающегося набора документов
+        :return: этот же объект
+        """
+        self.df.update(other.df)
+        self.lengths.update(other.lengths)
+        return self
+
+    def subtract(self, other: "CorpusStats") -> "CorpusStats":
+        """
+        Исключить статистику части корпуса
+
+        :param other: статистика документов, ранее добавленных в этот объект
+        :return: этот же объект
+        """
+        for token, df in other.df.items():
+            self.df[token] -= df
+            if self.df[token] <= 0:
+                del self.df[token]
+        for doc in other.lengths:
+            self.lengths.pop(doc, None)
+        return self
+
+    @classmethod
+    def from_texts(cls, texts: dict[str, str]) -> "CorpusStats":
+        """
+        Собрать статистику по текстам
+
+        :param texts: словарь документ -> текст, термины разделены пробелами
+        :return: объект `CorpusStats`
+        """
+        stats = cls()
+        for doc, text in texts.items():
+            stats.add(doc, text.split())
+
+        return stats
+
+    def idf(self, token: str) -> float:
+        """
+        Получить IDF термина
+
+        :param token: термин
+        :return: log10(N / df) или 0, если термин не встречается в корпусе
+        """
+        df = self.df.get(token)
+        return math.log10(self.n / df) if df else 0
@@ -0,0 +1,104 @@
+import os
+from typing import Iterable, Iterator
+
+
+class Vocabulary:
+    """
+    Словарь терминов с идентификаторами.
+
+    Поиск термин -> идентификатор и идентификатор -> термин выполняется за O(1).
+    Идентификатор термина - номер строки в файле словаря, новые термины только дописываются в конец,
+    поэтому идентификаторы не меняются между запусками.
+    """
+
+    def __init__(self, terms: Iterable[str] = ()):
+        self.terms: list[str] = []
+        self.ids: dict[str, int] = {}
+        self.update(terms)
+
+    def add(self, term: str) -> int:
+        """
+        Добавить термин, если его еще нет в словаре
+
+        :param term: термин
+        :return: идентификатор термина
+        """
+        if (term_id := self.ids.get(term)) is None:
+            term_id = self.ids[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+    def update(self, terms: Iterable[str]):
+        for term in terms:
+            self.add(term)
+
+    def get(self, term: str, default: int | None = None) -> int | None:
+        return self.ids.get(term, default)
+
+    def term(self, term_id: int) -> str:
+        return self.terms[term_id]
+
+    def __getitem__(self, term: str) -> int:
+        return self.ids[term]
+
+    def __contains__(self, term: str) -> bool:
+        return term in self.ids
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.terms)
+
+    @classmethod
+    def load(cls, path: str) -> "Vocabulary":
+        """
+        Загрузить словарь из файла
+
+        :param path: путь до файла словаря, по одному термину на строку
+        :return: объект `Vocabulary`
+        """
+        with open(path, "r", encoding="utf8") as f:
+            return cls(line.rstrip("\n") for line in f)
+
+    def save(self, path: str):
+        """
+        Сохранить словарь в файл
+
+        :param path: путь до файла словаря
+        """
+        with open(path, "w", encoding="utf8") as f:
+            f.writelines(term + "\n" for term in self.terms)
+
+
+def load_lemmes(lemmes_path: str) -> list[str]:
+    """
+    Загрузить леммы из файла
+
+    :param lemmes_path: путь до файла с леммами.
+    :return: список лемм в порядке файла
+    """
+    with open(lemmes_path, "r", encoding="utf8") as f:
+        return [line.split()[0] for line in f if line.strip()]
+
+
+def init_vocabulary(terms: Iterable[str] = (), vocabulary_path: str | None = None) -> Vocabulary:
+    """
+    Загрузить сохраненный словарь, дополнить его новыми терминами и сохранить обратно
+
+    :param terms: термины, которые должны быть в словаре
+    :param vocabulary_path: путь до файла словаря, по умолчанию из переменной окружения VOCABULARY_PATH
+    :return: объект `Vocabulary`
+    """
+    vocabulary_path = vocabulary_path or os.getenv("VOCABULARY_PATH")
+    if vocabulary_path and os.path.isfile(vocabulary_path):
+        vocabulary = Vocabulary.load(vocabulary_path)
+    else:
+        vocabulary = Vocabulary()
+
+    size = len(vocabulary)
+    vocabulary.update(terms)
+    if vocabulary_path and (len(vocabulary) != size or not os.path.isfile(vocabulary_path)):
+        vocabulary.save(vocabulary_path)
+
+    return vocabulary
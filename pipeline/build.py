@@ -0,0 +1,247 @@
+"""
+Сборка всех артефактов за один проход по корпусу.
+
+Каждый документ читается и каждое его слово лемматизируется один раз, результаты разбора шардов складываются
+в общие структуры в памяти: словарь словоформ task2, списки документов (и позиции) task3, количества токенов
+и лемм task4.
+Из них без повторного чтения корпуса записываются `tokens.txt`/`lemmes.txt`, инвертированный индекс
+в JSON и бинарном виде, TF-IDF токенов и лемм, снимок сервера и, если заданы пути, позиционный индекс,
+индекс BM25, шарды снимка и похожие документы. Результаты совпадают с результатами отдельных скриптов.
+
+Запуск: python -m pipeline.build [--profile]
+"""
+import os
+from collections import Counter
+from functools import partial
+
+from common.documents import DocumentSource, open_documents
+from common.lemmatizer import Lemmatizer, init_lemmatizer, preprocess_text
+from common.metrics import lemmatizer_collector, metrics, profiling
+from common.parallel import get_workers_count, map_shards
+from common.stats import CorpusStats
+from common.vocabulary import init_vocabulary
+from task2.task2 import init_morph, write_tokens
+from task3.binary_index import write_binary_index
+from task3.positional_index import document_positions, write_positional_index
+from task3.task3 import index_from_postings, load_urls, write_index
+from task4.store import Rows, TfIdfStore, write_lengths, write_store
+from task4.task4 import tf_idf_from_counts, write_tf_idf
+from task5.bm25 import impacts, write_bm25
+from task5.neighbours import compute_neighbours, normalized_matrix, write_neighbours
+from task5.shards import write_shards
+from task5.snapshot import Snapshot, write_snapshot
+
+
+def prevalidate_env_variables():
+    assert os.getenv("POSTS_DIR_PATH"), "Укажите путь для папки и архива в переменную окружения POSTS_DIR_PATH"
+    assert os.getenv("TOKENS_PATH"), "Укажите путь для файла токенов в переменную окружения TOKENS_PATH"
+    assert os.getenv("LEMMES_PATH"), "Укажите путь для файла лемм в переменную окружения LEMMES_PATH"
+    assert os.getenv("INDEX_PATH"), "Укажите путь для файла индекса в переменную окружения INDEX_PATH"
+    assert os.getenv("BINARY_INDEX_PATH"), "Укажите путь для бинарного индекса в переменную окружения BINARY_INDEX_PATH"
+    assert os.getenv("TF_IDFS_PATH") or os.getenv("TF_IDF_STORE_PATH"), (
+        "Укажите папку TF-IDF в TF_IDFS_PATH или хранилище в TF_IDF_STORE_PATH"
+    )
+    assert os.getenv("SNAPSHOT_PATH"), "Укажите путь для файла снимка в переменную окружения SNAPSHOT_PATH"
+
+
+class Analysis:
+    """
+    Результаты разбора части корпуса, из которых собираются все артефакты
+    """
+
+    def __init__(self):
+        # task2: лемма -> словоформы
+        self.tokens: dict[str, set[str]] = {}
+        # task3: лемма -> файлы и лемма -> {файл: позиции}
+        self.postings: dict[str, list[str]] = {}
+        self.positions: dict[str, dict[str, list[int]]] = {}
+        # task4: файл -> количества токенов и лемм в порядке первого появления
+        self.token_counts: dict[str, Counter[str]] = {}
+        self.lemme_counts: dict[str, Counter[str]] = {}
+
+    def merge(self, other: "Analysis") -> "Analysis":
+        """
+        Добавить результаты следующего шарда
+
+        :param other: результаты шарда с документами после документов этого объекта
+        :return: этот же объект
+        """
+        for lemme, words in other.tokens.items():
+            self.tokens.setdefault(lemme, set()).update(words)
+        for lemme, files in other.postings.items():
+            self.postings.setdefault(lemme, []).extend(files)
+        for lemme, docs in other.positions.items():
+            self.positions.setdefault(lemme, {}).update(docs)
+        self.token_counts.update(other.token_counts)
+        self.lemme_counts.update(other.lemme_counts)
+        return self
+
+
+def analyze_documents(
+        documents: DocumentSource, positions: bool, files: list[str], lemmatizer: Lemmatizer
+) -> Analysis:
+    """
+    Разобрать часть документов за один проход
+
+    :param documents: источник документов
+    :param positions: собирать позиции лемм
+    :param files: имена файлов шарда
+    :param lemmatizer: объект лемматизатора
+    :return: результаты разбора шарда
+    """
+    analysis = Analysis()
+    for file, text in documents.iter_documents(files):
+        words, lemmas, lemmes = [], [], []
+        with metrics.stage("lemmatize"):
+            # task3 индексирует исходный текст без очистки, task2 и task4 - очищенный. Очищенные слова текста -
+            # это очищенные части его исходных слов по порядку, поэтому каждое слово разбирается один раз,
+            # а части разбираются отдельно, только если очистка изменила слово
+            for raw_word in text.split():
+                lemma = lemmatizer.parse(raw_word)
+                if lemma.keep:
+                    lemmes.append(lemma.normal_form)
+                pieces = preprocess_text(raw_word).split()
+                words.extend(pieces)
+                if pieces != [raw_word]:
+                    lemmas.extend(lemma for lemma in map(lemmatizer.parse, pieces) if lemma.keep)
+                elif lemma.keep:
+                    lemmas.append(lemma)
+        with metrics.stage("postings"):
+            for lemma in lemmas:
+                analysis.tokens.setdefault(lemma.normal_form, set()).add(lemma.word)
+            for lemme in dict.fromkeys(lemmes):
+                analysis.postings.setdefault(lemme, []).append(file)
+            if positions:
+                for lemme, lemme_positions in document_positions(lemmes).items():
+                    analysis.positions.setdefault(lemme, {})[file] = lemme_positions
+            analysis.token_counts[file] = Counter(words)
+            analysis.lemme_counts[file] = Counter(lemma.normal_form for lemma in lemmas)
+
+    return analysis
+
+
+def corpus_stats(counts: dict[str, Counter[str]]) -> CorpusStats:
+    stats = CorpusStats()
+    for doc, doc_counts in counts.items():
+        stats.lengths[doc] = sum(doc_counts.values())
+        stats.df.update(doc_counts.keys())
+    return stats
+
+
+def tf_idfs(counts: dict[str, Counter[str]]) -> dict[str, Rows]:
+    """
+    Посчитать TF-IDF документов по количествам терминов
+
+    :param counts: файл -> количества терминов
+    :return: файл -> строки TF-IDF
+    """
+    stats = corpus_stats(counts)
+    with metrics.stage("tf_idf"):
+        return {doc: tf_idf_from_counts(doc_counts, stats) for doc, doc_counts in counts.items()}
+
+
+def write_tf_idfs(tf_idfs_path: str, prefix: str, rows: dict[str, Rows]):
+    with metrics.stage("write"):
+        for doc, doc_rows in rows.items():
+            write_tf_idf(os.path.join(tf_idfs_path, prefix + doc), doc_rows)
+
+
+def vectors_from_rows(rows: dict[str, Rows]) -> tuple[dict[str, dict[str, float]], dict[str, float]]:
+    """
+    Получить веса TF-IDF, как после чтения файлов `read_tf_idfs`
+    """
+    vectors, idfs = {}, {}
+    for doc, doc_rows in rows.items():
+        vector = vectors[doc] = {}
+        for token, tf, idf in doc_rows:
+            vector[token] = tf * idf
+            idfs[token] = idf
+
+    return vectors, idfs
+
+
+def build(documents: DocumentSource, lemmatizer: Lemmatizer, workers: int = 1):
+    """
+    Собрать артефакты по путям из переменных окружения
+
+    :param documents: источник документов
+    :param lemmatizer: объект лемматизатора
+    :param workers: количество процессов, результат не зависит от их количества
+    """
+    positions_path, bm25_path, neighbours_path = (
+        os.getenv("POSITIONS_PATH"), os.getenv("BM25_PATH"), os.getenv("NEIGHBOURS_PATH")
+    )
+    shards = map_shards(partial(analyze_documents, documents, bool(positions_path)), documents.names(), lemmatizer, workers)
+    with metrics.stage("merge"):
+        analysis = Analysis()
+        for shard in shards:
+            analysis.merge(shard)
+
+    with metrics.stage("write_tokens"):
+        write_tokens(os.getenv("TOKENS_PATH"), os.getenv("LEMMES_PATH"), analysis.tokens)
+        init_vocabulary(analysis.tokens)
+
+    with metrics.stage("sort"):
+        index = index_from_postings(analysis.postings)
+    urls = load_urls("index.txt")
+    with metrics.stage("write_index"):
+        write_index(os.getenv("INDEX_PATH"), index)
+        write_binary_index(os.getenv("BINARY_INDEX_PATH"), index, urls)
+        init_vocabulary(index)
+    if positions_path:
+        with metrics.stage("write_positions"):
+            write_positional_index(positions_path, analysis.positions)
+
+    counts = {"tokens": analysis.token_counts, "lemmes": analysis.lemme_counts}
+    collections = {prefix: tf_idfs(prefix_counts) for prefix, prefix_counts in counts.items()}
+    lengths = {
+        prefix: {doc: sum(doc_counts.values()) for doc, doc_counts in prefix_counts.items()}
+        for prefix, prefix_counts in counts.items()
+    }
+    if store_path := os.getenv("TF_IDF_STORE_PATH"):
+        with metrics.stage("write"):
+            write_store(store_path, documents.names(), collections, lengths)
+        # веса в хранилище - float32, снимок собирается из них так же, как из хранилища отдельными скриптами
+        vectors, idfs = TfIdfStore(store_path).tf_idfs()
+    else:
+        tf_idfs_path = os.getenv("TF_IDFS_PATH")
+        os.makedirs(tf_idfs_path, exist_ok=True)
+        for prefix, rows in collections.items():
+            write_tf_idfs(tf_idfs_path, prefix, rows)
+            write_lengths(tf_idfs_path, prefix, lengths[prefix])
+        vectors, idfs = vectors_from_rows(collections["lemmes"])
+    with metrics.stage("snapshot"):
+        write_snapshot(os.getenv("SNAPSHOT_PATH"), vectors, idfs, urls)
+    if shards_path := os.getenv("SHARDS_PATH"):
+        with metrics.stage("shards"):
+            write_shards(Snapshot(os.getenv("SNAPSHOT_PATH")), shards_path, int(os.getenv("SHARDS_COUNT") or 2))
+
+    if bm25_path:
+        with metrics.stage("bm25"):
+            lemme_counts = {doc: doc_counts for doc, doc_counts in analysis.lemme_counts.items() if doc_counts}
+            k1, b = float(os.getenv("BM25_K1") or 1.2), float(os.getenv("BM25_B") or 0.75)
+            write_bm25(
+                bm25_path, impacts(lemme_counts, {doc: lengths["lemmes"][doc] for doc in lemme_counts}, k1, b),
+                list(analysis.lemme_counts),
+                int(os.getenv("BM25_BITS") or 8), k1, b,
+            )
+
+    if neighbours_path:
+        with metrics.stage("neighbours"):
+            ids, scores = compute_neighbours(
+                normalized_matrix(vectors),
+                k=int(os.getenv("NEIGHBOURS_K") or 10),
+                block_size=int(os.getenv("NEIGHBOURS_BLOCK_SIZE") or 1024),
+                workers=workers,
+            )
+            write_neighbours(neighbours_path, list(vectors), ids, scores)
+
+
+if __name__ == "__main__":
+    prevalidate_env_variables()
+    with profiling():
+        lemmatizer = init_lemmatizer(init_morph())
+        metrics.collect(lemmatizer_collector(lemmatizer), "counter")
+        build(open_documents(os.getenv("POSTS_DIR_PATH")), lemmatizer, get_workers_count())
+        lemmatizer.save()
+    print(lemmatizer.stats())
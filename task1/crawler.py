@@ -0,0 +1,234 @@
+"""
+Асинхронный сборщик постов со стены VK.
+
+За один запрос к методу `execute` выполняется до 25 вызовов `wall.get`, одновременно в полете
+не больше `max_in_flight` запросов, частота запросов ограничивается на стороне клиента.
+Посты пишутся на диск по мере получения в порядке смещений, после каждой записанной пачки
+в файл контрольной точки сохраняется смещение, с которого нужно продолжить после падения,
+и длина index файла: строки пачки, прерванной до контрольной точки, при продолжении отбрасываются.
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Callable
+
+from httpx import AsyncClient, HTTPError
+from urllib3.util import Url
+
+WALL_GET_COUNT = 100  # максимум постов за один вызов wall.get
+EXECUTE_CALLS = 25  # максимум вызовов API внутри одного execute
+RETRYABLE_ERRORS = {1, 6, 9, 10}  # неизвестная ошибка, слишком много запросов, flood control, внутренняя ошибка
+
+
+class VKError(Exception):
+    def __init__(self, error: dict):
+        self.code = error.get("error_code")
+        super().__init__(f"VK API error {self.code}: {error.get('error_msg')}")
+
+
+class RateLimiter:
+    """
+    Ограничение частоты запросов: не больше `rate` запросов в секунду
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.next_time = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = time.monotonic()
+            if self.next_time > now:
+                await asyncio.sleep(self.next_time - now)
+            self.next_time = max(now, self.next_time) + self.interval
+
+
+class WallCrawler:
+    def __init__(
+            self,
+            client: AsyncClient,
+            owner_id: str,
+            dir_path: str,
+            index_path: str = "./index.txt",
+            checkpoint_path: str | None = None,
+            count: int = 100,
+            min_length: int = 1000,
+            calls_per_request: int = EXECUTE_CALLS,
+            max_in_flight: int = 3,
+            rate: float = 3,
+            max_retries: int = 5,
+            backoff: float = 0.5,
+            on_batch: Callable[[list[tuple[str, str, str]]], object] | None = None,
+    ):
+        """
+        :param client: асинхронный клиент с базовым URL API и параметрами access_token и v
+        :param owner_id: идентификатор владельца стены
+        :param dir_path: директория для текстов постов
+        :param index_path: путь до index файла с URL постов
+        :param checkpoint_path: путь до файла контрольной точки, по умолчанию `<dir_path>.checkpoint.json`
+        :param count: итоговое количество постов
+        :param min_length: минимальная длина текста в записи
+        :param calls_per_request: количество вызовов wall.get в одном execute
+        :param max_in_flight: максимальное количество одновременных запросов
+        :param rate: максимальное количество запросов в секунду
+        :param max_retries: количество повторов запроса при ошибке
+        :param backoff: начальная задержка между повторами в секундах, удваивается с каждым повтором
+        :param on_batch: функция, получающая сохраненные посты пачки как кортежи имя файла, текст, URL,
+            вызывается в пуле потоков до сохранения контрольной точки
+        """
+        self.client = client
+        self.owner_id = owner_id
+        self.dir_path = dir_path
+        self.index_path = index_path
+        self.checkpoint_path = checkpoint_path or f"{dir_path}.checkpoint.json"
+        self.count = count
+        self.min_length = min_length
+        self.calls_per_request = min(calls_per_request, EXECUTE_CALLS)
+        self.max_in_flight = max_in_flight
+        self.limiter = RateLimiter(rate)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.on_batch = on_batch
+
+        self.offset = 0
+        self.saved = 0
+        self.seen: set[int] = set()
+        self.finished = False
+
+    @property
+    def batch_size(self) -> int:
+        return self.calls_per_request * WALL_GET_COUNT
+
+    def load_checkpoint(self) -> bool:
+        """
+        Восстановить смещение и уже сохраненные посты после прерванного запуска
+
+        :return: True, если контрольная точка найдена
+        """
+        if not os.path.isfile(self.checkpoint_path):
+            return False
+        with open(self.checkpoint_path, "r", encoding="utf8") as f:
+            checkpoint = json.load(f)
+        self.offset = checkpoint["offset"]
+        self.saved = checkpoint["saved"]
+        if os.path.isfile(self.index_path):
+            if (index_size := checkpoint.get("index_size")) is not None:
+                # посты пачки, записанные после последней контрольной точки, будут получены и записаны заново
+                with open(self.index_path, "r+b") as f:
+                    f.truncate(index_size)
+            with open(self.index_path, "r", encoding="utf8") as f:
+                self.seen = {int(line.split()[0].removesuffix(".txt")) for line in f if line.strip()}
+        return True
+
+    def save_checkpoint(self):
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump({"offset": self.offset, "saved": self.saved, "index_size": os.path.getsize(self.index_path)}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def build_code(self, offset: int) -> str:
+        """
+        Сформировать VKScript для execute с несколькими вызовами wall.get подряд
+
+        :param offset: смещение первого вызова
+        :return: код для параметра `code`
+        """
+        calls = ",".join(
+            f'API.wall.get({{"owner_id":{self.owner_id},"offset":{offset + i * WALL_GET_COUNT},"count":{WALL_GET_COUNT}}})'
+            for i in range(self.calls_per_request)
+        )
+        return f"return [{calls}];"
+
+    async def fetch_batch(self, offset: int) -> list[dict]:
+        """
+        Получить пачку постов начиная со смещения с повторами и экспоненциальной задержкой
+
+        :param offset: смещение
+        :return: ответы wall.get по порядку; пустой список items означает конец стены
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.wait()
+            try:
+                response = await self.client.post("execute", data={"code": self.build_code(offset)})
+                response.raise_for_status()
+                # обрезанный или не JSON ответ (ValueError) повторяется, как и сетевые ошибки
+                data = response.json()
+                if "error" in data:
+                    raise VKError(data["error"])
+                return [result or {"items": []} for result in data["response"]]
+            except (HTTPError, VKError, ValueError) as e:
+                if isinstance(e, VKError) and e.code not in RETRYABLE_ERRORS or attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def write_batch(self, results: list[dict]) -> bool:
+        """
+        Записать посты пачки на диск и сдвинуть контрольную точку
+
+        :param results: ответы wall.get
+        :return: True, если стена закончилась или набрано нужное количество постов
+        """
+        saved = []
+        with open(self.index_path, "a", encoding="utf8") as index:
+            for result in results:
+                for post in result["items"]:
+                    if self.saved >= self.count:
+                        break
+                    if len(post.get("text", "")) < self.min_length or post["id"] in self.seen:
+                        continue
+                    post_path = f"{post['id']}.txt"
+                    with open(os.path.join(self.dir_path, post_path), "w", encoding="utf8") as post_file:
+                        post_file.write(post["text"])
+                    url = build_url(post)
+                    index.write("\t".join((post_path, url)) + "\n")
+                    saved.append((post_path, post["text"], url))
+                    self.seen.add(post["id"])
+                    self.saved += 1
+
+        if self.on_batch is not None and saved:
+            # обработка пачки (например, лемматизация) не блокирует получение следующих пачек
+            await asyncio.get_running_loop().run_in_executor(None, self.on_batch, saved)
+        self.offset += self.batch_size
+        self.save_checkpoint()
+        return self.saved >= self.count or any(len(result["items"]) < WALL_GET_COUNT for result in results)
+
+    async def run(self) -> int:
+        """
+        Собрать посты
+
+        :return: количество сохраненных постов
+        """
+        if not os.path.isdir(self.dir_path):
+            os.mkdir(self.dir_path)
+        if not self.load_checkpoint():
+            # новый запуск - index файл пишется заново
+            open(self.index_path, "w", encoding="utf8").close()
+
+        next_offset = self.offset
+        pending: dict[int, asyncio.Task] = {}
+        try:
+            while not self.finished:
+                while len(pending) < self.max_in_flight:
+                    pending[next_offset] = asyncio.create_task(self.fetch_batch(next_offset))
+                    next_offset += self.batch_size
+                # пачки записываются строго по порядку смещений, чтобы контрольная точка была непрерывной
+                results = await pending.pop(self.offset)
+                self.finished = await self.write_batch(results)
+        finally:
+            for task in pending.values():
+                task.cancel()
+            await asyncio.gather(*pending.values(), return_exceptions=True)
+
+        os.remove(self.checkpoint_path)
+        return self.saved
+
+
+def build_url(post: dict) -> str:
+    """
+    Построить URL из данных поста
+    :param post: данные поста
+    :return: строка с URL поста
+    """
+    return str(Url(scheme="https", host="vk.com", path=f"wall{post['owner_id']}_{post['id']}"))
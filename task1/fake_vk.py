@@ -0,0 +1,64 @@
+"""
+Локальный сервер, имитирующий VK API для проверки сборщика постов без доступа к сети.
+
+Запуск: uvicorn task1.fake_vk:app --port 8001
+Затем: VK_API_URL=http://127.0.0.1:8001/method/ ACCESS_TOKEN=fake python -m task1.task1
+
+Переменные окружения:
+FAKE_VK_POSTS - количество постов на стене (по умолчанию 1000),
+FAKE_VK_ERROR_RATE - доля запросов, на которые отвечать ошибкой "слишком много запросов" (по умолчанию 0),
+ошибки распределяются по запросам равномерно и без случайности, например, при 0.5 - каждый второй запрос.
+
+Количество запросов execute, ответов с ошибкой и вызовов wall.get доступно в `stats`.
+"""
+import math
+import os
+import random
+import re
+from collections import Counter
+from urllib.parse import parse_qs
+
+from fastapi import FastAPI, Request
+
+app = FastAPI()
+
+WALL_GET_PATTERN = re.compile(r'"owner_id":(-?\d+),"offset":(\d+),"count":(\d+)')
+WORDS = ["книга", "чужой", "кровь", "дом", "город", "читать", "новый", "старый", "история", "время"]
+
+stats = Counter()
+
+
+def make_post(owner_id: int, number: int) -> dict:
+    rnd = random.Random(number)
+    # каждый третий пост короткий и должен отфильтроваться по минимальной длине
+    length = 50 if number % 3 == 0 else 300
+    return {
+        "id": 1_000_000 - number,
+        "owner_id": owner_id,
+        "text": " ".join(rnd.choices(WORDS, k=length)),
+    }
+
+
+def wall_get(owner_id: int, offset: int, count: int) -> dict:
+    total = int(os.getenv("FAKE_VK_POSTS") or 1000)
+    return {"count": total, "items": [make_post(owner_id, i) for i in range(offset, min(offset + count, total))]}
+
+
+@app.get("/method/account.getAppPermissions")
+def get_app_permissions():
+    return {"response": 1}
+
+
+@app.post("/method/execute")
+async def execute(request: Request):
+    error_rate = float(os.getenv("FAKE_VK_ERROR_RATE") or 0)
+    number = stats["requests"]
+    stats["requests"] += 1
+    # ошибкой отвечает запрос, на котором накопленная доля ошибок переходит через целое число
+    if math.floor((number + 1) * error_rate) > math.floor(number * error_rate):
+        stats["errors"] += 1
+        return {"error": {"error_code": 6, "error_msg": "Too many requests per second"}}
+    code = parse_qs((await request.body()).decode("utf8")).get("code", [""])[0]
+    calls = WALL_GET_PATTERN.findall(code)
+    stats["wall_get"] += len(calls)
+    return {"response": [wall_get(int(owner_id), int(offset), int(count)) for owner_id, offset, count in calls]}
@@ -1,9 +1,14 @@
-import json
+import asyncio
 import os
 import shutil
 
-from httpx import Client
-from urllib3.util import Url
+from httpx import AsyncClient
+
+from common.lemmatizer import init_lemmatizer
+from common.segments import init_segment_index
+from task1.crawler import WallCrawler
+
+VK_API_URL = "https://api.vk.com/method/"
 
 
 def prevalidate_env_variables():
@@ -12,12 +17,11 @@ def prevalidate_env_variables():
     assert os.getenv("POSTS_DIR_PATH"), "Укажите путь для папки и архива в переменную окружения POSTS_DIR_PATH"
 
 
-def initialize_api() -> Client:
+def get_token() -> str:
     """
-    Иницализация клиента httpx для VK API
-    :return: кортеж состоящий из клиента и токена доступа
+    Получить токен доступа из переменной окружения ACCESS_TOKEN или у пользователя
+    :return: токен доступа
     """
-
     if not (token := os.getenv("ACCESS_TOKEN")):
         print("Перейдите` по ссылке:")
         print(
@@ -35,69 +39,21 @@ def initialize_api() -> Client:
                 "Подставьте значение access_token из командной строки. "
                 "Чтобы не выполнять эту операцию, сохраните его в переменную окружения ACCESS_TOKEN"
             )
+    return token
 
-    client = Client(base_url="https://api.vk.com/method/", params={"access_token": token, "v": "5.131"})
-    assert client.get("account.getAppPermissions").json().get("response"), "Invalid token"
-    return client
 
-
-def fetch_posts(client: Client, group_id: str, count: int = 100, min_length: int = 1000) -> list[dict]:
-    """
-    Запрос постов группы вк
-    :param client: клиент вк с настроенными доступами
-    :param group_id: идентификатор группы
-    :param count: итоговое количество постов
-    :param min_length: минимальная длинна текста в записи
-    :return: список элементов структуры `Запись на стене <https://dev.vk.com/reference/objects/post>`_
+async def initialize_async_api() -> AsyncClient:
     """
-    posts = []
-    offset = 0
-    while len(posts) < count:
-        response = client.get(
-            url='wall.get',
-            params={
-                "owner_id": group_id,
-                "offset": offset,
-                "count": 100
-            }
-        ).json()
-        for post in response['response']['items']:
-            if len(post['text']) >= min_length:
-                posts.append(post)
-        offset += 100
-
-    return posts[:100]
-
-
-def __build_url(post: dict) -> Url:
-    """
-    Построить URL из данных поста
-    :param post: данные поста
-    :return: объект `urllib3.util.Url` с URL поста
-    """
-    return Url(scheme="https", host="vk.com", path=f"wall{post['owner_id']}_{post['id']}")
-
-
-def generate_directory(dir_path: str, posts: list[dict], index_path: str = "./index.txt"):
-    """
-    Сгенерировать директорию с текстовыми файлами постов
-    :param dir_path: путь до директории
-    :param posts: список постов
-    :param index_path: путь до index файла
+    Иницализация асинхронного клиента httpx для VK API. Адрес API можно переопределить
+    переменной окружения VK_API_URL, например, для локального тестового сервера.
+    :return: асинхронный клиент с настроенными доступами
     """
-    if not os.path.isdir(dir_path):
-        os.mkdir(dir_path)
-    indexes = []
-    for post in posts:
-        post_path = f"{post['id']}.txt"
-        post_url = str(__build_url(post))
-
-        with open(os.path.join(dir_path, post_path), "w", encoding="utf8") as post_file:
-            post_file.write(post["text"])
-        indexes.append("\t".join((post_path, post_url)) + "\n")
-
-    with open(index_path, "w", encoding="utf8") as index:
-        index.writelines(indexes)
+    client = AsyncClient(
+        base_url=os.getenv("VK_API_URL") or VK_API_URL, params={"access_token": get_token(), "v": "5.131"}, timeout=30
+    )
+    response = await client.get("account.getAppPermissions")
+    assert response.json().get("response"), "Invalid token"
+    return client
 
 
 def archive_directory(dir_path: str) -> None:
@@ -109,13 +65,43 @@ def archive_directory(dir_path: str) -> None:
     shutil.rmtree(dir_path)
 
 
+async def crawl(dir_path: str, count: int, on_batch=None) -> int:
+    """
+    Собрать посты асинхронным сборщиком с сохранением на диск по мере получения
+    :param dir_path: путь до директории для постов
+    :param count: итоговое количество постов
+    :param on_batch: функция, получающая сохраненные посты каждой пачки
+    :return: количество сохраненных постов
+    """
+    client = await initialize_async_api()
+    try:
+        crawler = WallCrawler(
+            client, owner_id=os.getenv("GROUP_ID"), dir_path=dir_path, count=count, on_batch=on_batch
+        )
+        return await crawler.run()
+    finally:
+        await client.aclose()
+
+
 def main():
     prevalidate_env_variables()
-    client = initialize_api()
-    posts = fetch_posts(client, group_id=os.getenv("GROUP_ID"))
     dir_path = os.getenv("POSTS_DIR_PATH")
-    generate_directory(dir_path, posts)
+
+    # новые посты сразу попадают в отдельный сегмент инкрементального индекса, если задан SEGMENTS_PATH
+    on_batch = None
+    segment_index = init_segment_index()
+    if segment_index is not None:
+        lemmatizer = init_lemmatizer()
+
+        def on_batch(posts: list[tuple[str, str, str]]):
+            segment_index.add_documents(posts, lemmatizer)
+
+    saved = asyncio.run(crawl(dir_path, count=int(os.getenv("POSTS_COUNT") or 100), on_batch=on_batch))
+    print(f"Сохранено постов: {saved}")
     archive_directory(dir_path)
+    if segment_index is not None:
+        segment_index.close()
+        lemmatizer.save()
 
 
 if __name__ == '__main__':
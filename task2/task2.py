@@ -1,11 +1,12 @@
 import os
-import re
-import shutil
-import zipfile
 from collections import defaultdict
 
 from pymorphy2 import MorphAnalyzer
-from pymorphy2.analyzer import Parse
+
+from common.documents import open_documents
+from common.lemmatizer import Lemmatizer, init_lemmatizer, preprocess_text
+from common.metrics import lemmatizer_collector, metrics, profiling
+from common.vocabulary import init_vocabulary
 
 
 def prevalidate_env_variables():
@@ -22,63 +23,15 @@ def init_morph() -> MorphAnalyzer:
     return MorphAnalyzer()
 
 
-def extract_archive(dir_path: str):
-    """
-    Разархивировать архмв
-    :param dir_path: путь до архива без расширения
-    """
-    if not os.path.isdir(dir_path):
-        os.mkdir(dir_path)
-    with zipfile.ZipFile(f"{dir_path}.zip", "r") as zip_ref:
-        zip_ref.extractall(dir_path)
-
-
-def concat_all_files(dir_path: str) -> str:
-    """
-    Объединить текст всех .txt файлов в директории
-    :param dir_path: директория с файлами
-    :return: строка сконкатенированных файлов
-    """
-    texts = []
-    for file in os.listdir(dir_path):
-        if file.endswith(".txt"):
-            texts.append(open(os.path.join(dir_path, file), "r", encoding="utf8").read())
-
-    return "\n".join(texts)
-
-
-def clear(dir_path):
-    shutil.rmtree(dir_path)
-
-
-def preprocess_text(text: str) -> str:
-    pattern = re.compile(r"[^А-Яа-я ]")
-    return re.sub(pattern, ' ', text)
-
-
-def tokenize(text: str, morph: MorphAnalyzer) -> dict[str, set[str]]:
-    tokens_dict = defaultdict(set)
+def tokenize(
+        text: str, lemmatizer: Lemmatizer, tokens_dict: dict[str, set[str]] | None = None
+) -> dict[str, set[str]]:
+    tokens_dict = defaultdict(set) if tokens_dict is None else tokens_dict
 
     words = text.split()
     for word in words:
-        token: Parse = morph.parse(word)[0]
-
-        bad = False
-        for bad_grammeme in [
-            "PREP",  # предлог
-            "CONJ",  # союз
-            "NUMB",  # число
-            "NUMR",  # числительное
-            "LATN",  # не кириллица
-            "PNCT",  # пунктуация
-            "ROMN",  # римское число
-            "UNKN",  # неизвестное слово
-        ]:
-            if bad_grammeme in token.tag:
-                bad = True
-                break
-
-        if bad:
+        token = lemmatizer.parse(word)
+        if not token.keep:
             continue
 
         tokens_dict[token.normal_form].add(token.word)
@@ -97,14 +50,22 @@ def main():
     prevalidate_env_variables()
     dir_path = os.getenv('POSTS_DIR_PATH')
 
-    morph = init_morph()
-    extract_archive(dir_path)
-    text = concat_all_files(dir_path)
-    text = preprocess_text(text)
-    tokens_dict = tokenize(text=text, morph=morph)
-    write_tokens(os.getenv("TOKENS_PATH"), os.getenv("LEMMES_PATH"), tokens_dict)
-    clear(dir_path)
+    lemmatizer = init_lemmatizer(init_morph())
+    metrics.collect(lemmatizer_collector(lemmatizer), "counter")
+    tokens_dict = defaultdict(set)
+    for _, text in open_documents(dir_path):
+        with metrics.stage("clean"):
+            text = preprocess_text(text)
+        with metrics.stage("lemmatize"):
+            tokenize(text=text, lemmatizer=lemmatizer, tokens_dict=tokens_dict)
+    with metrics.stage("write"):
+        write_tokens(os.getenv("TOKENS_PATH"), os.getenv("LEMMES_PATH"), tokens_dict)
+    with metrics.stage("vocabulary"):
+        init_vocabulary(tokens_dict)
+    lemmatizer.save()
+    print(lemmatizer.stats())
 
 
 if __name__ == '__main__':
-    main()
+    with profiling():
+        main()
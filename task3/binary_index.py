@@ -0,0 +1,212 @@
+"""
+Бинарный формат инвертированного индекса.
+
+Структура файла (little-endian):
+
+* заголовок: сигнатура ``RIDX``, версия, количество документов, количество терминов,
+  смещения словаря терминов, списков документов и блока строк;
+* таблица документов: для каждого идентификатора документа смещение и длины имени файла и URL в блоке строк;
+* словарь терминов: отсортированные по термину записи фиксированной длины -
+  смещение и длина термина в блоке строк, смещение и длина списка документов, количество документов;
+* списки документов: отсортированные идентификаторы документов, закодированные разностями в varint;
+* блок строк в utf8.
+
+Файл отображается в память, при открытии читается только заголовок,
+списки документов декодируются только для терминов из запроса.
+"""
+import mmap
+import os
+import struct
+from collections.abc import Mapping
+from typing import Iterator
+
+MAGIC = b"RIDX"
+VERSION = 1
+
+HEADER = struct.Struct("<4sIIIQQQ")
+DOC_ENTRY = struct.Struct("<QHH")
+TERM_ENTRY = struct.Struct("<QHQII")
+
+
+def encode_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def encode_postings(doc_ids: list[int]) -> bytes:
+    """
+    Закодировать отсортированный список идентификаторов разностями в varint
+
+    :param doc_ids: отсортированные идентификаторы документов
+    :return: закодированный список
+    """
+    out = bytearray()
+    previous = 0
+    for doc_id in doc_ids:
+        encode_varint(doc_id - previous, out)
+        previous = doc_id
+
+    return bytes(out)
+
+
+def decode_postings(data: bytes | memoryview, count: int) -> list[int]:
+    """
+    Декодировать список идентификаторов документов
+
+    :param data: закодированный список
+    :param count: количество документов в списке
+    :return: отсортированные идентификаторы документов
+    """
+    doc_ids = []
+    doc_id = shift = delta = 0
+    for byte in data:
+        delta |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        doc_id += delta
+        doc_ids.append(doc_id)
+        if len(doc_ids) == count:
+            break
+        delta = shift = 0
+
+    return doc_ids
+
+
+def write_binary_index(index_path: str, index: dict[str, dict[str, set | int]], urls: dict[str, str] | None = None):
+    """
+    Записать индекс в бинарном формате
+
+    :param index_path: путь до файла индекса
+    :param index: инвертированный индекс термин -> {"documents": множество файлов, "count": количество}
+    :param urls: словарь файл -> URL документа
+    """
+    urls = urls or {}
+    docs = sorted({doc for value in index.values() for doc in value["documents"]})
+    doc_ids = {doc: i for i, doc in enumerate(docs)}
+
+    strings = bytearray()
+    doc_entries = bytearray()
+    for doc in docs:
+        name, url = doc.encode("utf8"), urls.get(doc, "").encode("utf8")
+        doc_entries += DOC_ENTRY.pack(len(strings), len(name), len(url))
+        strings += name + url
+
+    postings = bytearray()
+    term_entries = bytearray()
+    for term in sorted(index):
+        encoded_term = term.encode("utf8")
+        encoded_postings = encode_postings(sorted(doc_ids[doc] for doc in index[term]["documents"]))
+        term_entries += TERM_ENTRY.pack(
+            len(strings), len(encoded_term), len(postings), len(encoded_postings), len(index[term]["documents"])
+        )
+        strings += encoded_term
+        postings += encoded_postings
+
+    docs_offset = HEADER.size
+    terms_offset = docs_offset + len(doc_entries)
+    postings_offset = terms_offset + len(term_entries)
+    strings_offset = postings_offset + len(postings)
+    # файл заменяется атомарно: после сбоя записи остается прежний индекс, а не обрезанный файл с сигнатурой
+    with open(f"{index_path}.tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(docs), len(index), terms_offset, postings_offset, strings_offset))
+        f.write(doc_entries)
+        f.write(term_entries)
+        f.write(postings)
+        f.write(strings)
+    os.replace(f"{index_path}.tmp", index_path)
+
+
+def is_binary_index(index_path: str) -> bool:
+    with open(index_path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class BinaryIndex(Mapping):
+    """
+    Индекс, отображенный в память. Поддерживает интерфейс словаря термин -> {"documents", "count"},
+    как индекс, загруженный из JSON.
+    """
+
+    def __init__(self, index_path: str):
+        with open(index_path, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.docs_count, self.terms_count, self.terms_offset, self.postings_offset, self.strings_offset = (
+            HEADER.unpack_from(self.buffer, 0)
+        )
+        assert magic == MAGIC and version == VERSION, "Неподдерживаемый формат индекса"
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self.strings_offset + offset
+        return self.buffer[start:start + length].decode("utf8")
+
+    def _term_entry(self, position: int) -> tuple[int, int, int, int, int]:
+        return TERM_ENTRY.unpack_from(self.buffer, self.terms_offset + position * TERM_ENTRY.size)
+
+    def _term(self, position: int) -> str:
+        term_offset, term_length, *_ = self._term_entry(position)
+        return self._string(term_offset, term_length)
+
+    def find(self, term: str) -> int | None:
+        """
+        Найти позицию термина в словаре бинарным поиском
+
+        :param term: термин
+        :return: позиция термина или `None`
+        """
+        low, high = 0, self.terms_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < term:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.terms_count and self._term(low) == term:
+            return low
+        return None
+
+    def doc_ids(self, term: str) -> list[int]:
+        """
+        Получить отсортированные идентификаторы документов термина
+
+        :param term: термин
+        :return: список идентификаторов, пустой, если термина нет в индексе
+        """
+        if (position := self.find(term)) is None:
+            return []
+        _, _, postings_offset, postings_length, count = self._term_entry(position)
+        start = self.postings_offset + postings_offset
+        return decode_postings(self.buffer[start:start + postings_length], count)
+
+    def count(self, term: str) -> int:
+        if (position := self.find(term)) is None:
+            return 0
+        return self._term_entry(position)[4]
+
+    def doc_name(self, doc_id: int) -> str:
+        offset, name_length, _ = DOC_ENTRY.unpack_from(self.buffer, HEADER.size + doc_id * DOC_ENTRY.size)
+        return self._string(offset, name_length)
+
+    def doc_url(self, doc_id: int) -> str:
+        offset, name_length, url_length = DOC_ENTRY.unpack_from(self.buffer, HEADER.size + doc_id * DOC_ENTRY.size)
+        return self._string(offset + name_length, url_length)
+
+    def doc_names(self) -> list[str]:
+        return [self.doc_name(doc_id) for doc_id in range(self.docs_count)]
+
+    def __getitem__(self, term: str) -> dict[str, set | int]:
+        doc_ids = self.doc_ids(term)
+        if not doc_ids:
+            raise KeyError(term)
+        return {"documents": {self.doc_name(doc_id) for doc_id in doc_ids}, "count": len(doc_ids)}
+
+    def __contains__(self, term: object) -> bool:
+        return isinstance(term, str) and self.find(term) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return (self._term(position) for position in range(self.terms_count))
+
+    def __len__(self) -> int:
+        return self.terms_count
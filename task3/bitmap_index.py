@@ -0,0 +1,134 @@
+"""
+Индекс со списками документов в виде битовых карт.
+
+Документам присваиваются плотные целочисленные идентификаторы, список документов термина хранится
+как целое число Python произвольной точности, где бит `i` установлен, если термин встречается в документе `i`.
+Операции AND/OR/NOT выполняются побитово над машинными словами.
+"""
+from collections.abc import Mapping
+from typing import Iterable, Iterator
+
+
+def bitmap_from_ids(doc_ids: Iterable[int]) -> int:
+    """
+    Построить битовую карту по идентификаторам документов
+
+    :param doc_ids: идентификаторы документов
+    :return: битовая карта
+    """
+    doc_ids = list(doc_ids)
+    if not doc_ids:
+        return 0
+    buffer = bytearray(max(doc_ids) // 8 + 1)
+    for doc_id in doc_ids:
+        buffer[doc_id >> 3] |= 1 << (doc_id & 7)
+
+    return int.from_bytes(buffer, "little")
+
+
+def ids_from_bitmap(bitmap: int) -> list[int]:
+    """
+    Получить отсортированные идентификаторы документов из битовой карты
+
+    :param bitmap: битовая карта
+    :return: список идентификаторов
+    """
+    bits = format(bitmap, "b")[::-1]
+    doc_ids = []
+    position = bits.find("1")
+    while position != -1:
+        doc_ids.append(position)
+        position = bits.find("1", position + 1)
+
+    return doc_ids
+
+
+class BitmapIndex(Mapping):
+    """
+    Инвертированный индекс на битовых картах. Поддерживает интерфейс словаря термин -> {"documents", "count"},
+    поэтому записывается теми же функциями, что и индекс из словарей.
+    """
+
+    def __init__(self):
+        self.docs: list[str] = []
+        self.doc_ids: dict[str, int] = {}
+        self.bitmaps: dict[str, int] = {}
+        self.all_docs = 0
+        self._pending: dict[str, list[int]] = {}
+
+    def _doc_id(self, doc: str) -> int:
+        doc_id = self.doc_ids.setdefault(doc, len(self.docs))
+        if doc_id == len(self.docs):
+            self.docs.append(doc)
+        return doc_id
+
+    def finalize(self) -> "BitmapIndex":
+        """
+        Перевести накопленные списки документов в битовые карты.
+        Термины упорядочиваются по количеству документов, как в `get_inverted_index`.
+
+        :return: этот же индекс
+        """
+        for lemme, doc_ids in self._pending.items():
+            self.bitmaps[lemme] = self.bitmaps.get(lemme, 0) | bitmap_from_ids(doc_ids)
+        self._pending = {}
+        self.bitmaps = dict(sorted(self.bitmaps.items(), key=lambda item: item[1].bit_count()))
+        # как и get_all_docs - только документы, в которых есть хотя бы один термин
+        self.all_docs = 0
+        for bitmap in self.bitmaps.values():
+            self.all_docs |= bitmap
+        return self
+
+    @classmethod
+    def from_postings(cls, docs: list[str], postings: dict[str, list[str]]) -> "BitmapIndex":
+        """
+        Построить индекс на битовых картах из списков документов
+
+        :param docs: все документы, идентификаторы присваиваются в этом порядке
+        :param postings: словарь лемма -> документы
+        :return: объект `BitmapIndex`
+        """
+        bitmap_index = cls()
+        for doc in docs:
+            bitmap_index._doc_id(doc)
+        for lemme, lemme_docs in postings.items():
+            bitmap_index._pending[lemme] = [bitmap_index.doc_ids[doc] for doc in lemme_docs]
+
+        return bitmap_index.finalize()
+
+    @classmethod
+    def from_index(cls, index: Mapping[str, dict[str, set | int]]) -> "BitmapIndex":
+        """
+        Построить индекс на битовых картах из индекса со множествами документов
+
+        :param index: индекс термин -> {"documents", "count"}
+        :return: объект `BitmapIndex`
+        """
+        bitmap_index = cls()
+        for lemme, value in index.items():
+            for doc in value["documents"]:
+                bitmap_index._pending.setdefault(lemme, []).append(bitmap_index._doc_id(doc))
+
+        return bitmap_index.finalize()
+
+    def bitmap(self, lemme: str) -> int:
+        return self.bitmaps.get(lemme, 0)
+
+    def count(self, lemme: str) -> int:
+        return self.bitmap(lemme).bit_count()
+
+    def documents(self, bitmap: int) -> set[str]:
+        return {self.docs[doc_id] for doc_id in ids_from_bitmap(bitmap)}
+
+    def __getitem__(self, lemme: str) -> dict[str, set | int]:
+        bitmap = self.bitmaps[lemme]
+        return {"documents": self.documents(bitmap), "count": bitmap.bit_count()}
+
+    def __contains__(self, lemme: object) -> bool:
+        return lemme in self.bitmaps
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.bitmaps)
+
+    def __len__(self) -> int:
+        return len(self.bitmaps)
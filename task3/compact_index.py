@@ -0,0 +1,122 @@
+"""
+Компактный инвертированный индекс в памяти.
+
+Индекс из JSON хранит на каждый термин словарь и множество строк с именами файлов, поэтому на миллионе
+документов накладные расходы объектов Python занимают больше памяти, чем сами данные. Здесь имя каждого
+документа хранится один раз, документы термина - целые идентификаторы в одном общем буфере NumPy (int32),
+а запись термина - объект со `__slots__` со смещением и длиной своего участка буфера. Термины интернируются.
+
+Индекс поддерживает интерфейс словаря термин -> {"documents", "count"} и методы `BinaryIndex`,
+поэтому движок запросов работает с ним по идентификаторам документов, как с бинарным индексом.
+"""
+import json
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import Iterable, Iterator
+
+import numpy as np
+
+
+class TermPostings:
+    """
+    Участок общего буфера с документами термина
+    """
+
+    __slots__ = ("start", "count")
+
+    def __init__(self, start: int, count: int):
+        self.start = start
+        self.count = count
+
+
+class CompactIndex(Mapping):
+    def __init__(self, docs: list[str], terms: dict[str, TermPostings], postings: np.ndarray):
+        """
+        :param docs: имена документов, идентификатор документа - позиция в списке
+        :param terms: термин -> участок буфера
+        :param postings: отсортированные внутри термина идентификаторы документов всех терминов подряд
+        """
+        self.docs = docs
+        self.docs_count = len(docs)
+        self.terms = terms
+        self.postings = postings
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple[str, Iterable[str]]]) -> "CompactIndex":
+        """
+        Построить индекс из пар термин, документы, не храня множеств имен документов
+
+        :param rows: пары термин, имена документов термина
+        :return: объект `CompactIndex`
+        """
+        docs, doc_ids, terms = [], {}, {}
+        postings = array("i")
+        for term, documents in rows:
+            ids = []
+            for doc in documents:
+                if (doc_id := doc_ids.get(doc)) is None:
+                    doc_id = doc_ids[doc] = len(docs)
+                    docs.append(doc)
+                ids.append(doc_id)
+            ids.sort()
+            terms[sys.intern(term)] = TermPostings(len(postings), len(ids))
+            postings.extend(ids)
+
+        # буфер array передается в NumPy без копирования
+        return cls(docs, terms, np.frombuffer(postings, dtype=np.int32))
+
+    @classmethod
+    def from_json(cls, index_path: str) -> "CompactIndex":
+        """
+        Загрузить индекс из JSON task3 построчно
+
+        :param index_path: путь до файла индекса
+        :return: объект `CompactIndex`
+        """
+        with open(index_path, "r", encoding="utf8") as f:
+            return cls.from_rows((data["word"], data["documents"]) for data in map(json.loads, f) if data)
+
+    @classmethod
+    def from_index(cls, index: Mapping[str, dict[str, set | int]]) -> "CompactIndex":
+        """
+        Построить индекс из индекса со множествами документов
+
+        :param index: индекс термин -> {"documents", "count"}
+        :return: объект `CompactIndex`
+        """
+        return cls.from_rows((term, value["documents"]) for term, value in index.items())
+
+    def term_postings(self, term: str) -> np.ndarray:
+        """
+        Получить документы термина представлением буфера без копирования
+        """
+        if (record := self.terms.get(term)) is None:
+            return self.postings[:0]
+        return self.postings[record.start:record.start + record.count]
+
+    def doc_ids(self, term: str) -> list[int]:
+        return self.term_postings(term).tolist()
+
+    def count(self, term: str) -> int:
+        record = self.terms.get(term)
+        return record.count if record is not None else 0
+
+    def doc_name(self, doc_id: int) -> str:
+        return self.docs[doc_id]
+
+    def doc_names(self) -> list[str]:
+        return self.docs
+
+    def __getitem__(self, term: str) -> dict[str, set | int]:
+        record = self.terms[term]
+        return {"documents": {self.docs[doc_id] for doc_id in self.doc_ids(term)}, "count": record.count}
+
+    def __contains__(self, term: object) -> bool:
+        return term in self.terms
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.terms)
+
+    def __len__(self) -> int:
+        return len(self.terms)
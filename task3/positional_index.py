@@ -0,0 +1,229 @@
+"""
+Позиционный индекс для фразовых запросов и запросов с NEAR.
+
+Позиция леммы - ее номер среди значимых лемм документа (служебные слова пропускаются, как и при построении
+инвертированного индекса). Индекс необязателен: булев поиск без фраз его не читает.
+
+Структура файла (little-endian):
+
+* заголовок: сигнатура ``RPOS``, версия, количество документов, количество терминов,
+  смещения словаря терминов, блока позиций и блока строк;
+* таблица документов: смещение и длина имени файла в блоке строк, документы отсортированы по имени;
+* словарь терминов: отсортированные по термину записи того же вида, что и в ``RIDX`` - смещение и длина
+  термина в блоке строк, смещение и длина блока термина, количество документов;
+* блок термина: длина списка документов (varint), идентификаторы документов разностями в varint,
+  длина в байтах и количество позиций для каждого документа (varint), списки позиций разностями в varint;
+* блок строк в utf8.
+
+Файл отображается в память. Для термина сначала декодируются только документы и длины списков позиций,
+сами позиции декодируются для тех документов, которые остались после пересечения списков документов.
+"""
+import mmap
+import os
+import struct
+from bisect import bisect_left
+
+from task3.binary_index import decode_postings, encode_postings, encode_varint
+
+MAGIC = b"RPOS"
+VERSION = 2
+
+HEADER = struct.Struct("<4sIIIQQQ")
+DOC_ENTRY = struct.Struct("<QH")
+TERM_ENTRY = struct.Struct("<QHQII")
+
+
+def document_positions(lemmes: list[str]) -> dict[str, list[int]]:
+    """
+    Собрать позиции лемм документа
+
+    :param lemmes: значимые леммы документа в порядке следования
+    :return: словарь лемма -> возрастающие позиции
+    """
+    positions = {}
+    for position, lemme in enumerate(lemmes):
+        positions.setdefault(lemme, []).append(position)
+
+    return positions
+
+
+def merge_positions(partial_positions: list[dict[str, dict[str, list[int]]]]) -> dict[str, dict[str, list[int]]]:
+    """
+    Объединить частичные позиционные индексы шардов в порядке шардов
+
+    :param partial_positions: частичные индексы лемма -> {файл: позиции}
+    :return: словарь лемма -> {файл: позиции}
+    """
+    positions = {}
+    for shard_positions in partial_positions:
+        for lemme, docs in shard_positions.items():
+            positions.setdefault(lemme, {}).update(docs)
+
+    return positions
+
+
+def write_positional_index(index_path: str, positions: dict[str, dict[str, list[int]]]):
+    """
+    Записать позиционный индекс
+
+    :param index_path: путь до файла
+    :param positions: словарь лемма -> {файл: позиции}
+    """
+    docs = sorted({doc for lemme_docs in positions.values() for doc in lemme_docs})
+    doc_ids = {doc: i for i, doc in enumerate(docs)}
+
+    strings = bytearray()
+    doc_entries = bytearray()
+    for doc in docs:
+        name = doc.encode("utf8")
+        doc_entries += DOC_ENTRY.pack(len(strings), len(name))
+        strings += name
+
+    data = bytearray()
+    term_entries = bytearray()
+    for term in sorted(positions):
+        lemme_docs = sorted(positions[term].items(), key=lambda item: doc_ids[item[0]])
+        encoded_docs = encode_postings([doc_ids[doc] for doc, _ in lemme_docs])
+        encoded_positions = [encode_postings(doc_positions) for _, doc_positions in lemme_docs]
+
+        block = bytearray()
+        encode_varint(len(encoded_docs), block)
+        block += encoded_docs
+        for encoded, (_, doc_positions) in zip(encoded_positions, lemme_docs):
+            encode_varint(len(encoded), block)
+            encode_varint(len(doc_positions), block)
+        for encoded in encoded_positions:
+            block += encoded
+
+        encoded_term = term.encode("utf8")
+        term_entries += TERM_ENTRY.pack(len(strings), len(encoded_term), len(data), len(block), len(lemme_docs))
+        strings += encoded_term
+        data += block
+
+    terms_offset = HEADER.size + len(doc_entries)
+    data_offset = terms_offset + len(term_entries)
+    strings_offset = data_offset + len(data)
+    with open(f"{index_path}.tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(docs), len(positions), terms_offset, data_offset, strings_offset))
+        f.write(doc_entries)
+        f.write(term_entries)
+        f.write(data)
+        f.write(strings)
+    os.replace(f"{index_path}.tmp", index_path)
+
+
+def _read_varint(buffer: bytes | memoryview, offset: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = buffer[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+class TermPositions:
+    """
+    Документы термина с ленивым декодированием позиций по документу
+    """
+
+    def __init__(self, buffer: mmap.mmap, start: int, count: int):
+        docs_length, offset = _read_varint(buffer, start)
+        self.buffer = buffer
+        self.doc_ids = decode_postings(buffer[offset:offset + docs_length], count)
+        offset += docs_length
+        self.offsets = []
+        lengths = []
+        for _ in range(count):
+            length, offset = _read_varint(buffer, offset)
+            positions_count, offset = _read_varint(buffer, offset)
+            lengths.append((length, positions_count))
+        for length, positions_count in lengths:
+            self.offsets.append((offset, length, positions_count))
+            offset += length
+
+    def positions(self, doc_id: int) -> list[int]:
+        """
+        Получить позиции термина в документе
+
+        :param doc_id: идентификатор документа позиционного индекса
+        :return: возрастающие позиции, пустой список, если термина нет в документе
+        """
+        i = bisect_left(self.doc_ids, doc_id)
+        if i == len(self.doc_ids) or self.doc_ids[i] != doc_id:
+            return []
+        offset, length, count = self.offsets[i]
+        return decode_postings(self.buffer[offset:offset + length], count)
+
+
+class PositionalIndex:
+    """
+    Позиционный индекс, отображенный в память. При открытии читается только заголовок.
+    """
+
+    def __init__(self, index_path: str):
+        with open(index_path, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.docs_count, self.terms_count, self.terms_offset, self.data_offset, self.strings_offset = (
+            HEADER.unpack_from(self.buffer, 0)
+        )
+        assert magic == MAGIC and version == VERSION, "Неподдерживаемый формат позиционного индекса"
+        self._doc_ids: dict[str, int] | None = None
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self.strings_offset + offset
+        return self.buffer[start:start + length].decode("utf8")
+
+    def _term_entry(self, position: int) -> tuple[int, int, int, int, int]:
+        return TERM_ENTRY.unpack_from(self.buffer, self.terms_offset + position * TERM_ENTRY.size)
+
+    def _term(self, position: int) -> str:
+        term_offset, term_length, *_ = self._term_entry(position)
+        return self._string(term_offset, term_length)
+
+    def find(self, term: str) -> int | None:
+        low, high = 0, self.terms_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < term:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.terms_count and self._term(low) == term:
+            return low
+        return None
+
+    def doc_id(self, doc: str) -> int | None:
+        """
+        Получить идентификатор документа по имени файла, таблица документов читается при первом вызове
+        """
+        if self._doc_ids is None:
+            self._doc_ids = {}
+            for doc_id in range(self.docs_count):
+                offset, length = DOC_ENTRY.unpack_from(self.buffer, HEADER.size + doc_id * DOC_ENTRY.size)
+                self._doc_ids[self._string(offset, length)] = doc_id
+        return self._doc_ids.get(doc)
+
+    def term(self, term: str) -> TermPositions | None:
+        """
+        Получить документы термина с ленивыми позициями
+
+        :param term: термин
+        :return: объект `TermPositions` или `None`, если термина нет в индексе
+        """
+        if (position := self.find(term)) is None:
+            return None
+        _, _, data_offset, _, count = self._term_entry(position)
+        return TermPositions(self.buffer, self.data_offset + data_offset, count)
+
+
+def load_positional_index(index_path: str | None = None) -> PositionalIndex | None:
+    """
+    Открыть позиционный индекс по пути из переменной окружения POSITIONS_PATH
+
+    :param index_path: путь до файла
+    :return: объект `PositionalIndex` или None, если индекс не собран
+    """
+    index_path = index_path or os.getenv("POSITIONS_PATH")
+    return PositionalIndex(index_path) if index_path and os.path.isfile(index_path) else None
@@ -0,0 +1,367 @@
+"""
+Разбор и выполнение булевых запросов.
+
+Запрос один раз разбирается в дерево: OR из групп, каждая группа - AND из положительных и отрицательных терминов.
+Планировщик упорядочивает положительные термины по размеру списка документов, пересекает отсортированные
+списки с галопирующим поиском и вычитает отрицательные термины без построения множества всех документов,
+если в группе есть хотя бы один положительный термин.
+
+Фразы в кавычках и `слово NEAR/k слово` выполняются в два шага: сначала их леммы пересекаются
+как обычные термины группы, затем позиции проверяются только у оставшихся документов.
+"""
+import heapq
+import re
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Callable, NamedTuple
+
+from task3.binary_index import BinaryIndex
+from task3.bitmap_index import BitmapIndex, bitmap_from_ids, ids_from_bitmap
+from task3.compact_index import CompactIndex
+from task3.positional_index import PositionalIndex
+
+# индексы, в которых документы терминов - целые идентификаторы
+ID_INDEXES = (BinaryIndex, CompactIndex)
+
+TOKEN_PATTERN = re.compile(r'-*"[^"]*"?|\S+')
+NEAR_PATTERN = re.compile(r"NEAR/(\d+)")
+
+
+class Term(NamedTuple):
+    lemme: str
+
+
+class Phrase(NamedTuple):
+    lemmes: tuple[str, ...]
+
+
+class Near(NamedTuple):
+    left: str
+    right: str
+    distance: int
+
+
+Node = Term | Phrase | Near
+
+
+class And(NamedTuple):
+    positive: tuple[Node, ...]
+    negative: tuple[Node, ...]
+
+
+class Or(NamedTuple):
+    groups: tuple[And, ...]
+
+
+def node_lemmes(node: Node) -> tuple[str, ...]:
+    if isinstance(node, Term):
+        return node.lemme,
+    if isinstance(node, Phrase):
+        return node.lemmes
+    return node.left, node.right
+
+
+def parse_query(
+        query: str, normalize: Callable[[str], str], is_stop_word: Callable[[str], bool] | None = None
+) -> Or:
+    """
+    Разобрать запрос в дерево
+
+    :param query: поисковый запрос
+    :param normalize: функция, возвращающая лемму слова
+    :param is_stop_word: функция, определяющая служебные слова, они пропускаются внутри фраз,
+        как и при построении позиционного индекса
+    :return: корень дерева запроса
+    """
+    groups = []
+    for group in query.split("|"):
+        items: list[tuple[bool, Node]] = []
+        distance = None
+        for token in TOKEN_PATTERN.findall(group):
+            if near := NEAR_PATTERN.fullmatch(token):
+                # NEAR связывает два соседних положительных слова, иначе оператор пропускается
+                if items and not items[-1][0] and isinstance(items[-1][1], Term):
+                    distance = int(near.group(1))
+                continue
+
+            negative = token.startswith("-")
+            token = token.lstrip("-")
+            if token.startswith('"'):
+                words = [word for word in token.strip('"').split() if not (is_stop_word and is_stop_word(word))]
+                lemmes = tuple(normalize(word) for word in words)
+                if not lemmes:
+                    continue
+                node = Phrase(lemmes) if len(lemmes) > 1 else Term(lemmes[0])
+            elif token:
+                node = Term(normalize(token))
+            else:
+                continue
+
+            if distance is not None and not negative and isinstance(node, Term):
+                _, left = items.pop()
+                node = Near(left.lemme, node.lemme, distance)
+            distance = None
+            items.append((negative, node))
+
+        if items:
+            groups.append(And(
+                tuple(node for negative, node in items if not negative),
+                tuple(node for negative, node in items if negative),
+            ))
+
+    return Or(tuple(groups))
+
+
+def gallop(postings: list, value, low: int) -> int:
+    """
+    Найти позицию первого элемента не меньше `value`, начиная с `low`, экспоненциальным поиском
+
+    :param postings: отсортированный список
+    :param value: искомое значение
+    :param low: позиция, с которой начинается поиск
+    :return: позиция для вставки `value`
+    """
+    step = 1
+    high = low
+    while high < len(postings) and postings[high] < value:
+        low = high + 1
+        high += step
+        step *= 2
+
+    return bisect_left(postings, value, low, min(high, len(postings)))
+
+
+def intersect(short: list, long: list) -> list:
+    """
+    Пересечь отсортированные списки, галопируя по более длинному
+
+    :param short: отсортированный список
+    :param long: отсортированный список
+    :return: отсортированное пересечение
+    """
+    if len(short) > len(long):
+        short, long = long, short
+    result = []
+    position = 0
+    for value in short:
+        position = gallop(long, value, position)
+        if position == len(long):
+            break
+        if long[position] == value:
+            result.append(value)
+            position += 1
+
+    return result
+
+
+def difference(postings: list, excluded: list) -> list:
+    """
+    Вычесть из отсортированного списка другой отсортированный список
+
+    :param postings: отсортированный список
+    :param excluded: отсортированный список вычитаемых элементов
+    :return: отсортированная разность
+    """
+    result = []
+    position = 0
+    for value in postings:
+        position = gallop(excluded, value, position)
+        if position == len(excluded) or excluded[position] != value:
+            result.append(value)
+
+    return result
+
+
+def phrase_matches(positions: list[list[int]]) -> bool:
+    """
+    Проверить, что леммы идут подряд: есть позиция `p` первой леммы, для которой `p + i` - позиция `i`-й леммы
+
+    :param positions: возрастающие позиции лемм фразы в документе
+    :return: встречается ли фраза в документе
+    """
+    following = [set(lemme_positions) for lemme_positions in positions[1:]]
+    return any(all(start + i in lemme_positions for i, lemme_positions in enumerate(following, 1)) for start in positions[0])
+
+
+def near_matches(left: list[int], right: list[int], distance: int) -> bool:
+    """
+    Проверить, что леммы стоят на расстоянии не больше `distance` в любом порядке, одним проходом по спискам
+
+    :param left: возрастающие позиции первой леммы
+    :param right: возрастающие позиции второй леммы
+    :param distance: максимальное расстояние
+    :return: есть ли такая пара позиций
+    """
+    i = j = 0
+    while i < len(left) and j < len(right):
+        if abs(left[i] - right[j]) <= distance:
+            return True
+        if left[i] < right[j]:
+            i += 1
+        else:
+            j += 1
+
+    return False
+
+
+def union(postings_lists: list[list]) -> list:
+    result = []
+    for value in heapq.merge(*postings_lists):
+        if not result or result[-1] != value:
+            result.append(value)
+
+    return result
+
+
+class QueryEngine:
+    """
+    Выполнение запросов по индексу с кэшем списков документов и множества всех документов
+    """
+
+    def __init__(
+            self,
+            index: dict[str, dict[str, set | int]] | BinaryIndex | CompactIndex,
+            postings_cache_size: int = 4096,
+            positions: PositionalIndex | None = None,
+    ):
+        self.index = index
+        self.positions = positions
+        self._all_docs = None
+        self.postings = lru_cache(maxsize=postings_cache_size)(self._load_postings)
+        self.term_positions = lru_cache(maxsize=postings_cache_size)(self._load_term_positions)
+
+    def _load_postings(self, lemme: str) -> list:
+        if isinstance(self.index, ID_INDEXES):
+            return self.index.doc_ids(lemme)
+        return sorted(self.index[lemme]["documents"]) if lemme in self.index else []
+
+    def _load_term_positions(self, lemme: str):
+        return self.positions.term(lemme)
+
+    def doc_name(self, posting) -> str:
+        return self.index.doc_name(posting) if isinstance(self.index, ID_INDEXES) else posting
+
+    def matches(self, node: Phrase | Near, doc: str) -> bool:
+        """
+        Проверить фразу или NEAR по позициям лемм в документе
+        """
+        doc_id = self.positions.doc_id(doc)
+        if doc_id is None:
+            return False
+        positions = []
+        for lemme in node_lemmes(node):
+            if (term_positions := self.term_positions(lemme)) is None:
+                return False
+            positions.append(term_positions.positions(doc_id))
+        if isinstance(node, Phrase):
+            return phrase_matches(positions)
+        return near_matches(positions[0], positions[1], node.distance)
+
+    def filter_positions(self, node: Phrase | Near, postings: list) -> list:
+        """
+        Оставить документы, в которых выполняется фраза или NEAR
+
+        :param node: фраза или NEAR
+        :param postings: документы, в которых уже есть все леммы узла
+        :return: отфильтрованные документы в том же порядке
+        """
+        assert self.positions is not None, "Для фраз и NEAR соберите позиционный индекс в POSITIONS_PATH"
+        return [posting for posting in postings if self.matches(node, self.doc_name(posting))]
+
+    def count(self, lemme: str) -> int:
+        if isinstance(self.index, ID_INDEXES):
+            return self.index.count(lemme)
+        return self.index[lemme]["count"] if lemme in self.index else 0
+
+    def all_docs(self) -> list:
+        if self._all_docs is None:
+            if isinstance(self.index, ID_INDEXES):
+                self._all_docs = list(range(self.index.docs_count))
+            else:
+                self._all_docs = sorted({doc for value in self.index.values() for doc in value["documents"]})
+        return self._all_docs
+
+    def evaluate_and(self, node: And) -> list:
+        positive = sorted({lemme for item in node.positive for lemme in node_lemmes(item)}, key=self.count)
+        if positive:
+            result = self.postings(positive[0])
+            for lemme in positive[1:]:
+                if not result:
+                    return []
+                result = intersect(result, self.postings(lemme))
+        else:
+            result = self.all_docs()
+
+        # позиции проверяются только у документов, в которых есть все леммы группы
+        for item in node.positive:
+            if not isinstance(item, Term) and result:
+                result = self.filter_positions(item, result)
+
+        for item in dict.fromkeys(node.negative):
+            if not result:
+                break
+            if isinstance(item, Term):
+                result = difference(result, self.postings(item.lemme))
+                continue
+            candidates = result
+            for lemme in node_lemmes(item):
+                candidates = intersect(candidates, self.postings(lemme))
+            result = difference(result, self.filter_positions(item, candidates))
+
+        return result
+
+    def evaluate(self, node: Or) -> list:
+        return union([self.evaluate_and(group) for group in node.groups])
+
+    def documents(self, postings: list) -> set[str]:
+        if isinstance(self.index, ID_INDEXES):
+            return {self.index.doc_name(doc_id) for doc_id in postings}
+        return set(postings)
+
+
+class BitmapQueryEngine(QueryEngine):
+    """
+    Выполнение запросов по индексу на битовых картах: AND, OR и NOT - побитовые операции над целыми числами
+    """
+
+    def evaluate_and(self, node: And) -> int:
+        positive = sorted({lemme for item in node.positive for lemme in node_lemmes(item)}, key=self.index.count)
+        result = self.index.bitmap(positive[0]) if positive else self.index.all_docs
+        for lemme in positive[1:]:
+            result &= self.index.bitmap(lemme)
+        for item in node.positive:
+            if not isinstance(item, Term) and result:
+                result = bitmap_from_ids(self.filter_positions(item, ids_from_bitmap(result)))
+
+        for item in node.negative:
+            if isinstance(item, Term):
+                result &= ~self.index.bitmap(item.lemme)
+                continue
+            candidates = result
+            for lemme in node_lemmes(item):
+                candidates &= self.index.bitmap(lemme)
+            if candidates:
+                result &= ~bitmap_from_ids(self.filter_positions(item, ids_from_bitmap(candidates)))
+
+        return result
+
+    def evaluate(self, node: Or) -> int:
+        result = 0
+        for group in node.groups:
+            result |= self.evaluate_and(group)
+
+        return result
+
+    def doc_name(self, posting: int) -> str:
+        return self.index.docs[posting]
+
+    def documents(self, postings: int) -> set[str]:
+        return self.index.documents(postings)
+
+
+def create_engine(
+        index: dict[str, dict[str, set | int]] | BinaryIndex | CompactIndex | BitmapIndex,
+        positions: PositionalIndex | None = None,
+) -> QueryEngine:
+    engine_class = BitmapQueryEngine if isinstance(index, BitmapIndex) else QueryEngine
+    return engine_class(index, positions=positions)
@@ -1,9 +1,15 @@
 import json
 import os
-from functools import lru_cache
 
 from pymorphy2 import MorphAnalyzer
-from pymorphy2.analyzer import Parse
+
+from common.cache import QueryCache, init_query_cache
+from common.lemmatizer import init_lemmatizer
+from task3.binary_index import BinaryIndex, is_binary_index
+from task3.bitmap_index import BitmapIndex
+from task3.compact_index import CompactIndex
+from task3.positional_index import load_positional_index
+from task3.query import Or, QueryEngine, create_engine, parse_query
 
 
 def prevalidate_env_variables():
@@ -18,7 +24,12 @@ def init_morph() -> MorphAnalyzer:
     return MorphAnalyzer()
 
 
-morph = init_morph()
+lemmatizer = init_lemmatizer(init_morph())
+engine: QueryEngine | None = None
+# версия индекса увеличивается при смене индекса и сбрасывает кэш результатов
+index_version = 0
+result_cache = init_query_cache()
+parsed_queries = QueryCache(maxsize=result_cache.maxsize * 4)
 
 
 def print_help_message():
@@ -28,6 +39,8 @@ def print_help_message():
         
         Слова написанные через пробел автоматически объединяются с помощью AND.\n
         Минус перед словом означает NOT.\n
+        Слова в кавычках ищутся как фраза, "слово1 NEAR/3 слово2" - слова на расстоянии не больше 3 лемм.\n
+        Фразы и NEAR требуют позиционного индекса POSITIONS_PATH.\n
         Например:\n
         здесь -есть | другой\n
         означает: документы, где есть слово "здесь", но нет слова "есть", или документы где есть слово "другой"
@@ -36,8 +49,14 @@ def print_help_message():
     print()
 
 
-def load_index(index_path: str):
+def load_index(index_path: str, compact: bool = False):
     assert os.path.isfile(index_path), "Указанный путь до индекса не существует."
+    if is_binary_index(index_path):
+        return BinaryIndex(index_path)
+    if compact:
+        # имена документов хранятся один раз, списки документов - идентификаторы в общем буфере
+        return CompactIndex.from_json(index_path)
+
     index = {}
     with open(index_path, "r", encoding="utf8") as f:
         rows = f.readlines()
@@ -49,6 +68,11 @@ def load_index(index_path: str):
 
 
 def get_all_docs(index: dict[str, dict[str, set | int]]) -> set[str]:
+    if isinstance(index, (BinaryIndex, CompactIndex)):
+        return set(index.doc_names())
+    if isinstance(index, BitmapIndex):
+        return set(index.docs)
+
     docs = set()
     for value in index.values():
         docs |= value["documents"]
@@ -56,38 +80,53 @@ def get_all_docs(index: dict[str, dict[str, set | int]]) -> set[str]:
     return docs
 
 
-def search(query: str, index: dict[str, dict[str, set | int]]) -> set[str]:
-    if not len(query):
-        return set()
+def get_engine(index: dict[str, dict[str, set | int]] | BinaryIndex | CompactIndex | BitmapIndex) -> QueryEngine:
+    """
+    Получить движок запросов для индекса. Движок переиспользуется, пока индекс не поменяется,
+    поэтому кэш списков документов и множества всех документов живет между запросами.
 
-    tokens = query.split("|")
-    # if multiple - recursive search and union results
-    if len(tokens) > 1:
-        result = set()
-        for token in tokens:
-            result = result.union(search(token, index))
-        return result
+    :param index: индекс
+    :return: объект `QueryEngine`
+    """
+    global engine, index_version
+    if engine is None or engine.index is not index:
+        # позиционный индекс отображается в память, позиции читаются только для фраз и NEAR
+        engine = create_engine(index, load_positional_index())
+        index_version += 1
+    return engine
 
-    # if single - recursive search and intersect or subtract (if negative)
-    tokens = tokens[0].split()
-    if len(tokens) > 1 or tokens[0].startswith("-"):
-        result = get_all_docs(index)
 
-        for token in tokens:
-            clear_token = token.strip()
-            if clear_token.startswith("-"):
-                result = result - search(token.lstrip("-"), index)
-            else:
-                result = result.intersection(search(token, index))
+def parse(query: str) -> Or:
+    """
+    Разобрать запрос в дерево из лемм, разные формы слов одного запроса дают одно и то же дерево
+    """
+    if (tree := parsed_queries.get(query)) is None:
+        tree = parse_query(
+            query, lambda word: lemmatizer.parse(word).normal_form, lambda word: not lemmatizer.parse(word).keep
+        )
+        parsed_queries.put(query, tree)
+    return tree
 
-        return result
 
-    words: list[Parse] = morph.parse(tokens[0])
-    word = words[0].normal_form
-    return index[word]["documents"] if index.get(word) else set()
+def search(query: str, index: dict[str, dict[str, set | int]]) -> set[str]:
+    query_engine = get_engine(index)
+    result_cache.set_version(index_version)
+    tree = parse(query)
+    if (documents := result_cache.get(tree)) is None:
+        documents = frozenset(query_engine.documents(query_engine.evaluate(tree)))
+        result_cache.put(tree, documents)
+    return set(documents)
 
 
 if __name__ == '__main__':
     prevalidate_env_variables()
-    index = load_index(os.getenv("INDEX_PATH"))
+    binary_index_path = os.getenv("BINARY_INDEX_PATH")
+    index = load_index(
+        binary_index_path if binary_index_path and os.path.isfile(binary_index_path) else os.getenv("INDEX_PATH"),
+        compact=bool(os.getenv("COMPACT_INDEX")),
+    )
+    if os.getenv("BITMAP_POSTINGS"):
+        index = BitmapIndex.from_index(index)
     print(search(input("Введите поисковый запрос: "), index))
+    lemmatizer.save()
+    print(result_cache.stats())
@@ -1,17 +1,24 @@
 import json
 import os
-import shutil
-import zipfile
-from collections import defaultdict
+from functools import partial
 
 from pymorphy2 import MorphAnalyzer
-from pymorphy2.analyzer import Parse
+
+from common.documents import DocumentSource, open_documents
+from common.lemmatizer import Lemmatizer, init_lemmatizer
+from common.metrics import lemmatizer_collector, metrics, profiling
+from common.parallel import get_workers_count, map_shards
+from common.vocabulary import init_vocabulary
+from task3.binary_index import write_binary_index
+from task3.bitmap_index import BitmapIndex
+from task3.positional_index import document_positions, merge_positions, write_positional_index
 
 
 def prevalidate_env_variables():
     assert os.getenv("POSTS_DIR_PATH"), "Укажите путь для папки и архива в переменную окружения POSTS_DIR_PATH"
     assert os.getenv("LEMMES_PATH"), "Укажите путь для файла лемм в переменную окружения LEMMES_PATH"
     assert os.getenv("INDEX_PATH"), "Укажите путь для файла индекса в переменную окружения INDEX_PATH"
+    assert os.getenv("BINARY_INDEX_PATH"), "Укажите путь для бинарного индекса в переменную окружения BINARY_INDEX_PATH"
 
 
 def init_morph() -> MorphAnalyzer:
@@ -22,80 +29,129 @@ def init_morph() -> MorphAnalyzer:
     return MorphAnalyzer()
 
 
-def extract_archive(dir_path: str):
+def normalize(text: str, lemmatizer: Lemmatizer) -> list[str]:
     """
-    Разархивировать архмв
-    :param dir_path: путь до архива без расширения
+    Вернуть список лемм по тексту
+    :param text: текст документа
+    :param lemmatizer: объект лемматизатора
+    :return: список уникальных лемм в порядке первого появления
     """
-    if not os.path.isdir(dir_path):
-        os.mkdir(dir_path)
-    with zipfile.ZipFile(f"{dir_path}.zip", "r") as zip_ref:
-        zip_ref.extractall(dir_path)
+    return list(dict.fromkeys(lemmatizer.lemmatize(text)))
 
 
-def clear(dir_path: str):
+def index_documents(
+        documents: DocumentSource, files: list[str], lemmatizer: Lemmatizer, positions: bool = False
+) -> tuple[dict[str, list[str]], dict[str, dict[str, list[int]]]]:
     """
-    Удалить папку с файлами
-    :param dir_path: путь до папки с файлами
+    Построить частичный индекс по части документов
+
+    :param documents: источник документов
+    :param files: имена файлов шарда
+    :param lemmatizer: объект лемматизатора
+    :param positions: собирать позиции лемм в том же проходе
+    :return: словарь лемма -> файлы в порядке первого появления леммы и словарь лемма -> {файл: позиции}
+    """
+    postings, lemme_positions = {}, {}
+    for file, text in documents.iter_documents(files):
+        with metrics.stage("lemmatize"):
+            lemmes = lemmatizer.lemmatize(text)
+        with metrics.stage("postings"):
+            for lemme in dict.fromkeys(lemmes):
+                postings.setdefault(lemme, []).append(file)
+        if positions:
+            with metrics.stage("positions"):
+                for lemme, doc_positions in document_positions(lemmes).items():
+                    lemme_positions.setdefault(lemme, {})[file] = doc_positions
+
+    return postings, lemme_positions
+
+
+def merge_postings(partial_postings: list[dict[str, list[str]]]) -> dict[str, list[str]]:
+    """
+    Объединить частичные индексы шардов в порядке шардов
+
+    :param partial_postings: частичные индексы
+    :return: словарь лемма -> файлы
     """
-    shutil.rmtree(dir_path)
+    postings = {}
+    for shard_postings in partial_postings:
+        for lemme, files in shard_postings.items():
+            postings.setdefault(lemme, []).extend(files)
 
+    return postings
 
-def normalize(text: str, morph: MorphAnalyzer) -> set[str]:
+
+def collect_postings(
+        documents: DocumentSource, lemmatizer: Lemmatizer, workers: int = 1, positions: bool = False
+) -> tuple[dict[str, list[str]], dict[str, dict[str, list[int]]]]:
     """
-    Вернуть список лемм по тексту
-    :param text: текст документа
-    :param morph: объект анализатора
-    :return: множество лемм
-    """
-    lemmes = set()
-
-    words = text.split()
-    for word in words:
-        token: Parse = morph.parse(word)[0]
-
-        bad = False
-        for bad_grammeme in [
-            "PREP",  # предлог
-            "CONJ",  # союз
-            "NUMB",  # число
-            "NUMR",  # числительное
-            "LATN",  # не кириллица
-            "PNCT",  # пунктуация
-            "ROMN",  # римское число
-            "UNKN",  # неизвестное слово
-        ]:
-            if bad_grammeme in token.tag:
-                bad = True
-                break
-
-        if bad:
-            continue
-
-        lemmes.add(token.normal_form)
-
-    return lemmes
-
-
-def get_inverted_index(dir_path: str, morph: MorphAnalyzer) -> dict[str, dict[str, set | int]]:
-    inverted_index = defaultdict(lambda: {"documents": set(), "count": 0})
-    for file in os.listdir(dir_path):
-        if file.endswith(".txt"):
-            text = open(os.path.join(dir_path, file), "r", encoding="utf8").read()
-            lemmes = normalize(text, morph)
-            for lemme in lemmes:
-                inverted_index[lemme]["documents"].add(file)
-                inverted_index[lemme]["count"] += 1
+    Собрать списки документов и, если нужно, позиции лемм за один проход по документам
 
+    :param documents: источник документов
+    :param lemmatizer: объект лемматизатора
+    :param workers: количество процессов, результат не зависит от их количества
+    :param positions: собирать позиции лемм
+    :return: словарь лемма -> файлы и словарь лемма -> {файл: позиции}, пустой без `positions`
+    """
+    shards = map_shards(partial(index_documents, documents, positions=positions), documents.names(), lemmatizer, workers)
+    with metrics.stage("merge"):
+        return (
+            merge_postings([shard_postings for shard_postings, _ in shards]),
+            merge_positions([shard_positions for _, shard_positions in shards]),
+        )
+
+
+def get_inverted_index(
+        documents: DocumentSource, lemmatizer: Lemmatizer, bitmap: bool = False, workers: int = 1
+) -> dict[str, dict[str, set | int]] | BitmapIndex:
+    """
+    Построить инвертированный индекс по документам
+
+    :param documents: источник документов
+    :param lemmatizer: объект лемматизатора
+    :param bitmap: построить индекс со списками документов в виде битовых карт
+    :param workers: количество процессов, результат не зависит от их количества
+    :return: индекс термин -> {"documents", "count"}
+    """
+    postings, _ = collect_postings(documents, lemmatizer, workers)
+    if bitmap:
+        with metrics.stage("bitmaps"):
+            return BitmapIndex.from_postings(documents.names(), postings)
+
+    with metrics.stage("sort"):
+        return index_from_postings(postings)
+
+
+def index_from_postings(postings: dict[str, list[str]]) -> dict[str, dict[str, set | int]]:
+    """
+    Построить индекс из списков документов, термины упорядочиваются по количеству документов
+
+    :param postings: словарь лемма -> файлы
+    :return: индекс термин -> {"documents", "count"}
+    """
+    inverted_index = {lemme: {"documents": set(docs), "count": len(docs)} for lemme, docs in postings.items()}
     return dict(sorted(inverted_index.items(), key=lambda s: s[1]["count"]))
 
 
+def load_urls(urls_path: str) -> dict[str, str]:
+    """
+    Загрузить URL документов из index файла
+
+    :param urls_path: путь до index файла
+    :return: словарь файл -> URL, пустой, если файла нет
+    """
+    if not os.path.isfile(urls_path):
+        return {}
+    with open(urls_path, "r", encoding="utf8") as f:
+        return {filename: link for filename, link in (line.split() for line in f if line.strip())}
+
+
 def write_index(index_path: str, index: dict[str, dict[str, set | int]]):
     with open(index_path, "w", encoding="utf8") as f:
         for key, value in index.items():
             f.write(
                 json.dumps(
-                    {"word": key, "documents": list(value["documents"]), "count": value["count"]},
+                    {"word": key, "documents": sorted(value["documents"]), "count": value["count"]},
                     ensure_ascii=False,
                     default=str,
                 )
@@ -106,8 +162,24 @@ def write_index(index_path: str, index: dict[str, dict[str, set | int]]):
 if __name__ == "__main__":
     prevalidate_env_variables()
     dir_path = os.getenv("POSTS_DIR_PATH")
-    extract_archive(dir_path)
-    morph = init_morph()
-    index = get_inverted_index(dir_path, morph)
-    write_index(os.getenv("INDEX_PATH"), index)
-    clear(dir_path)
+    with profiling():
+        lemmatizer = init_lemmatizer(init_morph())
+        metrics.collect(lemmatizer_collector(lemmatizer), "counter")
+        positions_path = os.getenv("POSITIONS_PATH")
+        # позиции собираются в том же проходе, что и списки документов
+        postings, positions = collect_postings(
+            open_documents(dir_path), lemmatizer, get_workers_count(), positions=bool(positions_path)
+        )
+        with metrics.stage("sort"):
+            index = index_from_postings(postings)
+        with metrics.stage("write"):
+            write_index(os.getenv("INDEX_PATH"), index)
+        with metrics.stage("write_binary"):
+            write_binary_index(os.getenv("BINARY_INDEX_PATH"), index, load_urls("index.txt"))
+        with metrics.stage("vocabulary"):
+            init_vocabulary(index)
+        if positions_path:
+            with metrics.stage("write_positions"):
+                write_positional_index(positions_path, positions)
+        lemmatizer.save()
+    print(lemmatizer.stats())
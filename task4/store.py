@@ -0,0 +1,250 @@
+"""
+Бинарное колоночное хранилище TF-IDF вместо отдельного текстового файла на каждый документ.
+
+Для каждой коллекции (`tokens` и `lemmes`) хранятся столбцы: номера терминов (uint32) и TF (float32) в порядке
+документов и терминов внутри документа, смещения начала каждого документа (int64), количество терминов
+в каждом документе (int64) и IDF каждого термина (float32). В текстовой папке task4 количества терминов
+документов коллекции хранятся в файле `lengths_<коллекция>.txt`. В папках, собранных до появления этих файлов,
+длин нет: такая коллекция переводится в хранилище без столбца длин, а BM25 по ней не собирается.
+Записи документа можно прочитать срезом столбцов без разбора строк, вся коллекция загружается в NumPy без копирования.
+
+Структура файла (little-endian):
+
+* заголовок: сигнатура ``TFST``, версия, смещение и длина блока описания;
+* массивы NumPy, выровненные по 8 байт;
+* блок описания: JSON со списком документов и для каждой коллекции - списком терминов,
+  количеством записей и смещениями массивов.
+
+Перевод текстовой папки task4 в хранилище: python -m task4.store [<папка TF-IDF> <файл хранилища>]
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from typing import NamedTuple
+
+import numpy as np
+
+MAGIC = b"TFST"
+VERSION = 2
+
+HEADER = struct.Struct("<4sIQQ")
+PREFIXES = ("tokens", "lemmes")
+
+# строки TF-IDF документа: термин, tf, idf
+Rows = list[tuple[str, float, float]]
+
+
+class Columns(NamedTuple):
+    terms: list[str]
+    offsets: np.ndarray
+    lengths: np.ndarray | None  # None - длины документов не сохранены
+    term_ids: np.ndarray
+    tf: np.ndarray
+    idf: np.ndarray
+
+
+def tf_idfs_location() -> str:
+    """
+    Путь до TF-IDF: хранилище TF_IDF_STORE_PATH, если оно собрано, иначе текстовая папка TF_IDFS_PATH
+    """
+    store_path = os.getenv("TF_IDF_STORE_PATH")
+    return store_path if store_path and os.path.isfile(store_path) else os.getenv("TF_IDFS_PATH")
+
+
+def _align(out: bytearray):
+    out.extend(b"\0" * (-len(out) % 8))
+
+
+def lengths_path(tf_idfs_path: str, prefix: str) -> str:
+    # имя файла не начинается с префикса коллекции, поэтому не читается как документ
+    return os.path.join(tf_idfs_path, f"lengths_{prefix}.txt")
+
+
+def write_lengths(tf_idfs_path: str, prefix: str, lengths: dict[str, int]):
+    """
+    Записать количества терминов документов коллекции в текстовую папку task4
+
+    :param tf_idfs_path: путь до папки
+    :param prefix: префикс коллекции
+    :param lengths: документ -> количество терминов
+    """
+    with open(lengths_path(tf_idfs_path, prefix), "w", encoding="utf8") as f:
+        f.writelines(f"{doc} {length}\n" for doc, length in sorted(lengths.items()))
+
+
+def read_lengths(tf_idfs_path: str, prefix: str = "lemmes") -> dict[str, int] | None:
+    """
+    Прочитать количества терминов документов из текстовой папки task4 или из хранилища
+
+    :param tf_idfs_path: путь до папки с TF-IDF или до файла хранилища
+    :param prefix: префикс коллекции
+    :return: документ -> количество терминов или None, если длины не сохранены
+    """
+    if is_store(tf_idfs_path):
+        store = TfIdfStore(tf_idfs_path)
+        lengths = store.columns(prefix).lengths
+        return None if lengths is None else dict(zip(store.docs, lengths.tolist()))
+    if not os.path.isfile(lengths_path(tf_idfs_path, prefix)):
+        return None
+    with open(lengths_path(tf_idfs_path, prefix), "r", encoding="utf8") as f:
+        return {doc: int(length) for doc, length in (line.split() for line in f)}
+
+
+def write_store(
+        path: str, docs: list[str], collections: dict[str, dict[str, Rows]],
+        lengths: dict[str, dict[str, int] | None],
+):
+    """
+    Записать хранилище
+
+    :param path: путь до файла
+    :param docs: документы в порядке записи
+    :param collections: префикс коллекции -> {документ: строки TF-IDF}, документа может не быть в коллекции
+    :param lengths: префикс коллекции -> {документ: количество терминов}, None - столбец длин не записывается
+    """
+    out = bytearray(HEADER.size)
+    meta = {"docs": docs, "collections": {}}
+    for prefix, rows in collections.items():
+        idfs = {}
+        for doc_rows in rows.values():
+            for term, _, idf in doc_rows:
+                idfs.setdefault(term, idf)
+        terms = sorted(idfs)
+        ids = {term: term_id for term_id, term in enumerate(terms)}
+
+        doc_rows = [rows.get(doc, ()) for doc in docs]
+        offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(rows) for rows in doc_rows])
+        arrays = {"offsets": offsets}
+        if lengths.get(prefix) is not None:
+            arrays["lengths"] = np.array([lengths[prefix].get(doc, 0) for doc in docs], dtype=np.int64)
+        arrays.update(
+            term_ids=np.array([ids[term] for rows in doc_rows for term, _, _ in rows], dtype=np.uint32),
+            tf=np.array([tf for rows in doc_rows for _, tf, _ in rows], dtype=np.float32),
+            idf=np.array([idfs[term] for term in terms], dtype=np.float32),
+        )
+        description = meta["collections"][prefix] = {"terms": terms, "nnz": int(offsets[-1])}
+        for name, array in arrays.items():
+            _align(out)
+            description[name] = len(out)
+            out.extend(array.tobytes())
+
+    strings = json.dumps(meta, ensure_ascii=False).encode("utf8")
+    HEADER.pack_into(out, 0, MAGIC, VERSION, len(out), len(strings))
+    out.extend(strings)
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(out)
+    os.replace(f"{path}.tmp", path)
+
+
+def is_store(path: str) -> bool:
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class TfIdfStore:
+    """
+    Хранилище, отображенное в память. Столбцы - представления NumPy поверх отображения без копирования.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, meta_offset, meta_length = HEADER.unpack_from(self.mm, 0)
+        assert magic == MAGIC and version == VERSION, f"Файл {path} не является хранилищем TF-IDF версии {VERSION}"
+        meta = json.loads(self.mm[meta_offset:meta_offset + meta_length].decode("utf8"))
+        self.docs: list[str] = meta["docs"]
+        self.descriptions: dict[str, dict] = meta["collections"]
+
+    def columns(self, prefix: str = "lemmes") -> Columns:
+        """
+        Получить столбцы коллекции
+
+        :param prefix: коллекция, `lemmes` или `tokens`
+        :return: термины и массивы NumPy
+        """
+        description = self.descriptions[prefix]
+        nnz, terms = description["nnz"], description["terms"]
+        return Columns(
+            terms,
+            np.frombuffer(self.mm, dtype=np.int64, count=len(self.docs) + 1, offset=description["offsets"]),
+            np.frombuffer(self.mm, dtype=np.int64, count=len(self.docs), offset=description["lengths"])
+            if "lengths" in description else None,
+            np.frombuffer(self.mm, dtype=np.uint32, count=nnz, offset=description["term_ids"]),
+            np.frombuffer(self.mm, dtype=np.float32, count=nnz, offset=description["tf"]),
+            np.frombuffer(self.mm, dtype=np.float32, count=len(terms), offset=description["idf"]),
+        )
+
+    def _documents(self, prefix: str, values: np.ndarray) -> dict[str, dict[str, float]]:
+        columns = self.columns(prefix)
+        terms = [columns.terms[term_id] for term_id in columns.term_ids.tolist()]
+        values = values.tolist()
+        offsets = columns.offsets.tolist()
+        return {
+            doc: dict(zip(terms[offsets[i]:offsets[i + 1]], values[offsets[i]:offsets[i + 1]]))
+            for i, doc in enumerate(self.docs)
+        }
+
+    def tf_idfs(self, prefix: str = "lemmes") -> tuple[dict[str, dict[str, float]], dict[str, float]]:
+        """
+        Получить веса TF-IDF документов, как `task5.snapshot.read_tf_idfs` для текстовой папки
+
+        :param prefix: коллекция
+        :return: документ -> {термин: вес} и термин -> IDF
+        """
+        columns = self.columns(prefix)
+        idf = columns.idf.astype(np.float64)
+        weights = columns.tf.astype(np.float64) * idf[columns.term_ids]
+        return self._documents(prefix, weights), dict(zip(columns.terms, idf.tolist()))
+
+    def tfs(self, prefix: str = "lemmes") -> dict[str, dict[str, float]]:
+        """
+        Получить TF документов
+
+        :param prefix: коллекция
+        :return: документ -> {термин: tf}
+        """
+        return self._documents(prefix, self.columns(prefix).tf.astype(np.float64))
+
+
+def read_text_rows(tf_idfs_path: str, prefix: str) -> dict[str, Rows]:
+    """
+    Прочитать строки TF-IDF из текстовой папки task4
+
+    :param tf_idfs_path: путь до папки
+    :param prefix: префикс файлов
+    :return: документ -> строки TF-IDF
+    """
+    rows = {}
+    for file in sorted(os.listdir(tf_idfs_path)):
+        if file.startswith(prefix):
+            with open(os.path.join(tf_idfs_path, file), "r", encoding="utf8") as f:
+                rows[file.removeprefix(prefix)] = [
+                    (token, float(tf), float(idf)) for token, tf, idf in (line.split() for line in f)
+                ]
+
+    return rows
+
+
+def convert(tf_idfs_path: str, store_path: str) -> int:
+    """
+    Перевести текстовую папку task4 в хранилище, длины документов переносятся, если они есть в папке
+
+    :param tf_idfs_path: путь до папки
+    :param store_path: путь до файла хранилища
+    :return: количество документов
+    """
+    collections = {prefix: read_text_rows(tf_idfs_path, prefix) for prefix in PREFIXES}
+    docs = sorted({doc for rows in collections.values() for doc in rows})
+    write_store(store_path, docs, collections, {prefix: read_lengths(tf_idfs_path, prefix) for prefix in PREFIXES})
+    return len(docs)
+
+
+if __name__ == "__main__":
+    source, target = sys.argv[1:3] if len(sys.argv) > 2 else (os.getenv("TF_IDFS_PATH"), os.getenv("TF_IDF_STORE_PATH"))
+    assert source and target, "Укажите папку TF-IDF и файл хранилища аргументами или в TF_IDFS_PATH и TF_IDF_STORE_PATH"
+    print(f"Хранилище TF-IDF записано: документов {convert(source, target)}")
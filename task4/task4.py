@@ -1,17 +1,23 @@
-import math
 import os
-import re
-import zipfile
 from collections import Counter
+from functools import partial
 
 from pymorphy2 import MorphAnalyzer
-from pymorphy2.analyzer import Parse
+
+from common.documents import DocumentSource, open_documents
+from common.lemmatizer import Lemmatizer, init_lemmatizer, preprocess_text
+from common.metrics import lemmatizer_collector, metrics, profiling
+from common.parallel import ShardPool, get_workers_count
+from common.stats import CorpusStats
+from task4.store import Rows, write_lengths, write_store
 
 
 def prevalidate_env_variables():
     assert os.getenv("POSTS_DIR_PATH"), "Укажите путь для папки и архива в переменную окружения POSTS_DIR_PATH"
     assert os.getenv("LEMMES_PATH"), "Укажите путь для файла лемм в переменную окружения LEMMES_PATH"
-    assert os.getenv("TF_IDFS_PATH"), "Укажите путь для папки, в которую поместятся результаты в переменную TF-IDF"
+    assert os.getenv("TF_IDFS_PATH") or os.getenv("TF_IDF_STORE_PATH"), (
+        "Укажите папку TF-IDF в TF_IDFS_PATH или хранилище в TF_IDF_STORE_PATH"
+    )
 
 
 def init_morph() -> MorphAnalyzer:
@@ -22,113 +28,156 @@ def init_morph() -> MorphAnalyzer:
     return MorphAnalyzer()
 
 
-def extract_archive(dir_path: str):
+def normalize(text: str, lemmatizer: Lemmatizer) -> str:
     """
-    Разархивировать архив.
+    Вернуть нормализованный текст.
 
-    :param dir_path: путь до архива без расширения
+    :param text: текст документа
+    :param lemmatizer: объект лемматизатора
+    :return: строку нормализованного текста
     """
-    if not os.path.isdir(dir_path):
-        os.mkdir(dir_path)
-    with zipfile.ZipFile(f"{dir_path}.zip", "r") as zip_ref:
-        zip_ref.extractall(dir_path)
+    return " ".join(lemmatizer.lemmatize(text))
 
 
-def preprocess_text(text: str) -> str:
+def prepare_text(text: str, normalized: bool, lemmatizer: Lemmatizer) -> str:
     """
-    Очистить текст от некириллических символов
+    Подготовить текст документа к подсчету TF-IDF
 
-    :param text: текст для очистки.
-    :return: очищенный текст.
+    :param text: исходный текст документа
+    :param normalized: заменить слова леммами
+    :param lemmatizer: объект лемматизатора
+    :return: строка терминов через пробел
     """
-    pattern = re.compile(r"[^А-Яа-я ]")
-    return re.sub(pattern, ' ', text)
+    with metrics.stage("clean"):
+        text = preprocess_text(text)
+    if not normalized:
+        return text
+    with metrics.stage("lemmatize"):
+        return normalize(text, lemmatizer)
 
 
-def get_all_texts(dir_path: str) -> dict[str, str]:
+def count_documents(
+        documents: DocumentSource, normalized: bool, names: list[str], lemmatizer: Lemmatizer
+) -> CorpusStats:
     """
-    Получить тексты всех документов
+    Собрать статистику по части документов
 
-    :param dir_path: директория с файлами.
-    :return: список текстов всех документов в этой дериктории
+    :param documents: источник документов
+    :param normalized: считать статистику по леммам
+    :param names: имена документов шарда
+    :param lemmatizer: объект лемматизатора
+    :return: статистика шарда
     """
+    stats = CorpusStats()
+    for name, text in documents.iter_documents(names):
+        text = prepare_text(text, normalized, lemmatizer)
+        with metrics.stage("stats"):
+            stats.add(name, text.split())
 
-    texts = {}
-    for file in os.listdir(dir_path):
-        if file.endswith(".txt"):
-            texts[file] = preprocess_text(open(os.path.join(dir_path, file), "r", encoding="utf8").read())
-
-    return texts
+    return stats
 
 
-def normalize(text: str, morph: MorphAnalyzer) -> str:
+def write_documents_tf_idf(
+        documents: DocumentSource, normalized: bool, stats: CorpusStats, tf_idfs_path: str,
+        names: list[str], lemmatizer: Lemmatizer
+):
     """
-    Вернуть нормализованный текст.
+    Посчитать и записать TF-IDF части документов
 
-    :param text: текст документа
-    :param morph: объект анализатора
-    :return: строку нормализованного текста
+    :param documents: источник документов
+    :param normalized: считать TF-IDF по леммам
+    :param stats: статистика всего корпуса
+    :param tf_idfs_path: директория с результатами
+    :param names: имена документов шарда
+    :param lemmatizer: объект лемматизатора
     """
-    lemmes = list()
+    prefix = "lemmes" if normalized else "tokens"
+    for name, text in documents.iter_documents(names):
+        text = prepare_text(text, normalized, lemmatizer)
+        with metrics.stage("tf_idf"):
+            tf_idf = get_tf_idf(text, stats)
+        with metrics.stage("write"):
+            write_tf_idf(os.path.join(tf_idfs_path, prefix + name), tf_idf)
 
-    words = text.split()
-    for word in words:
-        token: Parse = morph.parse(word)[0]
 
-        bad = False
-        for bad_grammeme in [
-            "PREP",  # предлог
-            "CONJ",  # союз
-            "NUMB",  # число
-            "NUMR",  # числительное
-            "LATN",  # не кириллица
-            "PNCT",  # пунктуация
-            "ROMN",  # римское число
-            "UNKN",  # неизвестное слово
-        ]:
-            if bad_grammeme in token.tag:
-                bad = True
-                break
-
-        if bad:
-            continue
+def documents_tf_idf(
+        documents: DocumentSource, normalized: bool, stats: CorpusStats, names: list[str], lemmatizer: Lemmatizer
+) -> dict[str, Rows]:
+    """
+    Посчитать TF-IDF части документов для хранилища
 
-        lemmes.append(token.normal_form)
+    :param documents: источник документов
+    :param normalized: считать TF-IDF по леммам
+    :param stats: статистика всего корпуса
+    :param names: имена документов шарда
+    :param lemmatizer: объект лемматизатора
+    :return: документ -> строки TF-IDF
+    """
+    tf_idfs = {}
+    for name, text in documents.iter_documents(names):
+        text = prepare_text(text, normalized, lemmatizer)
+        with metrics.stage("tf_idf"):
+            tf_idfs[name] = get_tf_idf(text, stats)
 
-    return " ".join(lemmes)
+    return tf_idfs
 
 
-def get_words_set_per_doc(docs: list[str]) -> list[set[str]]:
+def build_tf_idf(documents: DocumentSource, tf_idfs_path: str | None, pool: ShardPool, store_path: str | None = None):
     """
-    Получить множество слов для каждого документа
+    Посчитать TF-IDF терминов и лемм всех документов в два потоковых прохода:
+    сначала статистика корпуса, затем TF-IDF каждого документа
 
-    :param docs: список документов
-    :return: список множества слов для каждого документа
+    :param documents: источник документов
+    :param tf_idfs_path: директория с результатами
+    :param pool: пул процессов
+    :param store_path: путь до хранилища `task4.store`, если задан - результаты пишутся в него, а не в директорию
     """
-
-    return [set(doc.split()) for doc in docs]
+    names = documents.names()
+    collections, lengths = {}, {}
+    for normalized in (False, True):
+        stats = CorpusStats()
+        shards_stats = pool.map(partial(count_documents, documents, normalized), names)
+        with metrics.stage("merge"):
+            for shard_stats in shards_stats:
+                stats.merge(shard_stats)
+        # TF теряет длину документа, поэтому количества терминов сохраняются отдельно для BM25
+        lengths["lemmes" if normalized else "tokens"] = stats.lengths
+        if store_path:
+            tf_idfs = collections["lemmes" if normalized else "tokens"] = {}
+            for shard_tf_idfs in pool.map(partial(documents_tf_idf, documents, normalized, stats), names):
+                tf_idfs.update(shard_tf_idfs)
+        else:
+            pool.map(partial(write_documents_tf_idf, documents, normalized, stats, tf_idfs_path), names)
+            write_lengths(tf_idfs_path, "lemmes" if normalized else "tokens", stats.lengths)
+
+    if store_path:
+        with metrics.stage("write"):
+            write_store(store_path, names, collections, lengths)
 
 
-def get_tf_idf(text: str, docs: list[set[str]]) -> list[tuple[str, float, int]]:
+def get_tf_idf(text: str, stats: CorpusStats) -> list[tuple[str, float, int]]:
     """
     Получить TF-IDF текста. Предполагается, что `text` это документ
 
     :param text: текст документа, для которого нужно посчитать TF-IDF.
-    :param docs: список множества слов в документах
+    :param stats: статистика корпуса документов.
     :return: список кортежей, каждый из которых представляет собой: токен, tf, idf.
     """
 
-    tokens = text.split()
-    tokens_set = set(tokens)
-
     # подсчет TF
-    tfs = Counter(tokens)
+    return tf_idf_from_counts(Counter(text.split()), stats)
 
-    # подсчет IDF
-    token_entries = {token: len([doc for doc in docs if token in doc]) for token in tokens_set}
-    idfs = {token: math.log10(len(docs) / token_entries[token]) for token in tokens_set}
 
-    return [(token, tfs[token] / len(tokens), idfs[token]) for token in tokens_set]
+def tf_idf_from_counts(counts: Counter[str], stats: CorpusStats) -> list[tuple[str, float, int]]:
+    """
+    Получить TF-IDF документа по количествам вхождений терминов
+
+    :param counts: термин -> количество вхождений в порядке первого появления
+    :param stats: статистика корпуса документов.
+    :return: список кортежей: токен, tf, idf.
+    """
+    length = sum(counts.values())
+    return [(token, tf / length, stats.idf(token)) for token, tf in counts.items()]
 
 
 def write_tf_idf(path: str, tf_idfs: list[tuple[str, float, int]]):
@@ -146,26 +195,15 @@ if __name__ == "__main__":
     prevalidate_env_variables()
     dir_path = os.getenv("POSTS_DIR_PATH")
 
-    morph = init_morph()
-
-    tf_idfs_path = os.getenv("TF_IDFS_PATH")
+    lemmatizer = init_lemmatizer(init_morph())
+    metrics.collect(lemmatizer_collector(lemmatizer), "counter")
 
-    extract_archive(dir_path)
-    texts = get_all_texts(dir_path)
-    texts_words = get_words_set_per_doc(list(texts.values()))
-
-    if not os.path.isdir(tf_idfs_path):
+    tf_idfs_path, store_path = os.getenv("TF_IDFS_PATH"), os.getenv("TF_IDF_STORE_PATH")
+    if not store_path and not os.path.isdir(tf_idfs_path):
         os.mkdir(tf_idfs_path)
 
-    # считаем tf-idf для терминов
-    for filename, text in texts.items():
-        tf_idf = get_tf_idf(text, texts_words)
-        write_tf_idf(os.path.join(tf_idfs_path, "tokens" + filename), tf_idf)
-
-    normalized_texts = {filename: normalize(text, morph) for filename, text in texts.items()}
-    normalized_texts_words = get_words_set_per_doc(list(normalized_texts.values()))
+    with profiling(), ShardPool(lemmatizer, get_workers_count()) as pool:
+        build_tf_idf(open_documents(dir_path), tf_idfs_path, pool, store_path)
 
-    # считаем tf-idf для лемм
-    for filename, text in normalized_texts.items():
-        tf_idf = get_tf_idf(text, normalized_texts_words)
-        write_tf_idf(os.path.join(tf_idfs_path, "lemmes" + filename), tf_idf)
+    lemmatizer.save()
+    print(lemmatizer.stats())
@@ -0,0 +1,135 @@
+"""
+Микропакетное выполнение запросов.
+
+Запросы, пришедшие за короткое окно, собираются в пачку и ранжируются одним умножением
+матрицы запросов на матрицу документов в отдельном потоке, результаты раздаются ожидающим запросам.
+Пока пачка считается, новые запросы копятся в очереди и попадают в следующую, более крупную пачку.
+Пачка из одного запроса (низкая нагрузка) ранжируется `RankingEngine.top_k` алгоритмом MaxScore,
+который не считает сходство всех документов: умножение окупается только на нескольких запросах.
+Очередь ограничена: при переполнении запрос сразу отклоняется исключением `asyncio.QueueFull`.
+При остановке принятые запросы досчитываются.
+"""
+import asyncio
+import os
+
+from task5.ranking import RankingEngine
+
+
+class QueryBatcher:
+    def __init__(self, engine: RankingEngine, window: float = 0.002, max_batch: int = 64, max_queue: int = 1024):
+        """
+        :param engine: движок ранжирования
+        :param window: время ожидания запросов для пачки в секундах
+        :param max_batch: максимальный размер пачки
+        :param max_queue: максимальное количество ожидающих запросов
+        """
+        self.engine = engine
+        self.window = window
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.queue: asyncio.Queue | None = None
+        self.worker: asyncio.Task | None = None
+
+        self.batches = 0
+        self.queries = 0
+
+    def start(self):
+        # очередь и задача создаются в цикле событий сервера при первом запросе
+        self.queue = asyncio.Queue(self.max_queue)
+        self.worker = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self.worker is not None:
+            # запросы, уже поставленные в очередь, получают результаты до остановки исполнителя
+            if not self.worker.done() and self.worker.get_loop() is asyncio.get_running_loop():
+                await self.queue.join()
+            self.worker.cancel()
+            await asyncio.gather(self.worker, return_exceptions=True)
+            self.worker = None
+
+    async def search(self, query: dict[int, float], k: int) -> list[tuple[str, float]]:
+        """
+        Поставить запрос в очередь и дождаться результата его пачки
+
+        :param query: вектор TF-IDF запроса
+        :param k: количество документов
+        :return: список пар документ, сходство по убыванию сходства
+        """
+        if self.worker is None or self.worker.done() or self.worker.get_loop() is not asyncio.get_running_loop():
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((query, k, future))
+        return await future
+
+    async def collect(self) -> list[tuple[dict[int, float], int, asyncio.Future]]:
+        """
+        Дождаться первого запроса и добрать пачку запросами, пришедшими в течение окна
+        """
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def run(self):
+        while True:
+            batch = await self.collect()
+            try:
+                await self.rank([item for item in batch if not item[2].cancelled()])
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def rank(self, batch: list[tuple[dict[int, float], int, asyncio.Future]]):
+        """
+        Ранжировать пачку в пуле потоков и раздать результаты ожидающим запросам
+        """
+        if not batch:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            if len(batch) == 1:
+                query, k, _ = batch[0]
+                results = [await loop.run_in_executor(None, self.engine.top_k, query, k)]
+            else:
+                results = await loop.run_in_executor(
+                    None, self.engine.top_k_batch, [query for query, _, _ in batch], [k for _, k, _ in batch]
+                )
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.queries += len(batch)
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def init_batcher(engine: RankingEngine) -> QueryBatcher:
+    """
+    Создать пакетный исполнитель с параметрами из переменных окружения
+    SEARCH_BATCH_WINDOW_MS, SEARCH_BATCH_SIZE и SEARCH_QUEUE_SIZE
+
+    :param engine: движок ранжирования
+    :return: объект `QueryBatcher`
+    """
+    return QueryBatcher(
+        engine,
+        window=float(os.getenv("SEARCH_BATCH_WINDOW_MS") or 2) / 1000,
+        max_batch=int(os.getenv("SEARCH_BATCH_SIZE") or 64),
+        max_queue=int(os.getenv("SEARCH_QUEUE_SIZE") or 1024),
+    )
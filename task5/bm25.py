@@ -0,0 +1,257 @@
+"""
+Ранжирование BM25 по заранее посчитанным квантованным вкладам.
+
+Вклад термина в документ (impact) - полное слагаемое BM25 ``idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avglen))``.
+Вклады считаются при сборке по TF и длинам документов из результатов task4, переводятся в целые числа 8 или 16 бит с общим масштабом
+и хранятся по убыванию вклада внутри термина. Запрос сводится к сложению целых чисел по спискам своих терминов,
+для запроса из одного термина лучшие документы - просто начало списка. Для BM25F достаточно передать
+в `impacts` взвешенную сумму TF по полям и взвешенную длину документа, формат файла при этом не меняется.
+
+Структура файла (little-endian):
+
+* заголовок: сигнатура ``BM25``, версия, разрядность вкладов, количество документов, количество терминов,
+  количество вкладов, масштаб, k1, b, смещения указателей строк, документов и вкладов, смещение и длина блока строк;
+* массивы NumPy, выровненные по 8 байт: указатели строк (int64), номера документов (int32), вклады (uint8/uint16);
+* блок строк: JSON со списками терминов и документов в utf8.
+
+Сборка: python -m task5.bm25
+"""
+import json
+import math
+import mmap
+import os
+import struct
+from collections import Counter
+
+import numpy as np
+
+from common.metrics import metrics, profiling
+from task4.store import TfIdfStore, is_store, read_lengths, tf_idfs_location
+from task5.ranking import top_positions
+
+MAGIC = b"BM25"
+VERSION = 1
+
+HEADER = struct.Struct("<4sIIIIQdddQQQQQ")
+DTYPES = {8: np.uint8, 16: np.uint16}
+
+
+def prevalidate_env_variables():
+    assert tf_idfs_location(), "Укажите папку TF-IDF в TF_IDFS_PATH или хранилище в TF_IDF_STORE_PATH"
+    assert os.getenv("BM25_PATH"), "Укажите путь для индекса BM25 в переменную окружения BM25_PATH"
+
+
+def read_tfs(tf_idfs_path: str, prefix: str = "lemmes") -> dict[str, dict[str, float]]:
+    """
+    Прочитать TF документов из файлов TF-IDF или из хранилища `task4.store`
+
+    :param tf_idfs_path: путь до папки с TF-IDF или до файла хранилища
+    :param prefix: префикс файлов
+    :return: документ -> {термин: tf}
+    """
+    if is_store(tf_idfs_path):
+        return TfIdfStore(tf_idfs_path).tfs(prefix)
+    tfs = {}
+    for file in sorted(os.listdir(tf_idfs_path)):
+        if file.startswith(prefix):
+            with open(os.path.join(tf_idfs_path, file), "r", encoding="utf8") as f:
+                tfs[file.removeprefix(prefix)] = {token: float(tf) for token, tf, _ in (line.split() for line in f)}
+
+    return tfs
+
+
+def impacts(
+        counts: dict[str, dict[str, int]], lengths: dict[str, int], k1: float = 1.2, b: float = 0.75
+) -> dict[str, dict[str, float]]:
+    """
+    Посчитать вклады BM25
+
+    :param counts: документ -> {термин: количество вхождений}
+    :param lengths: документ -> длина
+    :param k1: насыщение TF
+    :param b: степень нормализации по длине документа
+    :return: термин -> {документ: вклад}
+    """
+    df = Counter(term for doc_counts in counts.values() for term in doc_counts)
+    average = sum(lengths.values()) / len(lengths) if lengths else 1
+    idf = {term: math.log(1 + (len(counts) - n + 0.5) / (n + 0.5)) for term, n in df.items()}
+
+    result = {}
+    for doc, doc_counts in counts.items():
+        norm = k1 * (1 - b + b * lengths[doc] / average)
+        for term, tf in doc_counts.items():
+            result.setdefault(term, {})[doc] = idf[term] * tf * (k1 + 1) / (tf + norm)
+
+    return result
+
+
+def _align(out: bytearray):
+    out.extend(b"\0" * (-len(out) % 8))
+
+
+def write_bm25(
+        path: str, term_impacts: dict[str, dict[str, float]], docs: list[str], bits: int = 8, k1: float = 1.2,
+        b: float = 0.75,
+):
+    """
+    Квантовать вклады и записать индекс
+
+    :param path: путь до файла
+    :param term_impacts: термин -> {документ: вклад}
+    :param docs: документы, номера присваиваются в этом порядке
+    :param bits: разрядность вкладов, 8 или 16
+    :param k1: параметр k1, сохраняется в заголовке
+    :param b: параметр b, сохраняется в заголовке
+    """
+    assert bits in DTYPES, "Разрядность вкладов BM25 должна быть 8 или 16"
+    doc_ids = {doc: doc_id for doc_id, doc in enumerate(docs)}
+    terms = sorted(term_impacts)
+    levels = (1 << bits) - 1
+    maximum = max((value for values in term_impacts.values() for value in values.values()), default=1.0)
+    scale = maximum / levels
+
+    indptr, ids, quantized = [0], [], []
+    for term in terms:
+        # вклады термина по убыванию, при равенстве - по номеру документа
+        postings = sorted(((doc_ids[doc], value) for doc, value in term_impacts[term].items()), key=lambda p: (-p[1], p[0]))
+        ids.extend(doc_id for doc_id, _ in postings)
+        # ненулевой вклад не округляется до нуля, иначе документ пропал бы из выдачи
+        quantized.extend(max(1, round(value / scale)) for _, value in postings)
+        indptr.append(len(ids))
+
+    out = bytearray(HEADER.size)
+    offsets = []
+    for array in (
+            np.array(indptr, dtype=np.int64), np.array(ids, dtype=np.int32), np.array(quantized, dtype=DTYPES[bits])
+    ):
+        _align(out)
+        offsets.append(len(out))
+        out.extend(array.tobytes())
+
+    strings = json.dumps({"terms": terms, "docs": docs}, ensure_ascii=False).encode("utf8")
+    strings_offset = len(out)
+    out.extend(strings)
+
+    HEADER.pack_into(
+        out, 0, MAGIC, VERSION, bits, len(docs), len(terms), len(ids), scale, k1, b, *offsets, strings_offset,
+        len(strings),
+    )
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(out)
+    os.replace(f"{path}.tmp", path)
+
+
+class BM25Index:
+    """
+    Индекс BM25, отображенный в память
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic, version, self.bits, docs_count, terms_count, nnz, self.scale, self.k1, self.b,
+            indptr_offset, ids_offset, impacts_offset, strings_offset, strings_length,
+        ) = HEADER.unpack_from(self.mm, 0)
+        assert magic == MAGIC and version == VERSION, f"Файл {path} не является индексом BM25 версии {VERSION}"
+
+        strings = json.loads(self.mm[strings_offset:strings_offset + strings_length].decode("utf8"))
+        self.terms: list[str] = strings["terms"]
+        self.docs: list[str] = strings["docs"]
+        self.ids = {term: term_id for term_id, term in enumerate(self.terms)}
+
+        self.indptr = np.frombuffer(self.mm, dtype=np.int64, count=terms_count + 1, offset=indptr_offset)
+        self.doc_ids = np.frombuffer(self.mm, dtype=np.int32, count=nnz, offset=ids_offset)
+        self.impacts = np.frombuffer(self.mm, dtype=DTYPES[self.bits], count=nnz, offset=impacts_offset)
+
+    def postings(self, term_id: int) -> tuple[np.ndarray, np.ndarray]:
+        start, end = self.indptr[term_id], self.indptr[term_id + 1]
+        return self.doc_ids[start:end], self.impacts[start:end]
+
+    def top_k(self, lemmes: list[str], k: int) -> list[tuple[str, float]]:
+        """
+        Найти k документов с наибольшей оценкой BM25
+
+        :param lemmes: леммы запроса
+        :param k: количество документов
+        :return: список пар документ, оценка по убыванию оценки, только документы хотя бы с одним термином запроса
+        """
+        query = Counter(self.ids[lemme] for lemme in lemmes if lemme in self.ids)
+        if not query:
+            return []
+        if len(query) == 1:
+            # списки упорядочены по вкладу, поэтому ответ - начало списка
+            (term_id, count), = query.items()
+            doc_ids, values = self.postings(term_id)
+            metrics.inc("postings_scanned", min(k, len(doc_ids)))
+            return [
+                (self.docs[doc_id], float(value) * count * self.scale)
+                for doc_id, value in zip(doc_ids[:k].tolist(), values[:k].tolist())
+            ]
+
+        scores = np.zeros(len(self.docs), dtype=np.int64)
+        for term_id, count in query.items():
+            doc_ids, values = self.postings(term_id)
+            # внутри списка термина документы не повторяются
+            scores[doc_ids] += values.astype(np.int64) * count
+            metrics.inc("postings_scanned", len(doc_ids))
+
+        candidates = np.flatnonzero(scores)
+        order = candidates[top_positions(scores[candidates], k, candidates)]
+        metrics.inc("documents_scored", len(candidates))
+        return [(self.docs[doc_id], score * self.scale) for doc_id, score in zip(order.tolist(), scores[order].tolist())]
+
+
+def load_bm25(path: str | None = None) -> BM25Index | None:
+    """
+    Открыть индекс BM25 по пути из переменной окружения BM25_PATH
+
+    :param path: путь до файла
+    :return: объект `BM25Index` или None, если индекс не собран
+    """
+    path = path or os.getenv("BM25_PATH")
+    return BM25Index(path) if path and os.path.isfile(path) else None
+
+
+def build_bm25(tf_idfs_path: str, path: str, bits: int = 8, k1: float = 1.2, b: float = 0.75) -> int:
+    """
+    Собрать индекс BM25 по результатам task4
+
+    :param tf_idfs_path: путь до папки с TF-IDF или до файла хранилища
+    :param path: путь до файла индекса
+    :param bits: разрядность вкладов
+    :param k1: параметр k1
+    :param b: параметр b
+    :return: количество документов
+    """
+    with metrics.stage("read"):
+        lengths = read_lengths(tf_idfs_path)
+        tfs = read_tfs(tf_idfs_path)
+    # длины не восстанавливаются по TF: доли `count / length` с общим множителем дают неверную длину
+    assert lengths is not None, (
+        f"В {tf_idfs_path} нет длин документов, пересоберите TF-IDF командой python -m task4.task4"
+    )
+    with metrics.stage("impacts"):
+        # TF в task4 - доля вхождений `count / length`, количество восстанавливается по сохраненной длине
+        counts = {
+            doc: {term: round(tf * lengths[doc]) for term, tf in doc_tfs.items()}
+            for doc, doc_tfs in tfs.items() if doc_tfs
+        }
+        # средняя длина считается только по непустым документам, как и при сборке pipeline.build
+        term_impacts = impacts(counts, {doc: lengths[doc] for doc in counts}, k1, b)
+    with metrics.stage("write"):
+        write_bm25(path, term_impacts, list(tfs), bits, k1, b)
+    return len(tfs)
+
+
+if __name__ == "__main__":
+    prevalidate_env_variables()
+    with profiling():
+        docs_count = build_bm25(
+            tf_idfs_location(),
+            os.getenv("BM25_PATH"),
+            bits=int(os.getenv("BM25_BITS") or 8),
+            k1=float(os.getenv("BM25_K1") or 1.2),
+            b=float(os.getenv("BM25_B") or 0.75),
+        )
+    print(f"Индекс BM25 записан: документов {docs_count}")
@@ -0,0 +1,109 @@
+"""
+Компактные векторы TF-IDF документов.
+
+Вместо `defaultdict(float)` на каждый документ векторы хранятся столбцами, как разреженная матрица CSC:
+указатели начала документов (int64), идентификаторы терминов словаря (int32) и веса (float64) подряд
+для всех документов. Из столбцов без промежуточных словарей строится матрица `RankingEngine`.
+"""
+import os
+from array import array
+
+import numpy as np
+from scipy.sparse import csc_matrix
+
+from common.vocabulary import Vocabulary
+from task4.store import TfIdfStore, is_store
+from task5.ranking import RankingEngine
+
+
+class CompactVectors:
+    __slots__ = ("docs", "indptr", "term_ids", "weights")
+
+    def __init__(self, docs: list[str], indptr: np.ndarray, term_ids: np.ndarray, weights: np.ndarray):
+        """
+        :param docs: документы в порядке столбцов
+        :param indptr: начало вектора каждого документа в `term_ids` и `weights`, длина на 1 больше числа документов
+        :param term_ids: идентификаторы терминов
+        :param weights: веса TF-IDF
+        """
+        self.docs = docs
+        self.indptr = indptr
+        self.term_ids = term_ids
+        self.weights = weights
+
+    @classmethod
+    def from_vectors(cls, vectors: dict[str, dict[int, float]]) -> "CompactVectors":
+        """
+        Перевести векторы-словари в столбцы
+
+        :param vectors: документ -> вектор TF-IDF (идентификатор термина -> вес)
+        :return: объект `CompactVectors`
+        """
+        indptr, term_ids, weights = array("q", [0]), array("i"), array("d")
+        for vector in vectors.values():
+            term_ids.extend(vector.keys())
+            weights.extend(vector.values())
+            indptr.append(len(term_ids))
+        return cls(
+            list(vectors), np.frombuffer(indptr, dtype=np.int64), np.frombuffer(term_ids, dtype=np.int32),
+            np.frombuffer(weights, dtype=np.float64),
+        )
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def vector(self, position: int) -> dict[int, float]:
+        """
+        Получить вектор документа словарем, как в `task5.task5.generate_vectors`
+
+        :param position: номер документа в `docs`
+        :return: идентификатор термина -> вес
+        """
+        start, end = self.indptr[position], self.indptr[position + 1]
+        return dict(zip(self.term_ids[start:end].tolist(), self.weights[start:end].tolist()))
+
+    def engine(self, terms_count: int) -> RankingEngine:
+        """
+        Построить движок ранжирования, результат совпадает с `RankingEngine.from_vectors`
+
+        :param terms_count: размер словаря
+        :return: объект `RankingEngine`
+        """
+        matrix = csc_matrix((self.weights, self.term_ids, self.indptr), shape=(terms_count, len(self.docs)))
+        return RankingEngine(self.docs, matrix.tocsr())
+
+
+def load_compact_vectors(tf_idfs_path: str, vocabulary: Vocabulary, prefix: str = "lemmes") -> CompactVectors:
+    """
+    Прочитать векторы TF-IDF сразу в столбцы, не создавая словарей документов
+
+    :param tf_idfs_path: путь до папки с TF-IDF или до файла хранилища `task4.store`
+    :param vocabulary: словарь терминов
+    :param prefix: префикс файлов
+    :return: объект `CompactVectors`
+    """
+    if is_store(tf_idfs_path):
+        store = TfIdfStore(tf_idfs_path)
+        columns = store.columns(prefix)
+        # идентификаторы хранилища переводятся в идентификаторы словаря одной индексацией
+        mapping = np.array([vocabulary[term] for term in columns.terms], dtype=np.int32)
+        idf = columns.idf.astype(np.float64)
+        return CompactVectors(
+            store.docs, columns.offsets, mapping[columns.term_ids],
+            columns.tf.astype(np.float64) * idf[columns.term_ids],
+        )
+
+    docs, indptr, term_ids, weights = [], array("q", [0]), array("i"), array("d")
+    for file in sorted(os.listdir(tf_idfs_path)):
+        if file.startswith(prefix):
+            with open(os.path.join(tf_idfs_path, file), "r", encoding="utf8") as f:
+                for line in f:
+                    token, tf, idf = line.split()
+                    term_ids.append(vocabulary[token])
+                    weights.append(float(tf) * float(idf))
+            docs.append(file.removeprefix(prefix))
+            indptr.append(len(term_ids))
+    return CompactVectors(
+        docs, np.frombuffer(indptr, dtype=np.int64), np.frombuffer(term_ids, dtype=np.int32),
+        np.frombuffer(weights, dtype=np.float64),
+    )
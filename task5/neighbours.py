@@ -0,0 +1,182 @@
+"""
+Заранее посчитанные похожие документы ("похожие посты").
+
+По результатам task4 строится матрица документ-термин с нормированными строками, тогда косинусное сходство
+всех пар - произведение матрицы на транспонированную. Оно считается блоками строк, чтобы в памяти было
+не больше `block_size` строк результата, блоки распределяются по процессам пула. Для каждого документа
+сохраняются k самых похожих документов, сервер отвечает по готовой таблице за O(k).
+
+Сборка: python -m task5.neighbours
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from common.metrics import metrics, profiling
+from common.parallel import get_workers_count
+from task4.store import tf_idfs_location
+from task5.ranking import top_positions
+from task5.snapshot import read_tf_idfs
+
+block_matrix: csr_matrix | None = None
+
+
+def prevalidate_env_variables():
+    assert tf_idfs_location(), "Укажите папку TF-IDF в TF_IDFS_PATH или хранилище в TF_IDF_STORE_PATH"
+    assert os.getenv("NEIGHBOURS_PATH"), "Укажите путь для файла похожих документов в переменную NEIGHBOURS_PATH"
+
+
+def normalized_matrix(vectors: dict[str, dict[str, float]]) -> csr_matrix:
+    """
+    Построить матрицу документ-термин с единичными нормами строк
+
+    :param vectors: документ -> вектор TF-IDF (термин -> вес)
+    :return: CSR матрица в порядке документов `vectors`
+    """
+    ids = {}
+    indptr, indices, data = [0], [], []
+    for vector in vectors.values():
+        indices.extend(ids.setdefault(term, len(ids)) for term in vector)
+        data.extend(vector.values())
+        indptr.append(len(indices))
+
+    matrix = csr_matrix(
+        (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+        shape=(len(vectors), len(ids)),
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    matrix.data /= np.repeat(np.where(norms > 0, norms, 1), np.diff(matrix.indptr))
+    return matrix
+
+
+def _init_worker(matrix: csr_matrix):
+    global block_matrix
+    block_matrix = matrix
+
+
+def top_neighbours(matrix: csr_matrix, start: int, end: int, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Найти k самых похожих документов для строк блока
+
+    :param matrix: нормированная матрица документ-термин
+    :param start: первая строка блока
+    :param end: строка после последней строки блока
+    :param k: количество соседей
+    :return: номера соседей и сходства размера (end - start, k), недостающие соседи - -1 и 0
+    """
+    similarities = (matrix[start:end] @ matrix.T).tocsr()
+    ids = np.full((end - start, k), -1, dtype=np.int32)
+    scores = np.zeros((end - start, k), dtype=np.float64)
+    for row in range(end - start):
+        row_start, row_end = similarities.indptr[row], similarities.indptr[row + 1]
+        docs, values = similarities.indices[row_start:row_end], similarities.data[row_start:row_end]
+        # сам документ и документы без общих терминов не считаются соседями
+        mask = (docs != start + row) & (values > 0)
+        docs, values = docs[mask], values[mask]
+        order = top_positions(values, k, docs)
+        ids[row, :len(order)] = docs[order]
+        scores[row, :len(order)] = values[order]
+
+    return ids, scores
+
+
+def _top_neighbours_in_worker(start: int, end: int, k: int) -> tuple[np.ndarray, np.ndarray]:
+    return top_neighbours(block_matrix, start, end, k)
+
+
+def compute_neighbours(
+        matrix: csr_matrix, k: int = 10, block_size: int = 1024, workers: int = 1
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Посчитать соседей всех документов блочными произведениями разреженных матриц
+
+    :param matrix: нормированная матрица документ-термин
+    :param k: количество соседей
+    :param block_size: количество строк в блоке, ограничивает память под результат произведения
+    :param workers: количество процессов
+    :return: номера соседей и сходства размера (количество документов, k)
+    """
+    blocks = [(start, min(start + block_size, matrix.shape[0])) for start in range(0, matrix.shape[0], block_size)]
+    if workers == 1:
+        results = [top_neighbours(matrix, start, end, k) for start, end in blocks]
+    else:
+        # матрица передается в процессы один раз при их запуске
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(matrix,)) as executor:
+            results = list(executor.map(
+                _top_neighbours_in_worker, [start for start, _ in blocks], [end for _, end in blocks], [k] * len(blocks)
+            ))
+
+    if not results:
+        return np.zeros((0, k), dtype=np.int32), np.zeros((0, k), dtype=np.float64)
+    return np.vstack([ids for ids, _ in results]), np.vstack([scores for _, scores in results])
+
+
+def write_neighbours(path: str, docs: list[str], ids: np.ndarray, scores: np.ndarray):
+    """
+    Сохранить таблицу соседей
+
+    :param path: путь до файла `.npz`
+    :param docs: документы в порядке строк
+    :param ids: номера соседей
+    :param scores: сходства
+    """
+    with open(f"{path}.tmp", "wb") as f:
+        np.savez(f, docs=np.array(docs), ids=ids, scores=scores)
+    os.replace(f"{path}.tmp", path)
+
+
+class Neighbours:
+    def __init__(self, path: str):
+        with np.load(path) as data:
+            self.docs: list[str] = data["docs"].tolist()
+            self.ids: np.ndarray = data["ids"]
+            self.scores: np.ndarray = data["scores"]
+        self.rows = {doc: row for row, doc in enumerate(self.docs)}
+
+    def __contains__(self, doc: str) -> bool:
+        return doc in self.rows
+
+    def similar(self, doc: str, k: int | None = None) -> list[tuple[str, float]]:
+        """
+        Получить похожие документы
+
+        :param doc: документ
+        :param k: количество документов, по умолчанию - все сохраненные
+        :return: список пар документ, сходство по убыванию сходства
+        """
+        row = self.rows[doc]
+        return [
+            (self.docs[neighbour], float(score))
+            for neighbour, score in zip(self.ids[row, :k].tolist(), self.scores[row, :k].tolist()) if neighbour >= 0
+        ]
+
+
+def load_neighbours(path: str | None = None) -> Neighbours | None:
+    """
+    Открыть таблицу соседей по пути из переменной окружения NEIGHBOURS_PATH
+
+    :param path: путь до файла
+    :return: объект `Neighbours` или None, если таблица не собрана
+    """
+    path = path or os.getenv("NEIGHBOURS_PATH")
+    return Neighbours(path) if path and os.path.isfile(path) else None
+
+
+if __name__ == "__main__":
+    prevalidate_env_variables()
+    with profiling():
+        with metrics.stage("read"):
+            vectors, _ = read_tf_idfs(tf_idfs_location())
+            matrix = normalized_matrix(vectors)
+        with metrics.stage("neighbours"):
+            ids, scores = compute_neighbours(
+                matrix,
+                k=int(os.getenv("NEIGHBOURS_K") or 10),
+                block_size=int(os.getenv("NEIGHBOURS_BLOCK_SIZE") or 1024),
+                workers=get_workers_count(),
+            )
+        with metrics.stage("write"):
+            write_neighbours(os.getenv("NEIGHBOURS_PATH"), list(vectors), ids, scores)
+    print(f"Похожие документы записаны: документов {len(vectors)}")
@@ -0,0 +1,233 @@
+import heapq
+import math
+from bisect import bisect_left
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from common.metrics import metrics
+
+
+def top_positions(scores: np.ndarray, k: int, ids: np.ndarray | None = None) -> np.ndarray:
+    """
+    Выбрать k лучших оценок: по убыванию оценки, при равных оценках - по возрастанию идентификатора
+
+    :param scores: оценки
+    :param k: количество
+    :param ids: идентификаторы для упорядочивания равных оценок, по умолчанию - позиции в `scores`
+    :return: позиции в `scores` в порядке результата
+    """
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    ids = np.arange(len(scores)) if ids is None else ids
+    if k < len(scores):
+        # частичный отбор без сортировки всего массива: берутся все оценки не хуже k-й, иначе из равных
+        # на границе argpartition оставил бы произвольные, а не с наименьшими идентификаторами
+        kth = -np.partition(-scores, k - 1)[k - 1]
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.lexsort((ids[candidates], -scores[candidates]))][:k]
+
+
+class RankingEngine:
+    """
+    Косинусное ранжирование по разреженной CSR матрице термин-документ.
+
+    Строки матрицы - термины, столбцы - документы, поэтому запрос затрагивает только строки своих терминов.
+    Нормы документов считаются один раз при построении.
+    """
+
+    def __init__(self, docs: list[str], matrix: csr_matrix, norms: np.ndarray | None = None):
+        """
+        :param docs: идентификаторы документов в порядке столбцов матрицы
+        :param matrix: матрица весов TF-IDF размера (количество терминов, количество документов)
+        :param norms: заранее посчитанные нормы документов, по умолчанию считаются по матрице
+        """
+        self.docs = docs
+        self.matrix = matrix
+        self.norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel()) if norms is None else norms
+        self._bounds: np.ndarray | None = None
+
+    @property
+    def bounds(self) -> np.ndarray:
+        """
+        Верхние оценки терминов: максимальный вес термина в документе, деленный на норму документа
+        """
+        if self._bounds is None:
+            weights = self.matrix.data / np.where(self.norms > 0, self.norms, 1)[self.matrix.indices]
+            lengths = np.diff(self.matrix.indptr)
+            bounds = np.zeros(self.matrix.shape[0], dtype=np.float64)
+            starts = self.matrix.indptr[:-1][lengths > 0]
+            if len(starts):
+                bounds[lengths > 0] = np.maximum.reduceat(weights, starts)
+            self._bounds = bounds
+        return self._bounds
+
+    @classmethod
+    def from_vectors(cls, vectors: dict[str, dict[int, float]], terms_count: int) -> "RankingEngine":
+        """
+        Построить движок из векторов документов
+
+        :param vectors: словарь документ -> вектор TF-IDF (идентификатор термина -> вес)
+        :param terms_count: размер словаря
+        :return: объект `RankingEngine`
+        """
+        docs = list(vectors)
+        rows, cols, data = [], [], []
+        for col, vector in enumerate(vectors.values()):
+            rows.extend(vector.keys())
+            cols.extend([col] * len(vector))
+            data.extend(vector.values())
+
+        matrix = csr_matrix(
+            (np.array(data, dtype=np.float64), (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64))),
+            shape=(terms_count, len(docs)),
+        )
+        return cls(docs, matrix)
+
+    def query_vector(self, query: dict[int, float]) -> csr_matrix:
+        ids = np.fromiter(query.keys(), dtype=np.int64, count=len(query))
+        values = np.fromiter(query.values(), dtype=np.float64, count=len(query))
+        return csr_matrix((values, (np.zeros_like(ids), ids)), shape=(1, self.matrix.shape[0]))
+
+    def score(self, query: dict[int, float]) -> np.ndarray:
+        """
+        Посчитать косинусное сходство запроса со всеми документами одним умножением вектора на матрицу
+
+        :param query: вектор TF-IDF запроса
+        :return: массив сходств в порядке `self.docs`
+        """
+        query_vector = self.query_vector(query)
+        query_norm = np.sqrt(query_vector.multiply(query_vector).sum())
+        dots = (query_vector @ self.matrix).toarray().ravel()
+        denominators = self.norms * query_norm
+        return np.divide(dots, denominators, out=np.zeros_like(dots), where=denominators > 0)
+
+    def top(self, query: dict[int, float], k: int | None = None) -> list[tuple[str, float]]:
+        """
+        Получить документы, наиболее похожие на запрос
+
+        :param query: вектор TF-IDF запроса
+        :param k: количество документов, `None` - все документы
+        :return: список пар документ, сходство по убыванию сходства
+        """
+        scores = self.score(query)
+        order = top_positions(scores, len(scores) if k is None else k)
+        return [(self.docs[i], float(scores[i])) for i in order]
+
+    def top_k(self, query: dict[int, float], k: int) -> list[tuple[str, float]]:
+        """
+        Получить k документов с ненулевым сходством, наиболее похожих на запрос, алгоритмом MaxScore.
+
+        Документы обходятся по возрастанию номера столбца. Термины упорядочены по верхней оценке вклада
+        в сходство, термины с наименьшими оценками, сумма которых не превышает порога k-го результата,
+        считаются необязательными: документ, встречающийся только в них, не может попасть в результат,
+        поэтому кандидаты берутся только из списков обязательных терминов, а вклад необязательных
+        досчитывается, пока сходство еще может превысить порог. Результат совпадает с `top`.
+
+        :param query: вектор TF-IDF запроса
+        :param k: количество документов
+        :return: список пар документ, сходство по убыванию сходства
+        """
+        query_norm = math.sqrt(sum(value ** 2 for value in query.values()))
+        if k <= 0 or not query_norm:
+            return []
+
+        lists = []
+        for term_id, value in query.items():
+            start, end = self.matrix.indptr[term_id], self.matrix.indptr[term_id + 1]
+            if value > 0 and start < end:
+                bound = value / query_norm * float(self.bounds[term_id])
+                lists.append((bound, value, self.matrix.indices[start:end].tolist(), self.matrix.data[start:end].tolist()))
+        lists.sort(key=lambda item: item[0])
+
+        # prefix[i] - сумма верхних оценок списков 0..i
+        prefix = np.cumsum([item[0] for item in lists]).tolist()
+        positions = [0] * len(lists)
+        end = len(self.docs)
+        current = [ids[0] for _, _, ids, _ in lists]  # текущий документ списка, `end` - список исчерпан
+        norms = self.norms
+        heap: list[tuple[float, int]] = []  # (сходство, -номер документа), на вершине - худший из k лучших
+        threshold = 0.0
+        essential = 0  # списки [0, essential) необязательные
+        scored = 0
+
+        while essential < len(lists):
+            doc = min(current[essential:])
+            if doc == end:
+                break
+            scored += 1
+
+            dot = 0.0
+            for i in range(essential, len(lists)):
+                if current[i] == doc:
+                    _, value, ids, weights = lists[i]
+                    dot += value * weights[positions[i]]
+                    positions[i] += 1
+                    current[i] = ids[positions[i]] if positions[i] < len(ids) else end
+            denominator = query_norm * norms[doc]
+            if not denominator:
+                continue
+
+            pruned = False
+            for i in range(essential - 1, -1, -1):
+                # небольшой запас компенсирует ошибки округления при сравнении с оценками
+                if dot / denominator + prefix[i] < threshold * (1 - 1e-9):
+                    pruned = True
+                    break
+                _, value, ids, weights = lists[i]
+                positions[i] = bisect_left(ids, doc, positions[i])
+                if positions[i] < len(ids) and ids[positions[i]] == doc:
+                    dot += value * weights[positions[i]]
+            if pruned or not dot:
+                continue
+
+            item = (float(dot / denominator), -doc)
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+            if len(heap) == k:
+                threshold = heap[0][0]
+                while essential < len(lists) and prefix[essential] < threshold * (1 - 1e-9):
+                    essential += 1
+
+        metrics.inc("postings_scanned", sum(len(ids) for _, _, ids, _ in lists))
+        metrics.inc("documents_scored", scored)
+        return [(self.docs[-doc], similarity) for similarity, doc in sorted(heap, reverse=True)]
+
+    def top_k_batch(self, queries: list[dict[int, float]], ks: list[int]) -> list[list[tuple[str, float]]]:
+        """
+        Выполнить пачку запросов одним умножением матрицы запросов на матрицу документов
+
+        :param queries: векторы TF-IDF запросов
+        :param ks: количество документов для каждого запроса
+        :return: для каждого запроса список пар документ, сходство с ненулевым сходством по убыванию, как в `top_k`
+        """
+        rows, cols, data = [], [], []
+        for row, query in enumerate(queries):
+            rows.extend([row] * len(query))
+            cols.extend(query.keys())
+            data.extend(query.values())
+        query_matrix = csr_matrix(
+            (np.array(data, dtype=np.float64), (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64))),
+            shape=(len(queries), self.matrix.shape[0]),
+        )
+        query_norms = np.sqrt(np.asarray(query_matrix.multiply(query_matrix).sum(axis=1)).ravel())
+        dots = (query_matrix @ self.matrix).tocsr()
+        lengths = np.diff(self.matrix.indptr)
+        metrics.inc("postings_scanned", int(sum(lengths[list(query)].sum() for query in queries)))
+        metrics.inc("documents_scored", dots.nnz)
+
+        results = []
+        for row, k in enumerate(ks):
+            start, end = dots.indptr[row], dots.indptr[row + 1]
+            docs, row_dots = dots.indices[start:end], dots.data[start:end]
+            denominators = self.norms[docs] * query_norms[row]
+            scores = np.divide(row_dots, denominators, out=np.zeros_like(row_dots), where=denominators > 0)
+            docs, scores = docs[scores > 0], scores[scores > 0]
+            order = top_positions(scores, k, docs)
+            results.append([(self.docs[i], float(scores[j])) for j, i in zip(order, docs[order])])
+
+        return results
@@ -1,42 +1,68 @@
-import os
-
-from fastapi import FastAPI, Query
-from starlette.responses import StreamingResponse
-
-from task5.task5 import (
-    prevalidate_env_variables,
-    init_morph,
-    load_lemmes,
-    load_index,
-    extract_archive,
-    get_all_texts,
-    get_words_set_per_doc,
-    generate_vectors,
-    normalize,
-    get_cosine_similarity,
-    get_tf_idf,
-)
+import asyncio
+import time
+from heapq import merge
+from itertools import islice
+
+from fastapi import FastAPI, HTTPException, Query
+from starlette.responses import PlainTextResponse, StreamingResponse
+
+from common.cache import QueryCache, init_query_cache
+from common.lemmatizer import init_lemmatizer
+from common.metrics import lemmatizer_collector, metrics
+from common.segments import init_segment_index, rescale
+from task5.task5 import init_morph, normalize
+from task5.batching import init_batcher
+from task5.bm25 import load_bm25
+from task5.neighbours import load_neighbours
+from task5.shards import ShardError, init_coordinator
+from task5.snapshot import load_snapshot
+from task5.suggest import load_suggester
 
 app = FastAPI()
 
 print("Загрузка индексов")
-prevalidate_env_variables()
-dir_path = os.getenv("POSTS_DIR_PATH")
-morph = init_morph()
+lemmatizer = init_lemmatizer(init_morph())
+
+# все данные для ранжирования загружаются из одного заранее собранного снимка
+snapshot = load_snapshot()
+# если задан SHARDS_PATH, ранжируют процессы шардов, а снимок нужен только для словаря, IDF и URL
+coordinator = init_coordinator()
+# без шардов одновременные запросы ранжируются пачками по матрице снимка
+batcher = init_batcher(snapshot.engine()) if coordinator is None else None
+# индекс BM25 с квантованными вкладами, модель выбирается параметром model
+bm25 = load_bm25()
+# заранее посчитанные похожие документы
+neighbours = load_neighbours()
+# подсказки по префиксу, ранжированные по документной частоте
+suggester = load_suggester(snapshot)
 
-tf_idfs_path = os.getenv("TF_IDFS_PATH")
+# инкрементальный индекс поверх снимка: новые посты видны без перезапуска, IDF считается по глобальной статистике
+segment_index = init_segment_index(base=snapshot)
 
-lemmes_set = load_lemmes(os.getenv("LEMMES_PATH"))
-index = load_index("index.txt")
-extract_archive(dir_path)
-texts = get_all_texts(dir_path)
+# кэш результатов по леммам запроса и отдельный кэш нормализации текста запроса
+result_cache = init_query_cache()
+normalized_queries = QueryCache(maxsize=result_cache.maxsize * 4)
 
-texts_words = get_words_set_per_doc(list(texts.values()))
-lemmes = list(lemmes_set)
-tf_idfs = generate_vectors(os.getenv("TF_IDFS_PATH"), lemmes)
+metrics.describe("search_seconds", "Время обработки запроса /search/")
+metrics.describe("suggest_seconds", "Время обработки запроса /suggest/")
+metrics.describe("shard_seconds", "Время ответа шарда координатору")
+metrics.collect(lemmatizer_collector(lemmatizer), "counter")
+metrics.collect(lambda: {
+    "result_cache_hits": result_cache.hits,
+    "result_cache_misses": result_cache.misses,
+    "query_cache_hits": normalized_queries.hits,
+    "query_cache_misses": normalized_queries.misses,
+}, "counter")
+if batcher is not None:
+    metrics.collect(lambda: {"search_batches": batcher.batches, "search_batched_queries": batcher.queries}, "counter")
+metrics.collect(lambda: {"result_cache_entries": len(result_cache)})
 
-normalized_texts = {filename: normalize(text, morph) for filename, text in texts.items()}
-normalized_texts_words = get_words_set_per_doc(list(normalized_texts.values()))
+
+@app.on_event("shutdown")
+async def shutdown():
+    if batcher is not None:
+        await batcher.stop()
+    lemmatizer.save()
 
 
 @app.get("/")
@@ -45,15 +71,125 @@ def index_page():
 
 
 @app.get("/search/")
-def search(query: str = Query(..., description="Поисковый запрос")):
-    query = normalize(query, morph)
-    if query == "":
-        return []
-    query_tf_idf = {
-        lemmes.index(token): float(tf) * float(idf) for token, tf, idf in get_tf_idf(query, normalized_texts_words) if token in lemmes_set
-    }
-    if not len(query_tf_idf):
-        return []
-    similarities = {doc: get_cosine_similarity(query_tf_idf, tf_idf) for doc, tf_idf in tf_idfs.items()}
-    sorted_similarities = list(sorted(similarities.items(), key=lambda s: -s[1]))
-    return [(index[similarity[0]], similarity[1]) for similarity in sorted_similarities]
+async def search(
+        query: str = Query(..., description="Поисковый запрос"),
+        limit: int = Query(10, ge=1, le=1000, description="Количество результатов"),
+        offset: int = Query(0, ge=0, description="Количество пропускаемых результатов"),
+        model: str = Query("cosine", regex="^(cosine|bm25)$", description="Модель ранжирования: cosine или bm25"),
+):
+    start = time.perf_counter()
+    metrics.inc("search_queries", model=model)
+    try:
+        if model == "bm25" and bm25 is None:
+            raise HTTPException(status_code=404, detail="Индекс BM25 не собран, запустите python -m task5.bm25")
+        lemmes = normalize_query(query)
+        if not lemmes:
+            return []
+        if segment_index is not None:
+            # новые сегменты загружаются в пуле потоков
+            await asyncio.get_running_loop().run_in_executor(None, segment_index.refresh)
+        # результаты сбрасываются, когда меняется набор сегментов
+        result_cache.set_version(segment_index.generation if segment_index is not None else None)
+        key = (model, lemmes, offset + limit)
+        if (results := result_cache.get(key)) is None:
+            with metrics.stage("rank"):
+                if model == "bm25":
+                    # сложение списков вкладов идет в пуле потоков, не блокируя цикл событий
+                    results = await asyncio.get_running_loop().run_in_executor(None, bm25.top_k, list(lemmes), offset + limit)
+                    results = [(snapshot.urls.get(doc, doc), score) for doc, score in results]
+                else:
+                    results = await rank(list(lemmes), offset + limit)
+            result_cache.put(key, results)
+        return results[offset:]
+    finally:
+        metrics.observe("search_seconds", time.perf_counter() - start)
+
+
+async def rank(lemmes: list[str], k: int) -> list[tuple[str, float]]:
+    """
+    Получить k самых похожих на запрос документов с ненулевым сходством
+
+    :param lemmes: леммы запроса
+    :param k: количество документов
+    :return: список пар URL, сходство по убыванию сходства
+    """
+    if segment_index is None:
+        query_tf_idf = snapshot.query_vector(lemmes)
+    else:
+        # вектор запроса по глобальной статистике снимка и сегментов, снимку передаются только его термины
+        weights = segment_index.query_weights(lemmes)
+        query_tf_idf = {snapshot.ids[lemme]: weight for lemme, weight in weights.items() if lemme in snapshot.ids}
+
+    results = []
+    if query_tf_idf:
+        try:
+            if coordinator is not None:
+                results = await coordinator.search(query_tf_idf, k)
+            else:
+                results = await batcher.search(query_tf_idf, k)
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=503, detail="Сервер перегружен, повторите запрос позже")
+        except ShardError:
+            raise HTTPException(status_code=503, detail="Шард индекса недоступен, повторите запрос позже")
+    results = [(snapshot.urls[doc], similarity) for doc, similarity in results]
+    if segment_index is None:
+        return results
+
+    segment_results = await asyncio.get_running_loop().run_in_executor(None, segment_index.search, weights, k)
+    # при равном сходстве документы снимка идут раньше документов сегментов
+    return list(islice(merge(
+        rescale(results, query_tf_idf, weights),
+        [(segment_index.url(doc), similarity) for doc, similarity in segment_results],
+        key=lambda result: -result[1],
+    ), k))
+
+
+def normalize_query(query: str) -> tuple[str, ...]:
+    """
+    Получить леммы запроса, разные формы одного запроса дают один и тот же ключ кэша результатов
+    """
+    if (lemmes := normalized_queries.get(query)) is None:
+        with metrics.stage("normalize"):
+            lemmes = tuple(normalize(query, lemmatizer).split())
+        normalized_queries.put(query, lemmes)
+    return lemmes
+
+
+@app.get("/suggest/")
+def suggest(
+        query: str = Query(..., description="Начало запроса"),
+        limit: int = Query(10, ge=1, le=10, description="Количество подсказок"),
+):
+    start = time.perf_counter()
+    try:
+        if suggester is None:
+            raise HTTPException(status_code=404, detail="Подсказки недоступны, не найден файл лемм LEMMES_PATH")
+        # дополняется последнее слово запроса, предыдущие слова остаются как есть
+        head, _, prefix = query.rpartition(" ")
+        if not prefix:
+            return []
+        head = f"{head} " if head else ""
+        return [(head + lemme, frequency) for lemme, frequency in suggester.suggest(prefix, limit)]
+    finally:
+        metrics.observe("suggest_seconds", time.perf_counter() - start)
+
+
+@app.get("/similar/{doc}")
+def similar(doc: str, limit: int = Query(10, ge=1, le=1000, description="Количество результатов")):
+    if neighbours is None:
+        raise HTTPException(status_code=404, detail="Похожие документы не посчитаны, запустите python -m task5.neighbours")
+    # документ можно указать именем файла или идентификатором поста
+    doc = doc if doc in neighbours else f"{doc}.txt"
+    if doc not in neighbours:
+        raise HTTPException(status_code=404, detail="Документ не найден")
+    return [(snapshot.urls.get(other, other), similarity) for other, similarity in neighbours.similar(doc, limit)]
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/stats/")
+def stats():
+    return {"results": result_cache.counters(), "queries": normalized_queries.counters()}
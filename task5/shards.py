@@ -0,0 +1,241 @@
+"""
+Шардированный индекс: документы снимка делятся на N шардов, каждый шард обслуживает отдельный процесс.
+
+Шард - обычный снимок `task5.snapshot` с непрерывным диапазоном документов. Словарь и IDF в каждом шарде
+глобальные, поэтому идентификаторы терминов совпадают во всех шардах, а веса документов и их нормы -
+с весами полного снимка. Координатор строит вектор запроса по глобальному IDF, параллельно отправляет его
+всем шардам и сливает их k лучших результатов. Сходства совпадают с поиском по полному снимку, а при равных
+сходствах документы идут в порядке снимка, так как шарды - последовательные диапазоны.
+
+Процессы шардов отвечают на локальном Unix-сокете. Запрос и ответ - JSON с длиной в 4 байта перед ним:
+запрос ``{"query": [[термин, вес], ...], "k": k}``, ответ - список пар документ, сходство.
+Список шардов и сокетов хранится в `shards.json` в папке SHARDS_PATH.
+
+Разбиение снимка: python -m task5.shards partition [количество]
+Запуск процессов шардов: python -m task5.shards serve
+"""
+import asyncio
+import json
+import os
+import signal
+import struct
+import subprocess
+import sys
+import time
+from heapq import merge
+from itertools import islice
+
+import numpy as np
+
+from common.metrics import metrics, profiling
+from task5.snapshot import Snapshot, load_snapshot, write_snapshot
+
+MANIFEST_FILE = "shards.json"
+LENGTH = struct.Struct("<I")
+
+
+def prevalidate_env_variables():
+    assert os.getenv("SNAPSHOT_PATH"), "Укажите путь для файла снимка в переменную окружения SNAPSHOT_PATH"
+    assert os.getenv("SHARDS_PATH"), "Укажите путь для папки шардов в переменную окружения SHARDS_PATH"
+
+
+def write_shards(snapshot: Snapshot, shards_path: str, count: int) -> list[dict]:
+    """
+    Разбить снимок на шарды с непрерывными диапазонами документов
+
+    :param snapshot: полный снимок
+    :param shards_path: путь до папки шардов
+    :param count: количество шардов, пустые шарды не создаются
+    :return: описания шардов из `shards.json`
+    """
+    os.makedirs(shards_path, exist_ok=True)
+    columns = snapshot.matrix.tocsc()
+    idfs = dict(zip(snapshot.terms, snapshot.idf.tolist()))
+    bounds = np.linspace(0, len(snapshot.docs), min(count, len(snapshot.docs)) + 1).round().astype(int).tolist()
+
+    shards = []
+    for number, (low, high) in enumerate(zip(bounds, bounds[1:])):
+        vectors = {}
+        for col in range(low, high):
+            start, end = columns.indptr[col], columns.indptr[col + 1]
+            terms = [snapshot.terms[term_id] for term_id in columns.indices[start:end].tolist()]
+            vectors[snapshot.docs[col]] = dict(zip(terms, columns.data[start:end].tolist()))
+        shard = {"file": f"shard_{number:03d}.bin", "socket": f"shard_{number:03d}.sock", "docs": high - low}
+        write_snapshot(os.path.join(shards_path, shard["file"]), vectors, idfs, snapshot.urls)
+        shards.append(shard)
+
+    with open(os.path.join(shards_path, f"{MANIFEST_FILE}.tmp"), "w", encoding="utf8") as f:
+        json.dump({"docs": len(snapshot.docs), "shards": shards}, f, ensure_ascii=False, indent=2)
+    os.replace(os.path.join(shards_path, f"{MANIFEST_FILE}.tmp"), os.path.join(shards_path, MANIFEST_FILE))
+    return shards
+
+
+def read_manifest(shards_path: str) -> list[dict]:
+    with open(os.path.join(shards_path, MANIFEST_FILE), "r", encoding="utf8") as f:
+        return json.load(f)["shards"]
+
+
+async def read_message(reader: asyncio.StreamReader):
+    length, = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+    return json.loads(await reader.readexactly(length))
+
+
+def write_message(writer: asyncio.StreamWriter, message):
+    data = json.dumps(message, ensure_ascii=False).encode("utf8")
+    writer.write(LENGTH.pack(len(data)) + data)
+
+
+async def serve_shard(shard_file: str, socket_path: str):
+    """
+    Отвечать на запросы к шарду на Unix-сокете, пока процесс не остановят
+
+    :param shard_file: путь до снимка шарда
+    :param socket_path: путь до сокета
+    """
+    engine = Snapshot(shard_file).engine()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await read_message(reader)
+                write_message(writer, engine.top_k(dict(request["query"]), request["k"]))
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            # координатор закрыл соединение
+            pass
+        finally:
+            writer.close()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = await asyncio.start_unix_server(handle, socket_path)
+    async with server:
+        await server.serve_forever()
+
+
+def start_workers(shards_path: str, timeout: float = 30.0) -> list[subprocess.Popen]:
+    """
+    Запустить по процессу на каждый шард и дождаться их сокетов
+
+    :param shards_path: путь до папки шардов
+    :param timeout: время ожидания запуска в секундах
+    :return: процессы шардов
+    """
+    shards = read_manifest(shards_path)
+    sockets = [os.path.join(shards_path, shard["socket"]) for shard in shards]
+    for socket_path in sockets:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+    processes = [
+        subprocess.Popen([sys.executable, "-m", "task5.shards", "worker", os.path.join(shards_path, shard["file"]), socket_path])
+        for shard, socket_path in zip(shards, sockets)
+    ]
+
+    deadline = time.monotonic() + timeout
+    while not all(os.path.exists(socket_path) for socket_path in sockets):
+        if time.monotonic() > deadline or any(process.poll() is not None for process in processes):
+            stop_workers(processes)
+            raise RuntimeError("Процессы шардов не запустились")
+        time.sleep(0.05)
+    return processes
+
+
+def stop_workers(processes: list[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+
+class ShardError(ConnectionError):
+    """
+    Шард не ответил на запрос
+    """
+
+
+class ShardCoordinator:
+    """
+    Координатор: рассылает запрос всем шардам и сливает их результаты
+    """
+
+    def __init__(self, shards_path: str, timeout: float = 5.0):
+        """
+        :param shards_path: путь до папки шардов
+        :param timeout: время ожидания ответа шарда в секундах
+        """
+        self.sockets = [os.path.join(shards_path, shard["socket"]) for shard in read_manifest(shards_path)]
+        self.timeout = timeout
+
+    def __len__(self) -> int:
+        return len(self.sockets)
+
+    async def _request(self, number: int, request: dict) -> list[tuple[str, float]]:
+        start = time.perf_counter()
+        try:
+            # соединение на запрос: подключение к локальному сокету дешевле синхронизации общих соединений
+            reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(self.sockets[number]), self.timeout)
+            try:
+                write_message(writer, request)
+                await writer.drain()
+                response = await asyncio.wait_for(read_message(reader), self.timeout)
+            finally:
+                writer.close()
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            metrics.inc("shard_errors", shard=str(number))
+            raise ShardError(f"Шард {number} не ответил: {e!r}") from e
+        metrics.observe("shard_seconds", time.perf_counter() - start, shard=str(number))
+        return [(doc, similarity) for doc, similarity in response]
+
+    async def search(self, query: dict[int, float], k: int) -> list[tuple[str, float]]:
+        """
+        Найти k самых похожих на запрос документов во всех шардах
+
+        :param query: вектор TF-IDF запроса по глобальному IDF
+        :param k: количество документов
+        :return: список пар документ, сходство по убыванию сходства
+        """
+        request = {"query": list(query.items()), "k": k}
+        results = await asyncio.gather(*(self._request(number, request) for number in range(len(self.sockets))))
+        # слияние устойчиво: при равном сходстве раньше идут документы шардов с меньшим номером
+        return list(islice(merge(*results, key=lambda result: -result[1]), k))
+
+
+def init_coordinator(shards_path: str | None = None) -> ShardCoordinator | None:
+    """
+    Создать координатор шардов по пути из переменной окружения SHARDS_PATH,
+    время ожидания ответа шарда задается переменной SHARDS_TIMEOUT
+
+    :param shards_path: путь до папки шардов
+    :return: объект `ShardCoordinator` или None, если путь не задан
+    """
+    shards_path = shards_path or os.getenv("SHARDS_PATH")
+    if not shards_path:
+        return None
+    return ShardCoordinator(shards_path, timeout=float(os.getenv("SHARDS_TIMEOUT") or 5))
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    command = args[0] if args else "partition"
+    if command == "worker":
+        asyncio.run(serve_shard(args[1], args[2]))
+    elif command == "serve":
+        prevalidate_env_variables()
+        # SIGTERM завершает процесс так же, как Ctrl+C, процессы шардов останавливаются в finally
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        workers = start_workers(os.getenv("SHARDS_PATH"))
+        print(f"Запущено процессов шардов: {len(workers)}")
+        try:
+            for worker in workers:
+                worker.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop_workers(workers)
+    else:
+        prevalidate_env_variables()
+        count = int(args[1]) if len(args) > 1 else int(os.getenv("SHARDS_COUNT") or 2)
+        with profiling():
+            with metrics.stage("partition"):
+                shards = write_shards(load_snapshot(), os.getenv("SHARDS_PATH"), count)
+        print(f"Шарды записаны: {len(shards)}, документов {sum(shard['docs'] for shard in shards)}")
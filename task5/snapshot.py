@@ -0,0 +1,196 @@
+"""
+Снимок данных для сервера поиска.
+
+Один файл содержит все, что нужно для ранжирования: словарь лемм, IDF, нормы и веса TF-IDF документов
+в виде CSR матрицы термин-документ и таблицу URL. Сервер отображает файл в память и не читает
+ни посты, ни файлы TF-IDF, pymorphy2 нужен только для нормализации запросов.
+
+Структура файла (little-endian):
+
+* заголовок: сигнатура ``TSNP``, версия, количество документов, количество терминов, размер целых
+  матрицы в байтах, количество весов, смещения массивов IDF, норм, указателей строк, столбцов и весов матрицы,
+  смещение и длина блока строк;
+* массивы NumPy, выровненные по 8 байт: IDF (float64), нормы (float64), указатели строк и номера столбцов
+  (int32, если количество весов и документов в него помещается, иначе int64), веса (float64);
+* блок строк: JSON со списками терминов, документов и URL в utf8.
+
+Сборка: python -m task5.snapshot
+"""
+import json
+import mmap
+import os
+import struct
+from collections import Counter
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from common.metrics import metrics, profiling
+from task4.store import TfIdfStore, is_store, tf_idfs_location
+from task5.ranking import RankingEngine
+
+MAGIC = b"TSNP"
+VERSION = 2
+
+HEADER = struct.Struct("<4sIIIIQQQQQQQQ")
+
+
+def prevalidate_env_variables():
+    assert tf_idfs_location(), "Укажите папку TF-IDF в TF_IDFS_PATH или хранилище в TF_IDF_STORE_PATH"
+    assert os.getenv("SNAPSHOT_PATH"), "Укажите путь для файла снимка в переменную окружения SNAPSHOT_PATH"
+
+
+def read_tf_idfs(tf_idfs_path: str, prefix: str = "lemmes") -> tuple[dict[str, dict[str, float]], dict[str, float]]:
+    """
+    Прочитать TF-IDF документов из текстовой папки task4 или из хранилища `task4.store`
+
+    :param tf_idfs_path: путь до папки с TF-IDF или до файла хранилища
+    :param prefix: префикс файлов
+    :return: документ -> {термин: вес} и термин -> IDF
+    """
+    if is_store(tf_idfs_path):
+        return TfIdfStore(tf_idfs_path).tf_idfs(prefix)
+    vectors, idfs = {}, {}
+    for file in sorted(os.listdir(tf_idfs_path)):
+        if file.startswith(prefix):
+            with open(os.path.join(tf_idfs_path, file), "r", encoding="utf8") as f:
+                vector = vectors[file.removeprefix(prefix)] = {}
+                for line in f:
+                    token, tf, idf = line.split()
+                    vector[token] = float(tf) * float(idf)
+                    idfs[token] = float(idf)
+
+    return vectors, idfs
+
+
+def _align(out: bytearray):
+    out.extend(b"\0" * (-len(out) % 8))
+
+
+def write_snapshot(path: str, vectors: dict[str, dict[str, float]], idfs: dict[str, float], urls: dict[str, str]):
+    """
+    Записать снимок
+
+    :param path: путь до файла
+    :param vectors: документ -> вектор TF-IDF (термин -> вес)
+    :param idfs: термин -> IDF
+    :param urls: документ -> URL
+    """
+    terms = sorted(idfs)
+    ids = {term: term_id for term_id, term in enumerate(terms)}
+    docs = list(vectors)
+
+    rows, cols, data = [], [], []
+    for col, vector in enumerate(vectors.values()):
+        rows.extend(ids[term] for term in vector)
+        cols.extend([col] * len(vector))
+        data.extend(vector.values())
+    matrix = csr_matrix(
+        (np.array(data, dtype=np.float64), (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64))),
+        shape=(len(terms), len(docs)),
+    )
+    matrix.sort_indices()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    # scipy приводит int64 к int32, если значения помещаются, поэтому снимок хранит целые того же типа,
+    # иначе при загрузке массивы копируются из отображения в память процесса
+    index_dtype = np.int32 if max(matrix.nnz, len(docs)) <= np.iinfo(np.int32).max else np.int64
+
+    out = bytearray(HEADER.size)
+    offsets = []
+    for array in (
+            np.array([idfs[term] for term in terms], dtype=np.float64),
+            norms.astype(np.float64),
+            matrix.indptr.astype(index_dtype),
+            matrix.indices.astype(index_dtype),
+            matrix.data.astype(np.float64),
+    ):
+        _align(out)
+        offsets.append(len(out))
+        out.extend(array.tobytes())
+
+    strings = json.dumps(
+        {"terms": terms, "docs": docs, "urls": [urls.get(doc, "") for doc in docs]}, ensure_ascii=False
+    ).encode("utf8")
+    strings_offset = len(out)
+    out.extend(strings)
+
+    HEADER.pack_into(
+        out, 0, MAGIC, VERSION, len(docs), len(terms), np.dtype(index_dtype).itemsize, matrix.nnz,
+        *offsets, strings_offset, len(strings),
+    )
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(out)
+    os.replace(f"{path}.tmp", path)
+
+
+class Snapshot:
+    """
+    Снимок, отображенный в память. Массивы - представления NumPy поверх отображения без копирования.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic, version, docs_count, terms_count, index_size, nnz,
+            idf_offset, norms_offset, indptr_offset, indices_offset, data_offset, strings_offset, strings_length,
+        ) = HEADER.unpack_from(self.mm, 0)
+        assert magic == MAGIC and version == VERSION, f"Файл {path} не является снимком версии {VERSION}"
+
+        strings = json.loads(self.mm[strings_offset:strings_offset + strings_length].decode("utf8"))
+        self.terms: list[str] = strings["terms"]
+        self.docs: list[str] = strings["docs"]
+        self.urls: dict[str, str] = dict(zip(self.docs, strings["urls"]))
+        self.ids = {term: term_id for term_id, term in enumerate(self.terms)}
+
+        index_dtype = np.int32 if index_size == 4 else np.int64
+        self.idf = np.frombuffer(self.mm, dtype=np.float64, count=terms_count, offset=idf_offset)
+        self.norms = np.frombuffer(self.mm, dtype=np.float64, count=docs_count, offset=norms_offset)
+        self.matrix = csr_matrix(
+            (
+                np.frombuffer(self.mm, dtype=np.float64, count=nnz, offset=data_offset),
+                np.frombuffer(self.mm, dtype=index_dtype, count=nnz, offset=indices_offset),
+                np.frombuffer(self.mm, dtype=index_dtype, count=terms_count + 1, offset=indptr_offset),
+            ),
+            shape=(terms_count, docs_count),
+            copy=False,
+        )
+
+    def engine(self) -> RankingEngine:
+        return RankingEngine(self.docs, self.matrix, self.norms)
+
+    def query_vector(self, lemmes: list[str]) -> dict[int, float]:
+        """
+        Получить вектор TF-IDF запроса
+
+        :param lemmes: леммы запроса
+        :return: идентификатор термина -> вес, только для терминов снимка
+        """
+        return {
+            self.ids[lemme]: count / len(lemmes) * float(self.idf[self.ids[lemme]])
+            for lemme, count in Counter(lemmes).items() if lemme in self.ids
+        }
+
+
+def load_snapshot(path: str | None = None) -> Snapshot:
+    """
+    Открыть снимок по пути из переменной окружения SNAPSHOT_PATH
+
+    :param path: путь до файла снимка
+    :return: объект `Snapshot`
+    """
+    path = path or os.getenv("SNAPSHOT_PATH")
+    assert path and os.path.isfile(path), "Не найден снимок SNAPSHOT_PATH, соберите его командой python -m task5.snapshot"
+    return Snapshot(path)
+
+
+if __name__ == "__main__":
+    prevalidate_env_variables()
+    with profiling():
+        with open("index.txt", "r", encoding="utf8") as f:
+            urls = dict(line.split() for line in f if line.strip())
+        with metrics.stage("read"):
+            vectors, idfs = read_tf_idfs(tf_idfs_location())
+        with metrics.stage("write"):
+            write_snapshot(os.getenv("SNAPSHOT_PATH"), vectors, idfs, urls)
+    print(f"Снимок записан: документов {len(vectors)}, терминов {len(idfs)}")
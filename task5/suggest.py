@@ -0,0 +1,106 @@
+"""
+Подсказки по префиксу слова.
+
+Ключи словаря - леммы и их словоформы из `lemmes.txt` в нижнем регистре с заменой ё на е, каждый ключ указывает
+на лемму. Ключи хранятся в отсортированном массиве, поэтому ключи с общим префиксом (узел префиксного дерева)
+занимают непрерывный диапазон. Леммы пронумерованы по убыванию документной частоты, и лучшие подсказки
+диапазона - его k наименьших номеров лемм.
+
+Для узлов, диапазон которых длиннее `threshold`, k лучших лемм считаются при загрузке, для остальных -
+выбираются из диапазона не длиннее `threshold` при запросе. Время ответа не зависит от того,
+сколько слов начинается с префикса.
+"""
+import heapq
+import os
+from bisect import bisect_left
+
+import numpy as np
+
+from task5.snapshot import Snapshot
+
+# символ больше любой буквы ключа, ограничивает диапазон префикса справа
+MAX_CHAR = "\uffff"
+
+
+def normalize_key(word: str) -> str:
+    return word.lower().replace("ё", "е")
+
+
+def read_forms(lemmes_path: str) -> dict[str, list[str]]:
+    """
+    Прочитать леммы и словоформы
+
+    :param lemmes_path: путь до файла лемм, в строке лемма и ее словоформы
+    :return: словарь лемма -> словоформы
+    """
+    with open(lemmes_path, "r", encoding="utf8") as f:
+        return {words[0]: words[1:] for words in (line.split() for line in f) if words}
+
+
+class Suggester:
+    def __init__(self, forms: dict[str, list[str]], frequencies: dict[str, int], k: int = 10, threshold: int = 64):
+        """
+        :param forms: лемма -> словоформы
+        :param frequencies: лемма -> количество документов
+        :param k: количество заранее посчитанных подсказок узла, максимальное количество подсказок
+        :param threshold: длина диапазона, начиная с которой подсказки узла считаются заранее
+        """
+        self.k = k
+        self.threshold = threshold
+        self.lemmes = sorted(forms, key=lambda lemme: (-frequencies.get(lemme, 0), lemme))
+        self.frequencies = [frequencies.get(lemme, 0) for lemme in self.lemmes]
+
+        pairs = sorted({
+            (normalize_key(word), lemme_id)
+            for lemme_id, lemme in enumerate(self.lemmes) for word in (lemme, *forms[lemme])
+        })
+        self.keys = [key for key, _ in pairs]
+        self.ids = np.array([lemme_id for _, lemme_id in pairs], dtype=np.int32)
+        self.top: dict[str, tuple[int, ...]] = {}
+        self._build(0, len(self.keys), 0)
+
+    def _best(self, low: int, high: int) -> tuple[int, ...]:
+        return tuple(heapq.nsmallest(self.k, set(self.ids[low:high].tolist())))
+
+    def _build(self, low: int, high: int, depth: int):
+        # обход узлов префиксного дерева, у которых диапазон длиннее порога
+        if high - low <= self.threshold:
+            return
+        self.top[self.keys[low][:depth]] = self._best(low, high)
+        # ключи длины depth совпадают с префиксом и стоят в начале диапазона
+        while low < high and len(self.keys[low]) == depth:
+            low += 1
+        while low < high:
+            char = self.keys[low][depth]
+            end = bisect_left(self.keys, self.keys[low][:depth] + char + MAX_CHAR, low, high)
+            self._build(low, end, depth + 1)
+            low = end
+
+    def suggest(self, prefix: str, limit: int = 10) -> list[tuple[str, int]]:
+        """
+        Получить подсказки для префикса
+
+        :param prefix: начало слова
+        :param limit: количество подсказок, не больше `k`
+        :return: список пар лемма, количество документов по убыванию количества документов
+        """
+        prefix = normalize_key(prefix)
+        if (best := self.top.get(prefix)) is None:
+            low = bisect_left(self.keys, prefix)
+            best = self._best(low, bisect_left(self.keys, prefix + MAX_CHAR, low))
+        return [(self.lemmes[lemme_id], self.frequencies[lemme_id]) for lemme_id in best[:limit]]
+
+
+def load_suggester(snapshot: Snapshot, lemmes_path: str | None = None) -> Suggester | None:
+    """
+    Построить подсказки по файлу лемм из переменной окружения LEMMES_PATH и документным частотам снимка
+
+    :param snapshot: снимок сервера
+    :param lemmes_path: путь до файла лемм
+    :return: объект `Suggester` или None, если файла лемм нет
+    """
+    lemmes_path = lemmes_path or os.getenv("LEMMES_PATH")
+    if not lemmes_path or not os.path.isfile(lemmes_path):
+        return None
+    frequencies = dict(zip(snapshot.terms, np.diff(snapshot.matrix.indptr).tolist()))
+    return Suggester(read_forms(lemmes_path), frequencies)
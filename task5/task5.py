@@ -1,18 +1,22 @@
-import math
 import os
-import re
-import zipfile
 from collections import Counter, defaultdict
 from typing import Literal
 
 from pymorphy2 import MorphAnalyzer
-from pymorphy2.analyzer import Parse
+
+from common.documents import DocumentSource, open_documents
+from common.lemmatizer import Lemmatizer, init_lemmatizer, preprocess_text
+from common.stats import CorpusStats
+from common.vocabulary import Vocabulary, init_vocabulary, load_lemmes
+from task4.store import tf_idfs_location
+from task5.compact_vectors import load_compact_vectors
+from task5.snapshot import read_tf_idfs
 
 
 def prevalidate_env_variables():
     assert os.getenv("POSTS_DIR_PATH"), "Укажите путь для папки и архива в переменную окружения POSTS_DIR_PATH"
     assert os.getenv("LEMMES_PATH"), "Укажите путь для файла лемм в переменную окружения LEMMES_PATH"
-    assert os.getenv("TF_IDFS_PATH"), "Укажите путь для папки, в которую поместятся результаты в переменную TF-IDF"
+    assert tf_idfs_location(), "Укажите папку TF-IDF в TF_IDFS_PATH или хранилище в TF_IDF_STORE_PATH"
 
 
 def init_morph() -> MorphAnalyzer:
@@ -23,102 +27,30 @@ def init_morph() -> MorphAnalyzer:
     return MorphAnalyzer()
 
 
-def extract_archive(dir_path: str):
+def get_corpus_stats(documents: DocumentSource, lemmatizer: Lemmatizer) -> CorpusStats:
     """
-    Разархивировать архив.
+    Собрать статистику лемм корпуса, читая документы по одному
 
-    :param dir_path: путь до архива без расширения
+    :param documents: источник документов.
+    :param lemmatizer: объект лемматизатора.
+    :return: статистика корпуса
     """
-    if not os.path.isdir(dir_path):
-        os.mkdir(dir_path)
-    with zipfile.ZipFile(f"{dir_path}.zip", "r") as zip_ref:
-        zip_ref.extractall(dir_path)
-
+    stats = CorpusStats()
+    for name, text in documents:
+        stats.add(name, lemmatizer.lemmatize(preprocess_text(text)))
 
-def preprocess_text(text: str) -> str:
-    """
-    Очистить текст от некириллических символов
-
-    :param text: текст для очистки.
-    :return: очищенный текст.
-    """
-    pattern = re.compile(r"[^А-Яа-я ]")
-    return re.sub(pattern, ' ', text)
+    return stats
 
 
-def get_all_texts(dir_path: str) -> dict[str, str]:
-    """
-    Получить тексты всех документов
-
-    :param dir_path: директория с файлами.
-    :return: список текстов всех документов в этой дериктории
-    """
-
-    texts = {}
-    for file in os.listdir(dir_path):
-        if file.endswith(".txt"):
-            texts[file] = preprocess_text(open(os.path.join(dir_path, file), "r", encoding="utf8").read())
-
-    return texts
-
-
-def normalize(text: str, morph: MorphAnalyzer) -> str:
+def normalize(text: str, lemmatizer: Lemmatizer) -> str:
     """
     Вернуть нормализованный текст.
 
     :param text: текст документа
-    :param morph: объект анализатора
+    :param lemmatizer: объект лемматизатора
     :return: строку нормализованного текста
     """
-    lemmes = list()
-
-    words = text.split()
-    for word in words:
-        token: Parse = morph.parse(word)[0]
-
-        bad = False
-        for bad_grammeme in [
-            "PREP",  # предлог
-            "CONJ",  # союз
-            "NUMB",  # число
-            "NUMR",  # числительное
-            "LATN",  # не кириллица
-            "PNCT",  # пунктуация
-            "ROMN",  # римское число
-            "UNKN",  # неизвестное слово
-        ]:
-            if bad_grammeme in token.tag:
-                bad = True
-                break
-
-        if bad:
-            continue
-
-        lemmes.append(token.normal_form)
-
-    return " ".join(lemmes)
-
-
-def get_words_set_per_doc(docs: list[str]) -> list[set[str]]:
-    """
-    Получить множество слов для каждого документа
-
-    :param docs: список документов
-    :return: список множества слов для каждого документа
-    """
-
-    return [set(doc.split()) for doc in docs]
-
-
-def load_lemmes(lemmes_path: str) -> set[str]:
-    """
-    Загрузить леммы из файла
-
-    :param lemmes_path: путь до файла с леммами.
-    :return: множество лемм
-    """
-    with open(lemmes_path, "r", encoding="utf8") as f:
-        return {line.split()[0] for line in f.readlines()}
+    return " ".join(lemmatizer.lemmatize(text))
 
 
 def load_index(index_path: str) -> dict[str, str]:
@@ -126,48 +58,38 @@ def load_index(index_path: str) -> dict[str, str]:
         return {filename: link for filename, link in (link.split() for link in f.readlines())}
 
 
-def get_tf_idf(text: str, docs: list[set[str]]) -> list[tuple[str, float, int]]:
+def get_tf_idf(text: str, stats: CorpusStats) -> list[tuple[str, float, int]]:
     """
     Получить TF-IDF текста. Предполагается, что `text` это документ
 
     :param text: текст документа, для которого нужно посчитать TF-IDF.
-    :param docs: список множества слов в документах.
+    :param stats: статистика корпуса документов.
     :return: список кортежей, каждый из которых представляет собой: токен, tf, idf.
     """
 
     tokens = text.split()
-    tokens_set = set(tokens)
 
     # подсчет TF
     tfs = Counter(tokens)
 
-    # подсчет IDF
-    token_entries = {token: len([doc for doc in docs if token in doc]) for token in tokens_set}
-    idfs = {token: math.log10(len(docs) / token_entries[token]) if token_entries[token] else 0 for token in tokens_set}
-
-    return [(token, tfs[token] / len(tokens), idfs[token]) for token in tokens_set]
+    return [(token, tf / len(tokens), stats.idf(token)) for token, tf in tfs.items()]
 
 
 def generate_vectors(
-        tf_idfs_path: str, lemmes: list[str],
+        tf_idfs_path: str, vocabulary: Vocabulary,
         prefix: Literal["lemmes", "tokens"] = "lemmes"
 ):
-    tf_idfs = {}
-    for file in os.listdir(tf_idfs_path):
-        if file.startswith(prefix):
-            with open(os.path.join(tf_idfs_path, file), "r", encoding="utf8") as f:
-                key = file.lstrip(prefix)
-                tf_idfs[key] = defaultdict(float)
-                for line in f.readlines():
-                    token, tf, idf = line.split()
-                    tf_idfs[key][lemmes.index(token)] = float(tf) * float(idf)
-
-    return tf_idfs
+    # имя документа - имя файла без префикса: lstrip удалял бы символы префикса, а не сам префикс
+    vectors, _ = read_tf_idfs(tf_idfs_path, prefix)
+    return {
+        doc: defaultdict(float, {vocabulary[token]: weight for token, weight in vector.items()})
+        for doc, vector in vectors.items()
+    }
 
 
 def get_cosine_similarity(vec1: dict[int, float], vec2: dict[int, float]):
     return (
-            sum(value * vec2[key] for key, value in vec1.items()) /
+            sum(value * vec2.get(key, 0.0) for key, value in vec1.items()) /
             (
                     sum(value ** 2 for value in vec1.values()) ** 0.5
                     * sum(value ** 2 for value in vec2.values()) ** 0.5
@@ -179,30 +101,24 @@ if __name__ == '__main__':
     print("Загрузка индексов")
     prevalidate_env_variables()
     dir_path = os.getenv("POSTS_DIR_PATH")
-    morph = init_morph()
+    lemmatizer = init_lemmatizer(init_morph())
 
-    tf_idfs_path = os.getenv("TF_IDFS_PATH")
-
-    lemmes_set = load_lemmes(os.getenv("LEMMES_PATH"))
+    vocabulary = init_vocabulary(load_lemmes(os.getenv("LEMMES_PATH")))
     index = load_index("index.txt")
-    extract_archive(dir_path)
-    texts = get_all_texts(dir_path)
-
-    texts_words = get_words_set_per_doc(list(texts.values()))
-    lemmes = list(lemmes_set)
-    tf_idfs = generate_vectors(os.getenv("TF_IDFS_PATH"), lemmes)
+    # векторы читаются сразу в столбцы без словаря на каждый документ
+    engine = load_compact_vectors(tf_idfs_location(), vocabulary).engine(len(vocabulary))
 
-    normalized_texts = {filename: normalize(text, morph) for filename, text in texts.items()}
-    normalized_texts_words = get_words_set_per_doc(list(normalized_texts.values()))
+    normalized_stats = get_corpus_stats(open_documents(dir_path), lemmatizer)
 
-    while (query := normalize(input("Введите запрос: "), morph)) != "":
+    while (query := normalize(input("Введите запрос: "), lemmatizer)) != "":
         query_tf_idf = {
-            lemmes.index(token): float(tf) * float(idf) for token, tf, idf in get_tf_idf(query, normalized_texts_words)
+            vocabulary[token]: float(tf) * float(idf) for token, tf, idf in get_tf_idf(query, normalized_stats)
+            if token in vocabulary
         }
-        similarities = {doc: get_cosine_similarity(query_tf_idf, tf_idf) for doc, tf_idf in tf_idfs.items()}
-
-        sorted_similarities = list(sorted(similarities.items(), key=lambda s: -s[1]))
-        for i, similarity in enumerate(sorted_similarities[:5]):
+        for i, similarity in enumerate(engine.top_k(query_tf_idf, 5)):
             print(f"{i + 1}. {index[similarity[0]]} (сходство: {similarity[1]})")
 
-        print()
\ No newline at end of file
+        print()
+
+    lemmatizer.save()
+    print(lemmatizer.stats())
\ No newline at end of file
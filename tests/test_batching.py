@@ -0,0 +1,131 @@
+import asyncio
+import importlib
+import random
+import sys
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from task5.batching import QueryBatcher
+from task5.ranking import RankingEngine
+from task5.snapshot import write_snapshot
+
+TERMS = ["кот", "дом", "окно", "двор", "сад", "лес"]
+QUERIES = [{0: 1.0}, {1: 1.0, 2: 1.0}, {0: 0.5, 3: 2.0, 5: 1.0}, {term: 1.0 for term in range(len(TERMS))}]
+
+
+def make_vectors() -> dict[str, dict[str, float]]:
+    vectors = {}
+    for doc in range(30):
+        rnd = random.Random(doc % 7)
+        vectors[f"{doc}.txt"] = {term: rnd.choice([0.5, 1.0, 2.0]) for term in rnd.sample(TERMS, 2)}
+    return vectors
+
+
+class RecordingEngine(RankingEngine):
+    """
+    Движок, запоминающий размеры пачек и ожидающий разрешения перед ранжированием
+    """
+
+    def __init__(self, engine: RankingEngine):
+        super().__init__(engine.docs, engine.matrix, engine.norms)
+        self.calls: list[int] = []
+        self.allowed = threading.Event()
+        self.allowed.set()
+
+    def top_k(self, query: dict[int, float], k: int) -> list[tuple[str, float]]:
+        self.allowed.wait()
+        self.calls.append(1)
+        return super().top_k(query, k)
+
+    def top_k_batch(self, queries: list[dict[int, float]], ks: list[int]) -> list[list[tuple[str, float]]]:
+        self.allowed.wait()
+        self.calls.append(len(queries))
+        return super().top_k_batch(queries, ks)
+
+
+@pytest.fixture
+def engine() -> RecordingEngine:
+    vectors = make_vectors()
+    # идентификаторы терминов как в снимке
+    ids = {term: term_id for term_id, term in enumerate(sorted(TERMS))}
+    return RecordingEngine(RankingEngine.from_vectors(
+        {doc: {ids[term]: weight for term, weight in vector.items()} for doc, vector in vectors.items()}, len(TERMS)
+    ))
+
+
+def test_concurrent_queries_share_batch(engine):
+    batcher = QueryBatcher(engine, window=0.05)
+
+    async def run():
+        results = await asyncio.gather(*(batcher.search(query, 5) for query in QUERIES))
+        await batcher.stop()
+        return results
+
+    for query, results in zip(QUERIES, asyncio.run(run())):
+        assert results == engine.top_k(query, 5)
+    assert engine.calls[0] == len(QUERIES)
+    assert batcher.batches == 1 and batcher.queries == len(QUERIES)
+
+
+def test_single_query_uses_max_score(engine):
+    batcher = QueryBatcher(engine, window=0)
+
+    async def run():
+        results = [await batcher.search(query, 3) for query in QUERIES]
+        await batcher.stop()
+        return results
+
+    assert asyncio.run(run()) == [engine.top_k(query, 3) for query in QUERIES]
+    # последовательные запросы не ждут друг друга и ранжируются по одному
+    assert engine.calls[:len(QUERIES)] == [1] * len(QUERIES)
+
+
+def test_stop_drains_pending_queries(engine):
+    batcher = QueryBatcher(engine, window=0.2)
+
+    async def run():
+        tasks = [asyncio.create_task(batcher.search(query, 4)) for query in QUERIES]
+        await asyncio.sleep(0)
+        await batcher.stop()
+        assert batcher.worker is None
+        assert all(task.done() for task in tasks)
+        return [task.result() for task in tasks]
+
+    assert asyncio.run(run()) == [engine.top_k(query, 4) for query in QUERIES]
+
+
+def test_queue_full_returns_503(engine, tmp_path, monkeypatch):
+    path = str(tmp_path / "snapshot.bin")
+    vectors = make_vectors()
+    write_snapshot(path, vectors, {term: 1.0 for term in TERMS}, {doc: f"url/{doc}" for doc in vectors})
+    for name in ["SEGMENTS_PATH", "SHARDS_PATH", "BM25_PATH", "NEIGHBOURS_PATH", "LEMMES_PATH", "LEMMA_CACHE_PATH"]:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("SNAPSHOT_PATH", path)
+    # сервер загружает индексы при импорте
+    sys.modules.pop("task5.server", None)
+    server = importlib.import_module("task5.server")
+    try:
+        engine.allowed.clear()
+        batcher = server.batcher = QueryBatcher(engine, window=0, max_queue=1)
+
+        async def run():
+            # первый запрос ранжируется и ждет движок, второй занимает единственное место в очереди
+            first = asyncio.create_task(server.rank(["кот"], 5))
+            while batcher.queue is None or not batcher.queue.empty():
+                await asyncio.sleep(0.01)
+            second = asyncio.create_task(server.rank(["дом"], 5))
+            await asyncio.sleep(0)
+            with pytest.raises(HTTPException) as error:
+                await server.rank(["окно"], 5)
+            engine.allowed.set()
+            results = await asyncio.gather(first, second)
+            await batcher.stop()
+            return error.value, results
+
+        error, results = asyncio.run(run())
+        assert error.status_code == 503
+        assert all(results)
+    finally:
+        sys.modules.pop("task5.server", None)
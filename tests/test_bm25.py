@@ -0,0 +1,56 @@
+import os
+from collections import Counter
+
+import pytest
+
+from common.stats import CorpusStats
+from task4.store import write_lengths, write_store
+from task4.task4 import tf_idf_from_counts, write_tf_idf
+from task5.bm25 import build_bm25, impacts, write_bm25
+
+# у первых двух документов TF [0.5, 0.5] и [2/6, 4/6], по ним длина 4 и 6 не восстанавливается
+TEXTS = {
+    "1.txt": "кот кот пес пес",
+    "2.txt": "кот кот пес пес пес пес",
+    "3.txt": "пес двор",
+    "4.txt": "",
+}
+
+
+@pytest.fixture
+def tf_idf_rows() -> dict:
+    stats = CorpusStats.from_texts(TEXTS)
+    return {doc: tf_idf_from_counts(Counter(text.split()), stats) for doc, text in TEXTS.items()}, stats.lengths
+
+
+def expected_bm25(path: str):
+    counts = {doc: Counter(text.split()) for doc, text in TEXTS.items() if text}
+    lengths = {doc: len(TEXTS[doc].split()) for doc in counts}
+    write_bm25(path, impacts(counts, lengths), sorted(TEXTS))
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_build_from_text_folder_uses_true_lengths(tmp_path, tf_idf_rows):
+    rows, lengths = tf_idf_rows
+    tf_idfs_path = tmp_path / "tf_idf"
+    tf_idfs_path.mkdir()
+    for doc, doc_rows in rows.items():
+        write_tf_idf(os.path.join(tf_idfs_path, f"lemmes{doc}"), doc_rows)
+    write_lengths(str(tf_idfs_path), "lemmes", lengths)
+
+    build_bm25(str(tf_idfs_path), str(tmp_path / "bm25.bin"))
+    expected_bm25(str(tmp_path / "expected.bin"))
+    assert read(tmp_path / "bm25.bin") == read(tmp_path / "expected.bin")
+
+
+def test_build_from_store_uses_true_lengths(tmp_path, tf_idf_rows):
+    rows, lengths = tf_idf_rows
+    write_store(str(tmp_path / "tf_idf.bin"), sorted(TEXTS), {"lemmes": rows}, {"lemmes": lengths})
+
+    build_bm25(str(tmp_path / "tf_idf.bin"), str(tmp_path / "bm25.bin"))
+    expected_bm25(str(tmp_path / "expected.bin"))
+    assert read(tmp_path / "bm25.bin") == read(tmp_path / "expected.bin")
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+import uvicorn
+from httpx import AsyncClient
+
+from task1 import fake_vk
+from task1.crawler import WallCrawler
+
+OWNER_ID = "-1"
+
+
+@pytest.fixture(scope="module")
+def vk_url():
+    server = uvicorn.Server(uvicorn.Config(fake_vk.app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/method/"
+    server.should_exit = True
+    thread.join()
+
+
+@pytest.fixture(autouse=True)
+def reset_stats(monkeypatch):
+    monkeypatch.delenv("FAKE_VK_ERROR_RATE", raising=False)
+    monkeypatch.delenv("FAKE_VK_POSTS", raising=False)
+    fake_vk.stats.clear()
+
+
+def crawl(vk_url: str, dir_path: str, **kwargs) -> int:
+    async def run() -> int:
+        async with AsyncClient(base_url=vk_url, params={"access_token": "fake", "v": "5.131"}) as client:
+            crawler = WallCrawler(
+                client, OWNER_ID, dir_path, index_path=f"{dir_path}.index.txt", rate=1000, backoff=0.001, **kwargs
+            )
+            return await crawler.run()
+
+    return asyncio.run(run())
+
+
+def read_index(dir_path: str) -> list[str]:
+    with open(f"{dir_path}.index.txt", "r", encoding="utf8") as f:
+        return f.read().splitlines()
+
+
+def expected_index(count: int) -> list[str]:
+    posts = [fake_vk.make_post(int(OWNER_ID), number) for number in range(int(os.getenv("FAKE_VK_POSTS") or 1000))]
+    return [
+        f"{post['id']}.txt\thttps://vk.com/wall{OWNER_ID}_{post['id']}" for post in posts if len(post["text"]) >= 1000
+    ][:count]
+
+
+def test_crawl_batches_calls_in_execute(vk_url, tmp_path):
+    dir_path = str(tmp_path / "posts")
+    assert crawl(vk_url, dir_path, count=300, calls_per_request=2) == 300
+
+    assert read_index(dir_path) == expected_index(300)
+    assert len(os.listdir(dir_path)) == 300
+    assert not os.path.exists(f"{dir_path}.checkpoint.json")
+    # каждый execute содержит два вызова wall.get
+    assert fake_vk.stats["wall_get"] == 2 * fake_vk.stats["requests"]
+
+
+def test_crawl_stops_at_end_of_wall(vk_url, tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_VK_POSTS", "250")
+    dir_path = str(tmp_path / "posts")
+    assert crawl(vk_url, dir_path, count=1000, calls_per_request=1) == len(expected_index(1000))
+    assert read_index(dir_path) == expected_index(1000)
+
+
+def test_crawl_retries_rate_limit_errors(vk_url, tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_VK_ERROR_RATE", "0.5")
+    dir_path = str(tmp_path / "posts")
+    assert crawl(vk_url, dir_path, count=300, calls_per_request=2) == 300
+
+    assert fake_vk.stats["errors"] > 0
+    assert read_index(dir_path) == expected_index(300)
+
+
+def test_crawl_raises_after_max_retries(vk_url, tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_VK_ERROR_RATE", "1")
+    with pytest.raises(Exception, match="error 6"):
+        crawl(vk_url, str(tmp_path / "posts"), count=10, max_retries=2)
+
+
+def test_crawl_resumes_from_checkpoint(vk_url, tmp_path):
+    dir_path = str(tmp_path / "posts")
+    batches = []
+
+    def fail_on_second_batch(posts: list[tuple[str, str, str]]):
+        if batches:
+            raise RuntimeError("crash")
+        batches.append(posts)
+
+    # падение после записи постов второй пачки, но до ее контрольной точки
+    with pytest.raises(RuntimeError, match="crash"):
+        crawl(vk_url, dir_path, count=300, calls_per_request=1, max_in_flight=1, on_batch=fail_on_second_batch)
+    assert os.path.exists(f"{dir_path}.checkpoint.json")
+    assert len(read_index(dir_path)) > len(batches[0])
+
+    fake_vk.stats.clear()
+    resumed = []
+    assert crawl(vk_url, dir_path, count=300, calls_per_request=1, max_in_flight=1, on_batch=resumed.extend) == 300
+
+    assert read_index(dir_path) == expected_index(300)
+    assert len(os.listdir(dir_path)) == 300
+    # продолжение начинается со второй пачки: посты первой не запрашиваются и не обрабатываются повторно
+    assert [name for name, _, _ in batches[0] + resumed] == [line.split("\t")[0] for line in expected_index(300)]
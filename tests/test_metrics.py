@@ -0,0 +1,51 @@
+import pickle
+import threading
+
+from common.documents import DirectoryDocuments
+from common.metrics import Metrics, metrics
+
+
+def test_counters_are_thread_safe():
+    registry = Metrics()
+
+    def work():
+        for _ in range(20_000):
+            registry.inc("events")
+            registry.observe("seconds", 0.001)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert registry.counters["events"][()] == 160_000
+    assert registry.histograms["seconds"][()].count == 160_000
+
+
+def test_collector_types():
+    registry = Metrics()
+    registry.collect(lambda: {"cache_hits": 3}, "counter")
+    registry.collect(lambda: {"cache_entries": 2})
+    lines = registry.render().splitlines()
+    assert "# TYPE infosearch_cache_hits_total counter" in lines
+    assert "infosearch_cache_hits_total 3" in lines
+    assert "# TYPE infosearch_cache_entries gauge" in lines
+    assert "infosearch_cache_entries 2" in lines
+
+
+def test_registry_pickles_without_collectors():
+    registry = Metrics()
+    registry.inc("events", 2)
+    registry.collect(lambda: {"cache_hits": 3}, "counter")
+    copy = pickle.loads(pickle.dumps(registry))
+    copy.inc("events")
+    assert copy.counters["events"][()] == 3
+    assert copy.collectors == []
+
+
+def test_read_stage_is_observed_once(tmp_path):
+    for number in range(5):
+        (tmp_path / f"{number}.txt").write_text("текст", encoding="utf8")
+    metrics.reset()
+    assert len(list(DirectoryDocuments(str(tmp_path)))) == 5
+    assert metrics.histograms["stage_seconds"][(("stage", "read"),)].count == 1
@@ -0,0 +1,15 @@
+import pytest
+
+from task5.neighbours import compute_neighbours, normalized_matrix
+
+
+def test_neighbours_break_ties_by_document():
+    # у первого документа пять соседей с одинаковым сходством
+    vectors = {"0.txt": {"кот": 1.0}}
+    vectors.update({f"{doc}.txt": {"кот": 1.0, "пес": 1.0} for doc in range(1, 6)})
+    matrix = normalized_matrix(vectors)
+    for block_size in (1, 2, 6):
+        ids, scores = compute_neighbours(matrix, k=2, block_size=block_size)
+        assert ids[0].tolist() == [1, 2]
+        assert ids[1].tolist() == [2, 3]
+        assert scores[1].tolist() == pytest.approx([1.0, 1.0])
@@ -0,0 +1,89 @@
+import filecmp
+import os
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+from benchmarks.corpus import generate_corpus
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# слова, которые очистка разбивает на части или удаляет
+EXTRA_TEXTS = {
+    "1001.txt": "Из-за дождя,ветра и т.д. встреча 2023 года перенесена: см. vk.com/wall-1 и Ёлки-палки!",
+    "1002.txt": "Кот сидел на окне.Пес спал во дворе.Кот смотрел на пса,а пес на кота",
+}
+
+ARTIFACTS = ["r_index.txt", "r_index.bin", "r_index.pos", "snapshot.bin", "bm25.bin"]
+
+
+@pytest.fixture(scope="module")
+def corpus_path(tmp_path_factory) -> str:
+    dir_path = str(tmp_path_factory.mktemp("corpus"))
+    posts_path = generate_corpus(60, dir_path, vocabulary_size=300)
+    with zipfile.ZipFile(f"{posts_path}.zip", "a") as archive, \
+            open(os.path.join(dir_path, "index.txt"), "a", encoding="utf8") as index:
+        for name, text in EXTRA_TEXTS.items():
+            archive.writestr(name, text)
+            index.write(f"{name}\thttps://vk.com/wall-1_{name.removesuffix('.txt')}\n")
+    return posts_path
+
+
+def run(module: str, corpus_path: str, out_path: str, store: bool):
+    """
+    Запустить скрипт сборки в директории корпуса с артефактами в `out_path`
+    """
+    env = {key: value for key, value in os.environ.items() if not key.endswith("_PATH")}
+    env.update(
+        PYTHONPATH=os.pathsep.join(filter(None, [os.getenv("PYTHONPATH"), ROOT])),
+        POSTS_DIR_PATH=corpus_path,
+        TOKENS_PATH=os.path.join(out_path, "tokens.txt"),
+        LEMMES_PATH=os.path.join(out_path, "lemmes.txt"),
+        VOCABULARY_PATH=os.path.join(out_path, "vocabulary.txt"),
+        INDEX_PATH=os.path.join(out_path, "r_index.txt"),
+        BINARY_INDEX_PATH=os.path.join(out_path, "r_index.bin"),
+        POSITIONS_PATH=os.path.join(out_path, "r_index.pos"),
+        SNAPSHOT_PATH=os.path.join(out_path, "snapshot.bin"),
+        BM25_PATH=os.path.join(out_path, "bm25.bin"),
+        BUILD_WORKERS="1",
+    )
+    if store:
+        env["TF_IDF_STORE_PATH"] = os.path.join(out_path, "tf_idf.bin")
+    else:
+        env["TF_IDFS_PATH"] = os.path.join(out_path, "tf_idf")
+    subprocess.run(
+        [sys.executable, "-m", module], cwd=os.path.dirname(corpus_path), env=env, check=True, capture_output=True
+    )
+
+
+def read_lemmes(path: str) -> dict[str, set[str]]:
+    # словоформы леммы хранятся множеством, их порядок зависит от хэшей строк процесса
+    with open(path, "r", encoding="utf8") as f:
+        return {lemme: set(words) for lemme, *words in map(str.split, f)}
+
+
+@pytest.mark.parametrize("store", [False, True], ids=["tf_idf_dir", "tf_idf_store"])
+def test_pipeline_matches_scripts(corpus_path, tmp_path, store):
+    scripts_path, pipeline_path = tmp_path / "scripts", tmp_path / "pipeline"
+    scripts_path.mkdir()
+    pipeline_path.mkdir()
+    for module in ["task2.task2", "task3.task3", "task4.task4", "task5.snapshot", "task5.bm25"]:
+        run(module, corpus_path, str(scripts_path), store)
+    run("pipeline.build", corpus_path, str(pipeline_path), store)
+
+    assert read_lemmes(scripts_path / "lemmes.txt") == read_lemmes(pipeline_path / "lemmes.txt")
+    with open(scripts_path / "tokens.txt", "r", encoding="utf8") as scripts, \
+            open(pipeline_path / "tokens.txt", "r", encoding="utf8") as pipeline:
+        assert sorted(scripts.read().split()) == sorted(pipeline.read().split())
+    for name in ARTIFACTS + (["tf_idf.bin"] if store else []):
+        assert filecmp.cmp(scripts_path / name, pipeline_path / name, shallow=False), name
+    if not store:
+        comparison = filecmp.dircmp(scripts_path / "tf_idf", pipeline_path / "tf_idf")
+        assert comparison.left_list == comparison.right_list
+        assert len(comparison.left_list) == 2 * (60 + len(EXTRA_TEXTS)) + 2
+        _, mismatch, errors = filecmp.cmpfiles(
+            scripts_path / "tf_idf", pipeline_path / "tf_idf", comparison.left_list, shallow=False
+        )
+        assert not mismatch and not errors
@@ -0,0 +1,22 @@
+from task3.positional_index import PositionalIndex, document_positions, merge_positions, write_positional_index
+
+
+def test_positions_round_trip(tmp_path):
+    documents = {
+        "1.txt": ["кот"] * 200 + ["пес", "кот"],
+        "2.txt": ["пес", "двор", "пес"],
+        "3.txt": ["двор"] + ["дом"] * 1000,
+    }
+    # шарды по одному документу объединяются в порядке шардов
+    positions = merge_positions([
+        {lemme: {doc: doc_positions} for lemme, doc_positions in document_positions(lemmes).items()}
+        for doc, lemmes in documents.items()
+    ])
+    write_positional_index(str(tmp_path / "index.pos"), positions)
+
+    index = PositionalIndex(str(tmp_path / "index.pos"))
+    for doc, lemmes in documents.items():
+        for lemme, doc_positions in document_positions(lemmes).items():
+            assert index.term(lemme).positions(index.doc_id(doc)) == doc_positions
+    assert index.term("дом").positions(index.doc_id("1.txt")) == []
+    assert index.term("кошка") is None
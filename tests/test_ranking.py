@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+from task5.ranking import RankingEngine
+
+TERMS_COUNT = 6
+
+
+@pytest.fixture(scope="module")
+def engine() -> RankingEngine:
+    vectors = {}
+    for doc in range(40):
+        # векторы повторяются, поэтому у запросов есть равные сходства на границе k
+        rnd = random.Random(doc % 8)
+        vectors[f"{doc}.txt"] = {term: rnd.choice([0.5, 1.0, 2.0]) for term in rnd.sample(range(TERMS_COUNT), 2)}
+    return RankingEngine.from_vectors(vectors, TERMS_COUNT)
+
+
+QUERIES = [{0: 1.0}, {1: 1.0, 2: 1.0}, {0: 0.5, 3: 2.0, 5: 1.0}, {term: 1.0 for term in range(TERMS_COUNT)}]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_top_matches_top_k_with_ties(engine, query):
+    for k in range(1, len(engine.docs) + 1):
+        expected = engine.top_k(query, k)
+        top = [(doc, similarity) for doc, similarity in engine.top(query, k) if similarity > 0]
+        assert [doc for doc, _ in top] == [doc for doc, _ in expected]
+        assert [similarity for _, similarity in top] == pytest.approx([similarity for _, similarity in expected])
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_top_is_prefix_of_full_ranking(engine, query):
+    ranking = engine.top(query)
+    assert len({similarity for _, similarity in ranking}) < len(ranking)
+    for k in range(1, len(engine.docs) + 1):
+        assert engine.top(query, k) == ranking[:k]
+
+
+def test_top_k_batch_matches_top_k_with_ties(engine):
+    for k in range(1, len(engine.docs) + 1):
+        batch = engine.top_k_batch(QUERIES, [k] * len(QUERIES))
+        for query, results in zip(QUERIES, batch):
+            expected = engine.top_k(query, k)
+            assert [doc for doc, _ in results] == [doc for doc, _ in expected]
+            assert [similarity for _, similarity in results] == pytest.approx([similarity for _, similarity in expected])
@@ -0,0 +1,107 @@
+import math
+from collections import Counter
+
+import pytest
+
+from common.segments import SegmentIndex
+from common.stats import CorpusStats
+from task5.snapshot import Snapshot, write_snapshot
+
+TEXTS = {
+    "1.txt": "кот сидеть окно кот",
+    "2.txt": "пес сидеть двор",
+    "3.txt": "кот пес двор двор",
+    "4.txt": "окно дом",
+    "5.txt": "дом кот",
+}
+
+
+class SplitLemmatizer:
+    """
+    Тексты в тестах уже состоят из лемм
+    """
+
+    def lemmatize(self, text: str) -> list[str]:
+        return text.split()
+
+
+def add(index: SegmentIndex, names: list[str]) -> int:
+    return index.add_documents([(name, TEXTS[name], f"url/{name}") for name in names], SplitLemmatizer())
+
+
+def cosine(query: list[str], texts: dict[str, str]) -> list[tuple[str, float]]:
+    stats = CorpusStats.from_texts(texts)
+
+    def vector(lemmes: list[str]) -> dict[str, float]:
+        return {lemme: count / len(lemmes) * stats.idf(lemme) for lemme, count in Counter(lemmes).items()}
+
+    query_vector = vector(query)
+    query_norm = math.sqrt(sum(value ** 2 for value in query_vector.values()))
+    results = []
+    for doc, text in texts.items():
+        doc_vector = vector(text.split())
+        dot = sum(value * doc_vector.get(lemme, 0) for lemme, value in query_vector.items())
+        if dot:
+            results.append((doc, dot / query_norm / math.sqrt(sum(value ** 2 for value in doc_vector.values()))))
+    return sorted(results, key=lambda result: -result[1])
+
+
+def assert_cosine(index: SegmentIndex, query: list[str], k: int = 10):
+    results, expected = index.search(index.query_weights(query), k), cosine(query, TEXTS)[:k]
+    assert [doc for doc, _ in results] == [doc for doc, _ in expected]
+    assert [similarity for _, similarity in results] == pytest.approx([similarity for _, similarity in expected])
+
+
+@pytest.mark.parametrize("query", [["кот"], ["пес", "двор"], ["кот", "окно", "нет"], ["дом", "кот", "кот"]])
+def test_search_matches_cosine_over_all_segments(tmp_path, query):
+    index = SegmentIndex(str(tmp_path), background=False)
+    # все документы в одном сегменте
+    add(index, list(TEXTS))
+    assert_cosine(index, query)
+
+
+def test_search_merges_segments(tmp_path):
+    index = SegmentIndex(str(tmp_path), merge_factor=10, background=False)
+    for name in ["1.txt", "2.txt", "3.txt"]:
+        add(index, [name])
+    norms = {segment.file: segment.engine.norms.copy() for segment in index.segments}
+    add(index, ["4.txt", "5.txt"])
+    assert len(index.segments) == 4
+    # новый сегмент меняет глобальную статистику, нормы загруженных сегментов пересчитываются
+    assert any((segment.engine.norms != norms[segment.file]).any() for segment in index.segments[:3])
+    assert_cosine(index, ["кот"])
+    assert_cosine(index, ["кот"], 2)
+    assert_cosine(index, ["пес", "дом", "дом"])
+
+    index.merge_factor = 4
+    assert index.merge() == 1
+    assert len(index.segments) == 1
+    assert_cosine(index, ["кот", "дом"])
+
+
+def test_refresh_compares_generation(tmp_path):
+    writer = SegmentIndex(str(tmp_path), background=False)
+    reader = SegmentIndex(str(tmp_path), background=False)
+    add(writer, ["1.txt", "2.txt"])
+
+    assert reader.refresh()
+    assert not reader.refresh()
+    assert reader.generation == writer.generation
+    assert "1.txt" in reader and reader.url("2.txt") == "url/2.txt"
+
+
+def test_segments_hold_only_new_documents(tmp_path):
+    base_texts = {name: TEXTS[name] for name in ["1.txt", "2.txt", "3.txt"]}
+    stats = CorpusStats.from_texts(base_texts)
+    vectors = {
+        doc: {lemme: count / len(text.split()) * stats.idf(lemme) for lemme, count in Counter(text.split()).items()}
+        for doc, text in base_texts.items()
+    }
+    write_snapshot(str(tmp_path / "snapshot.bin"), vectors, {lemme: stats.idf(lemme) for lemme in stats.df}, {})
+    index = SegmentIndex(str(tmp_path / "segments"), base=Snapshot(str(tmp_path / "snapshot.bin")), background=False)
+
+    # документные частоты снимка восстанавливаются по IDF
+    assert index.base_df == dict(stats.df)
+    assert add(index, list(TEXTS)) == 2
+    assert len(index) == 2
+    assert index.idf("кот") == pytest.approx(CorpusStats.from_texts(TEXTS).idf("кот"))
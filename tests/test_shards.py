@@ -0,0 +1,79 @@
+import asyncio
+import importlib
+import os
+import random
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+from task5.shards import ShardCoordinator, ShardError, start_workers, stop_workers, write_shards
+from task5.snapshot import Snapshot, write_snapshot
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TERMS = ["кот", "дом", "окно", "двор", "сад", "лес"]
+QUERIES = [["кот"], ["дом", "окно"], ["кот", "сад", "сад", "лес"], TERMS]
+
+
+@pytest.fixture(scope="module")
+def snapshot_path(tmp_path_factory) -> str:
+    vectors = {}
+    for doc in range(30):
+        # векторы повторяются, поэтому у запросов есть равные сходства на границе k и на границах шардов
+        rnd = random.Random(doc % 7)
+        vectors[f"{doc}.txt"] = {term: rnd.choice([0.5, 1.0, 2.0]) for term in rnd.sample(TERMS, 2)}
+    path = str(tmp_path_factory.mktemp("snapshot") / "snapshot.bin")
+    write_snapshot(path, vectors, {term: 1.0 for term in TERMS}, {doc: f"url/{doc}" for doc in vectors})
+    return path
+
+
+@pytest.fixture
+def shards_path(snapshot_path, tmp_path, monkeypatch) -> str:
+    # процессы шардов запускаются как python -m task5.shards
+    monkeypatch.setenv("PYTHONPATH", os.pathsep.join(filter(None, [os.getenv("PYTHONPATH"), ROOT])))
+    path = str(tmp_path / "shards")
+    write_shards(Snapshot(snapshot_path), path, 3)
+    return path
+
+
+@pytest.fixture
+def workers(shards_path):
+    processes = start_workers(shards_path)
+    yield processes
+    stop_workers(processes)
+
+
+def test_coordinator_matches_single_process(snapshot_path, shards_path, workers):
+    snapshot = Snapshot(snapshot_path)
+    engine, coordinator = snapshot.engine(), ShardCoordinator(shards_path)
+    assert len(coordinator) == 3
+    for lemmes in QUERIES:
+        query = snapshot.query_vector(lemmes)
+        for k in range(1, len(snapshot.docs) + 1):
+            results, expected = asyncio.run(coordinator.search(query, k)), engine.top_k(query, k)
+            assert [doc for doc, _ in results] == [doc for doc, _ in expected]
+            assert [similarity for _, similarity in results] == pytest.approx([similarity for _, similarity in expected])
+
+
+def test_dead_worker_returns_503(snapshot_path, shards_path, workers, monkeypatch):
+    stop_workers(workers[1:2])
+    with pytest.raises(ShardError, match="Шард 1"):
+        asyncio.run(ShardCoordinator(shards_path, timeout=1).search(Snapshot(snapshot_path).query_vector(["кот"]), 5))
+
+    for name in ["SEGMENTS_PATH", "BM25_PATH", "NEIGHBOURS_PATH", "LEMMES_PATH", "LEMMA_CACHE_PATH"]:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("SNAPSHOT_PATH", snapshot_path)
+    monkeypatch.setenv("SHARDS_PATH", shards_path)
+    # сервер загружает индексы при импорте
+    sys.modules.pop("task5.server", None)
+    server = importlib.import_module("task5.server")
+    try:
+        # процесс координатора не строит движок по матрице снимка
+        assert server.batcher is None
+        with TestClient(server.app) as client:
+            response = client.get("/search/", params={"query": "кот"})
+        assert response.status_code == 503
+        assert response.json()["detail"] == "Шард индекса недоступен, повторите запрос позже"
+    finally:
+        sys.modules.pop("task5.server", None)
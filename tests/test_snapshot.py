@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from task5.ranking import RankingEngine
+from task5.snapshot import Snapshot, write_snapshot
+
+VECTORS = {
+    "1.txt": {"кот": 0.5, "окно": 0.25},
+    "2.txt": {"пес": 0.3, "двор": 0.6},
+    "3.txt": {"кот": 0.1, "пес": 0.2, "двор": 0.7},
+    "4.txt": {"дом": 1.0},
+}
+IDFS = {"кот": 0.3, "окно": 0.6, "пес": 0.3, "двор": 0.3, "дом": 0.6}
+
+
+@pytest.fixture
+def snapshot(tmp_path) -> Snapshot:
+    path = str(tmp_path / "snapshot.bin")
+    write_snapshot(path, VECTORS, IDFS, {doc: f"url/{doc}" for doc in VECTORS})
+    return Snapshot(path)
+
+
+def test_matrix_is_mapped_without_copies(snapshot):
+    buffer = np.frombuffer(snapshot.mm, dtype=np.uint8)
+    for array in (snapshot.matrix.data, snapshot.matrix.indices, snapshot.matrix.indptr):
+        assert np.shares_memory(array, buffer)
+    assert snapshot.matrix.indices.dtype == np.int32
+
+
+def test_engine_matches_vectors(snapshot):
+    ids = snapshot.ids
+    expected = RankingEngine.from_vectors(
+        {doc: {ids[term]: weight for term, weight in vector.items()} for doc, vector in VECTORS.items()}, len(ids)
+    )
+    query = snapshot.query_vector(["кот", "двор", "двор"])
+    assert snapshot.engine().top_k(query, 3) == pytest.approx(expected.top_k(query, 3))
+    assert snapshot.urls["3.txt"] == "url/3.txt"
@@ -0,0 +1,59 @@
+import os
+from collections import Counter
+
+import pytest
+
+from common.stats import CorpusStats
+from task4.store import PREFIXES, TfIdfStore, convert, read_lengths, read_text_rows, write_lengths
+from task4.task4 import tf_idf_from_counts, write_tf_idf
+from task5.bm25 import build_bm25
+from task5.snapshot import read_tf_idfs
+
+TEXTS = {
+    "1.txt": "кот кот пес пес",
+    "2.txt": "пес двор окно",
+    "3.txt": "",
+}
+
+
+def write_folder(tf_idfs_path: str, lengths: bool):
+    """
+    Записать текстовую папку task4, без файлов длин - как до их появления
+    """
+    os.makedirs(tf_idfs_path)
+    stats = CorpusStats.from_texts(TEXTS)
+    for prefix in PREFIXES:
+        for doc, text in TEXTS.items():
+            write_tf_idf(os.path.join(tf_idfs_path, prefix + doc), tf_idf_from_counts(Counter(text.split()), stats))
+        if lengths:
+            write_lengths(tf_idfs_path, prefix, stats.lengths)
+
+
+@pytest.mark.parametrize("lengths", [True, False], ids=["with_lengths", "without_lengths"])
+def test_convert_keeps_rows(tmp_path, lengths):
+    tf_idfs_path, store_path = str(tmp_path / "tf_idf"), str(tmp_path / "tf_idf.bin")
+    write_folder(tf_idfs_path, lengths)
+    assert convert(tf_idfs_path, store_path) == len(TEXTS)
+
+    store = TfIdfStore(store_path)
+    assert store.docs == sorted(TEXTS)
+    for prefix in PREFIXES:
+        vectors, idfs = read_tf_idfs(tf_idfs_path, prefix)
+        store_vectors, store_idfs = store.tf_idfs(prefix)
+        assert list(store_vectors) == list(vectors)
+        for doc, vector in vectors.items():
+            assert store_vectors[doc] == pytest.approx(vector, rel=1e-6)
+        assert store_idfs == pytest.approx(idfs, rel=1e-6)
+        assert sum(map(len, read_text_rows(tf_idfs_path, prefix).values())) == store.descriptions[prefix]["nnz"]
+        assert read_lengths(store_path, prefix) == read_lengths(tf_idfs_path, prefix)
+    assert read_lengths(store_path) == ({doc: len(text.split()) for doc, text in TEXTS.items()} if lengths else None)
+
+
+def test_bm25_requires_lengths(tmp_path):
+    tf_idfs_path, store_path = str(tmp_path / "tf_idf"), str(tmp_path / "tf_idf.bin")
+    write_folder(tf_idfs_path, lengths=False)
+    convert(tf_idfs_path, store_path)
+    for path in (tf_idfs_path, store_path):
+        with pytest.raises(AssertionError, match="нет длин документов"):
+            build_bm25(path, str(tmp_path / "bm25.bin"))
+    assert not os.path.exists(tmp_path / "bm25.bin")